@@ -1,10 +1,36 @@
 # Flask Backend for Inventory Management System
+import atexit
+import base64
+import csv
+import fcntl
+import functools
+import hashlib
+import io
+import itertools
+import json
 import logging
+import math
 import os
-from datetime import datetime
-
+import queue
+import random
+import select
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from logging.handlers import QueueHandler, QueueListener
+
+import click
 from dotenv import load_dotenv
-from flask import Flask, jsonify, request
+from flask import (
+    Flask,
+    Response,
+    has_request_context,
+    jsonify,
+    make_response,
+    request,
+    stream_with_context,
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -12,32 +38,138 @@ from flask_sqlalchemy import SQLAlchemy
 
 load_dotenv()
 import re
+import threading
 import time
 
 # Prometheus monitoring imports
 from prometheus_client import (
     CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
     Counter,
     Gauge,
     Histogram,
     generate_latest,
+    multiprocess,
 )
-from sqlalchemy import func
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import Table, and_, cast, column
+from sqlalchemy import event as sa_event
+from sqlalchemy import func, literal, or_, text, true, union_all, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+import migrate
+
+# Registers the mmap:// and postgresql:// rate limit storage schemes
+import ratelimit_storage  # noqa: F401
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 
-# Configure rate limiting
+# Configure rate limiting. The default in-memory storage is per process; use
+# mmap:// to share counters between the gunicorn workers of a pod, or
+# postgresql:// to share them across pods (see ratelimit_storage.py).
+DEFAULT_RATE_LIMITS = ["200 per day", "50 per hour"]
 limiter = Limiter(
-    app=app, key_func=get_remote_address, default_limits=["200 per day", "50 per hour"]
+    app=app,
+    key_func=get_remote_address,
+    default_limits=DEFAULT_RATE_LIMITS,
+    storage_uri=os.getenv("RATELIMIT_STORAGE_URI", "memory://"),
+    strategy=os.getenv("RATELIMIT_STRATEGY", "fixed-window"),
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Configure logging. Records are formatted by the calling thread and handed
+# to a queue; one listener thread per process writes them to stderr, so a
+# slow log sink never blocks a request. LOG_FORMAT=json emits one JSON
+# object per line, carrying the request id of the request that logged it.
+LOG_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# Attributes every LogRecord has; anything else was passed as ``extra``
+LOG_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one line of JSON, including its ``extra`` fields"""
+
+    def format(self, record):
+        payload = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if has_request_context() and hasattr(request, "request_id"):
+            payload["request_id"] = request.request_id
+        for key, value in vars(record).items():
+            if key not in LOG_RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(log_format):
+    """Route the root logger through a queue; return the started listener"""
+    if log_format not in ("text", "json"):
+        raise ValueError("LOG_FORMAT must be text or json")
+    log_queue = queue.Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(
+        JsonFormatter() if log_format == "json" else logging.Formatter(LOG_TEXT_FORMAT)
+    )
+    # The record arrives formatted; the listener only writes it out
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+LOG_LISTENER = configure_logging(os.getenv("LOG_FORMAT", "text"))
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger(f"{__name__}.access")
+# Fraction of successful (< 400) requests given an access-log record;
+# errors are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+def log_access(
+    request_id, method, path, endpoint, status, latency, db_time=None, db_queries=None
+):
+    """Write the access-log record for one request, subject to sampling"""
+    if status < 400 and random.random() >= ACCESS_LOG_SAMPLE_RATE:
+        return
+    access_logger.info(
+        "%s %s %s %.1fms request_id=%s",
+        method,
+        path,
+        status,
+        latency * 1000,
+        request_id,
+        extra={
+            "request_id": request_id,
+            "method": method,
+            "path": path,
+            "endpoint": endpoint,
+            "status": status,
+            "latency_ms": round(latency * 1000, 2),
+            "db_ms": None if db_time is None else round(db_time * 1000, 2),
+            "db_queries": db_queries,
+        },
+    )
+
+
+def new_request_id(header_value):
+    """The caller's request id if it looks sane, else a fresh one"""
+    if header_value and len(header_value) <= 128 and header_value.isprintable():
+        return header_value
+    return uuid.uuid4().hex
 
 
 # Input validation functions
@@ -66,7 +198,221 @@ def validate_stock_level(stock_level):
         return False
 
 
+# Product listing helpers (keyset pagination, filtering and sorting)
+PRODUCT_PAGE_DEFAULT = 100
+PRODUCT_PAGE_MAX = 1000
+PRODUCT_SORT_KEYS = ("id", "name", "price", "stock_level", "updated_at")
+
+
+def _parse_bool(value):
+    """Parse a boolean query string value"""
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+
+def encode_cursor(sort, order, value, last_id):
+    """Build an opaque pagination cursor from the last row of a page"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort, order):
+    """Decode a pagination cursor, returning ``(sort_value, id)``"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, last_id = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        if value is not None and sort in ("updated_at", "restocked_at"):
+            value = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (cursor_sort, cursor_order) != (sort, order) or not isinstance(last_id, int):
+        raise ValueError("Cursor does not match the requested sort order")
+    return value, last_id
+
+
+def parse_product_list_args(args):
+    """Validate query parameters for the product listing endpoint"""
+    parsed = {
+        "limit": args.get("limit", PRODUCT_PAGE_DEFAULT, type=int),
+        "sort": args.get("sort", "id"),
+        "order": args.get("order", "asc").lower(),
+    }
+    if parsed["limit"] is None or not 1 <= parsed["limit"] <= PRODUCT_PAGE_MAX:
+        raise ValueError(f"limit must be an integer between 1 and {PRODUCT_PAGE_MAX}")
+    if parsed["sort"] not in PRODUCT_SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(PRODUCT_SORT_KEYS)}")
+    if parsed["order"] not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    parsed["name_prefix"] = args.get("name_prefix")
+    for key, convert in (
+        ("min_price", float),
+        ("max_price", float),
+        ("min_stock", int),
+        ("max_stock", int),
+        ("low_stock", _parse_bool),
+        ("updated_since", datetime.fromisoformat),
+    ):
+        value = args.get(key)
+        try:
+            parsed[key] = convert(value) if value not in (None, "") else None
+        except ValueError:
+            raise ValueError(f"Invalid value for {key}: {value}")
+
+    cursor = args.get("cursor")
+    parsed["after"] = (
+        decode_cursor(cursor, parsed["sort"], parsed["order"]) if cursor else None
+    )
+    parsed["count"] = parse_count_mode(args, "none")
+    return parsed
+
+
+def apply_product_filters(query, args):
+    """Apply listing filters to a product query"""
+    if args["name_prefix"]:
+        escaped = re.sub(r"([\\%_])", r"\\\1", args["name_prefix"])
+        query = query.filter(Product.name.like(f"{escaped}%", escape="\\"))
+    if args["min_price"] is not None:
+        query = query.filter(Product.price >= args["min_price"])
+    if args["max_price"] is not None:
+        query = query.filter(Product.price <= args["max_price"])
+    if args["min_stock"] is not None:
+        query = query.filter(Product.stock_level >= args["min_stock"])
+    if args["max_stock"] is not None:
+        query = query.filter(Product.stock_level <= args["max_stock"])
+    if args["low_stock"] is True:
+        query = query.filter(Product.is_low_stock)
+    elif args["low_stock"] is False:
+        query = query.filter(~Product.is_low_stock)
+    if args["updated_since"] is not None:
+        query = query.filter(Product.updated_at >= args["updated_since"])
+    return query
+
+
+def apply_keyset_page(query, args):
+    """Order by ``(sort_key, id)`` and seek past the cursor position
+
+    The seek predicate is written as ``col >= v AND (col > v OR id > last_id)``
+    so the single-column index on the sort key can serve the range scan, and
+    page N costs the same as page 1 (unlike OFFSET).
+
+    NULLs in a nullable sort key sort after every value (NULLS LAST
+    ascending, NULLS FIRST descending: PostgreSQL's default, so its b-tree
+    order, made explicit for SQLite). A comparison with NULL is never true,
+    so the seek adds an ``IS NULL`` branch for them.
+    """
+    column = getattr(Product, args["sort"])
+    descending = args["order"] == "desc"
+    if args["sort"] == "id":
+        order_by = [column.desc() if descending else column.asc()]
+    elif not column.nullable:
+        order_by = [
+            column.desc() if descending else column.asc(),
+            Product.id.desc() if descending else Product.id.asc(),
+        ]
+    elif descending:
+        order_by = [column.desc().nulls_first(), Product.id.desc()]
+    else:
+        order_by = [column.asc().nulls_last(), Product.id.asc()]
+    query = query.order_by(*order_by)
+
+    if args["after"] is not None:
+        value, last_id = args["after"]
+        if args["sort"] == "id":
+            query = query.filter(column < last_id if descending else column > last_id)
+        elif value is None:
+            # The cursor is inside the NULL run
+            if descending:
+                query = query.filter(or_(column.is_not(None), Product.id < last_id))
+            else:
+                query = query.filter(and_(column.is_(None), Product.id > last_id))
+        elif descending:
+            query = query.filter(
+                and_(column <= value, or_(column < value, Product.id < last_id))
+            )
+        else:
+            seek = and_(column >= value, or_(column > value, Product.id > last_id))
+            query = query.filter(
+                or_(seek, column.is_(None)) if column.nullable else seek
+            )
+    return query
+
+
+# Total counts for paginated endpoints (``count`` query parameter)
+COUNT_MODES = ("exact", "estimated", "none")
+
+
+def parse_count_mode(args, default):
+    """Validate the ``count`` query parameter"""
+    mode = args.get("count", default).lower()
+    if mode not in COUNT_MODES:
+        raise ValueError(f"count must be one of: {', '.join(COUNT_MODES)}")
+    return mode
+
+
+def count_rows(connection, query, mode):
+    """Total number of rows ``query`` returns, or ``None`` for ``count=none``
+
+    ``estimated`` asks the PostgreSQL planner instead of scanning, so its cost
+    does not grow with the table. SQLite has no planner statistics and
+    counts exactly.
+    """
+    if mode == "none":
+        return None
+    if mode == "estimated" and connection.dialect.name == "postgresql":
+        return estimate_rows(connection, query)
+    return connection.execute(
+        db.select(func.count()).select_from(query.order_by(None).subquery())
+    ).scalar()
+
+
+def estimate_rows(connection, query):
+    """Planner row estimate for ``query`` (PostgreSQL)
+
+    An unfiltered single-table query reads ``pg_class.reltuples``, which
+    ANALYZE/autovacuum keep current. Anything else uses the top-level
+    ``Plan Rows`` of ``EXPLAIN``, which plans but does not run the query.
+    """
+    froms = query.get_final_froms()
+    if query.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table):
+        reltuples = connection.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = CAST(:name AS regclass)"),
+            {"name": froms[0].name},
+        ).scalar()
+        # -1 until the table has been vacuumed or analyzed once
+        if reltuples is not None and reltuples >= 0:
+            return int(reltuples)
+
+    compiled = query.order_by(None).compile(dialect=connection.dialect)
+    params = compiled.params
+    if compiled.positional:
+        # asyncpg binds $1, $2, ... rather than named parameters
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", params
+    ).scalar()
+    if isinstance(plan, str):
+        # asyncpg returns json columns undecoded
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 # Prometheus metrics setup
+# Each gunicorn worker is a separate process with its own registry, so a
+# scrape of one worker sees a fraction of the traffic. When
+# PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py sets it) prometheus_client
+# writes every sample to per-process mmap files in that directory and
+# /metrics merges the files of all workers; gauges declare how their
+# per-worker values combine.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
 # Request counters
 REQUEST_COUNT = Counter(
     "http_requests_total", "Total HTTP requests", ["method", "endpoint", "status"]
@@ -76,23 +422,80 @@ REQUEST_LATENCY = Histogram(
 )
 
 # Business metrics
-STOCK_LEVEL_GAUGE = Gauge(
-    "product_stock_level",
-    "Current stock level for products",
-    ["product_id", "product_name", "sku"],
-)
+# product_stock_level is produced at scrape time by ProductStockCollector.
+# The per-product counters live in their own registry and are exported
+# through ProductSeriesFilter, which keeps only products in the export set.
+PRODUCT_SERIES_REGISTRY = CollectorRegistry(auto_describe=True)
 LOW_STOCK_ALERTS = Counter(
-    "low_stock_alerts_total", "Total low stock alerts", ["product_id", "product_name"]
+    "low_stock_alerts_total",
+    "Total low stock alerts",
+    ["product_id", "product_name"],
+    registry=PRODUCT_SERIES_REGISTRY,
 )
 RESTOCK_OPERATIONS = Counter(
     "restock_operations_total",
     "Total restock operations",
     ["product_id", "product_name"],
+    registry=PRODUCT_SERIES_REGISTRY,
 )
+PER_PRODUCT_COUNTERS = (LOW_STOCK_ALERTS, RESTOCK_OPERATIONS)
 PRODUCT_OPERATIONS = Counter(
     "product_operations_total", "Total product operations", ["operation_type"]
 )
 
+# Product cache metrics
+PRODUCT_CACHE_REQUESTS = Counter(
+    "product_cache_requests_total", "Product cache lookups", ["result"]
+)
+PRODUCT_CACHE_EVICTIONS = Counter(
+    "product_cache_evictions_total", "Product cache evictions", ["reason"]
+)
+# Each worker has its own cache: the pod total is the sum over live workers
+PRODUCT_CACHE_ENTRIES = Gauge(
+    "product_cache_entries",
+    "Products held in the cache",
+    multiprocess_mode="livesum",
+)
+
+# Per-request database metrics (recorded by the engine event hooks below)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request",
+    ["method", "endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent executing SQL statements per request",
+    ["method", "endpoint"],
+)
+DB_REPEATED_STATEMENTS = Counter(
+    "http_request_db_repeated_statements_total",
+    "Requests that ran one statement repeatedly (likely N+1 queries)",
+    ["endpoint"],
+)
+QUERY_BUDGET_EXCEEDED = Counter(
+    "http_request_query_budget_exceeded_total",
+    "Requests that ran more SQL statements than the endpoint's budget",
+    ["endpoint"],
+)
+# The rest of a request's latency, split by phase (see after_request)
+DB_POOL_WAIT_PER_REQUEST = Histogram(
+    "http_request_db_pool_wait_seconds",
+    "Time spent checking out pooled database connections per request",
+    ["method", "endpoint"],
+)
+SERIALIZATION_TIME_PER_REQUEST = Histogram(
+    "http_request_serialization_seconds",
+    "Time spent encoding JSON responses per request",
+    ["method", "endpoint"],
+)
+APP_TIME_PER_REQUEST = Histogram(
+    "http_request_app_duration_seconds",
+    "Request time outside SQL execution, pool checkout and JSON encoding",
+    ["method", "endpoint"],
+)
+
 # Database configuration
 # Build DATABASE_URL from individual environment variables
 db_user = os.getenv("DB_USER", "inventory_user")
@@ -103,19 +506,34 @@ db_name = os.getenv("DB_NAME", "inventory_db")
 
 database_url = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that charges the time spent checking out a connection
+    (waiting for a free one, or opening a new one) to the current request"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            if has_request_context() and hasattr(request, "db_pool_wait"):
+                request.db_pool_wait += time.perf_counter() - start
+
+
+# Pool sizes per process; gunicorn.conf.py derives them from the deployment's
+# connection budget
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_size": 10,
+    "poolclass": TimedQueuePool,
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
     "pool_recycle": 3600,
     "pool_pre_ping": True,
-    "max_overflow": 20,
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
 }
 
 # Initialize database
 db = SQLAlchemy(app)
 
-# Global flag to ensure database tables are created only once
-_database_initialized = False
-
 
 # Database Models
 class Product(db.Model):
@@ -134,6 +552,11 @@ class Product(db.Model):
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
     )
+    # Maintained by the database so low-stock rows can be served by the
+    # partial index below instead of a column-to-column sequential scan
+    is_low_stock = db.Column(
+        db.Boolean, db.Computed("stock_level <= min_stock_threshold", persisted=True)
+    )
 
     def to_dict(self):
         """Convert product object to dictionary"""
@@ -151,21 +574,63 @@ class Product(db.Model):
         }
 
 
+# Partial index holding only low-stock rows, ordered by severity (largest
+# shortfall below the threshold first). Mirrored in init.sql.
+LOW_STOCK_SEVERITY = Product.stock_level - Product.min_stock_threshold
+db.Index(
+    "ix_products_low_stock_severity",
+    LOW_STOCK_SEVERITY,
+    Product.id,
+    postgresql_where=Product.is_low_stock,
+    sqlite_where=Product.is_low_stock,
+)
+
+# Full-text document (name weighted above description) and trigram indexes
+# for /api/products/search. The query must repeat SEARCH_DOCUMENT verbatim
+# for the planner to match the expression index. PostgreSQL only; mirrored
+# in migrations/0005_product_search.sql.
+SEARCH_CONFIG = text("'english'::regconfig")
+
+
+def _weighted_tsvector(column, weight):
+    return func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, func.coalesce(column, text("''"))),
+        text(f"'{weight}'"),
+    )
+
+
+SEARCH_DOCUMENT = _weighted_tsvector(Product.name, "A").op("||")(
+    _weighted_tsvector(Product.description, "B")
+)
+db.Index("ix_products_search_document", SEARCH_DOCUMENT, postgresql_using="gin").ddl_if(
+    dialect="postgresql"
+)
+for _column in ("name", "sku"):
+    db.Index(
+        f"ix_products_{_column}_trgm",
+        getattr(Product, _column),
+        postgresql_using="gin",
+        postgresql_ops={_column: "gin_trgm_ops"},
+    ).ddl_if(dialect="postgresql")
+
+
 class RestockLog(db.Model):
     """Restocking log model to track restocking history"""
 
     __tablename__ = "restock_logs"
 
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+    product_id = db.Column(
+        db.Integer, db.ForeignKey("products.id", ondelete="CASCADE"), nullable=False
+    )
     quantity_added = db.Column(db.Integer, nullable=False)
     previous_stock = db.Column(db.Integer, nullable=False)
     new_stock = db.Column(db.Integer, nullable=False)
     restocked_at = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)
 
-    # Relationship with Product
-    product = db.relationship("Product", backref="restock_history")
+    # Relationship with Product (joined so to_dict() never lazy-loads per row)
+    product = db.relationship("Product", backref="restock_history", lazy="joined")
 
     def to_dict(self):
         """Convert restock log object to dictionary"""
@@ -182,14 +647,924 @@ class RestockLog(db.Model):
         }
 
 
-# Initialize database tables (Flask 3.0 compatible)
-@app.before_request
-def create_tables():
-    """Create database tables if they don't exist"""
-    global _database_initialized
-    if not _database_initialized:
-        db.create_all()
-        _database_initialized = True
+# Restock history is read newest first, per product or across the catalog;
+# the id tie-break makes the order total for keyset pagination. Mirrored in
+# migrations/0006_restock_history_indexes.sql and init.sql.
+db.Index(
+    "ix_restock_logs_product_restocked_at",
+    RestockLog.product_id,
+    RestockLog.restocked_at.desc(),
+    RestockLog.id.desc(),
+)
+db.Index(
+    "ix_restock_logs_restocked_at",
+    RestockLog.restocked_at.desc(),
+    RestockLog.id.desc(),
+)
+
+
+class CatalogVersion(db.Model):
+    """Single-row counter bumped by every catalog write (drives ETags)"""
+
+    __tablename__ = "catalog_version"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# Column-projected read path: list endpoints select exactly the columns they
+# serialize and turn rows straight into response dicts, skipping ORM
+# instance construction, identity-map bookkeeping and attribute
+# instrumentation.
+products_table = Product.__table__
+restock_logs_table = RestockLog.__table__
+
+
+def product_row_to_dict(row):
+    """Convert a products row to the same dict as ``Product.to_dict``"""
+    return {
+        "id": row.id,
+        "name": row.name,
+        "sku": row.sku,
+        "description": row.description,
+        "stock_level": row.stock_level,
+        "min_stock_threshold": row.min_stock_threshold,
+        "price": row.price,
+        "created_at": row.created_at.isoformat(),
+        "updated_at": row.updated_at.isoformat(),
+        "is_low_stock": row.stock_level <= row.min_stock_threshold,
+    }
+
+
+def select_restock_rows():
+    """Select restock log columns joined to the product name and SKU"""
+    return db.select(
+        restock_logs_table.c.id,
+        restock_logs_table.c.product_id,
+        products_table.c.name.label("product_name"),
+        products_table.c.sku.label("product_sku"),
+        restock_logs_table.c.quantity_added,
+        restock_logs_table.c.previous_stock,
+        restock_logs_table.c.new_stock,
+        restock_logs_table.c.restocked_at,
+        restock_logs_table.c.notes,
+    ).join(products_table, restock_logs_table.c.product_id == products_table.c.id)
+
+
+def restock_row_to_dict(row):
+    """Convert a ``select_restock_rows`` row to the same dict as ``to_dict``"""
+    return {
+        "id": row.id,
+        "product_id": row.product_id,
+        "product_name": row.product_name,
+        "product_sku": row.product_sku,
+        "quantity_added": row.quantity_added,
+        "previous_stock": row.previous_stock,
+        "new_stock": row.new_stock,
+        "restocked_at": row.restocked_at.isoformat(),
+        "notes": row.notes,
+    }
+
+
+# Conditional GETs: read endpoints derive a strong ETag from the catalog
+# version, which every write bumps in its own transaction. On PostgreSQL a
+# trigger NOTIFYs each new version (migrations/0008) and the worker's
+# listener thread (see ProductCache) keeps an in-process copy, so checking
+# an ETag does not touch the database. The copy may trail a commit by the
+# notification delay, never lead it; the version is read before the data,
+# so a tag never names a version newer than the data sent with it. While
+# the listener is not connected (and on SQLite) the version is read from
+# the table instead.
+catalog_version_table = CatalogVersion.__table__
+CATALOG_VERSION_CHANNEL = "catalog_version"
+
+
+class LocalCatalogVersion:
+    """This worker's copy of the catalog version, or None while unknown"""
+
+    def __init__(self):
+        self.value = None
+        self._lock = threading.Lock()
+
+    def advance(self, version):
+        """Record ``version`` unless a later one is already known"""
+        with self._lock:
+            if self.value is None or version > self.value:
+                self.value = version
+
+    def reset(self):
+        with self._lock:
+            self.value = None
+
+
+LOCAL_CATALOG_VERSION = LocalCatalogVersion()
+
+
+def bump_catalog_version():
+    """Increment the catalog version inside the current transaction"""
+    result = db.session.execute(
+        catalog_version_table.update()
+        .where(catalog_version_table.c.id == 1)
+        .values(version=catalog_version_table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.execute(catalog_version_table.insert().values(id=1, version=1))
+
+
+def get_catalog_version(connection=None):
+    """Return the current catalog version (0 before the first write)"""
+    return (connection or db.session).execute(
+        db.select(catalog_version_table.c.version).where(
+            catalog_version_table.c.id == 1
+        )
+    ).scalar() or 0
+
+
+def current_catalog_version(connection=None):
+    """The in-process catalog version, falling back to the database"""
+    version = LOCAL_CATALOG_VERSION.value
+    return get_catalog_version(connection) if version is None else version
+
+
+# Endpoints whose body also depends on the UTC date (a rolling window that
+# starts at midnight), so their tags change when the day does
+DAILY_ETAG_ENDPOINTS = frozenset({"get_stock_analytics"})
+
+
+def catalog_etag_value(endpoint, version, query_string):
+    """ETag for ``endpoint`` at catalog ``version`` with a raw query string"""
+    query_digest = hashlib.sha256(query_string).hexdigest()[:16]
+    if endpoint in DAILY_ETAG_ENDPOINTS:
+        version = f"{version}-{datetime.utcnow():%Y%m%d}"
+    return f"{endpoint}-{version}-{query_digest}"
+
+
+def catalog_etag(view):
+    """Answer 304 for read endpoints when the client's ETag is current
+
+    The tag covers the endpoint, catalog version and query string, so each
+    distinct listing/filter combination is cached separately by the client.
+    With the listener connected a matching tag is answered without a query.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        PRODUCT_CACHE.ensure_listener()
+        etag = catalog_etag_value(
+            request.endpoint, current_catalog_version(), request.query_string
+        )
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    return wrapper
+
+
+# Per-worker product cache. Writes queue a NOTIFY inside their transaction;
+# each worker runs a listener thread that evicts the key once the write
+# commits, on every pod. While the listener is not connected the cache is
+# bypassed, since missed notifications would leave stale entries behind.
+PRODUCT_CHANGES_CHANNEL = "product_changes"
+PRODUCT_CHANGES_ALL = "*"  # payload asking every worker to flush its cache
+
+
+class ProductCache:
+    """Bounded, thread-safe LRU of serialized products keyed by id"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.active = False
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, product_id):
+        if not self.active:
+            return None
+        with self._lock:
+            value = self._entries.get(product_id)
+            if value is not None:
+                self._entries.move_to_end(product_id)
+        PRODUCT_CACHE_REQUESTS.labels(result="miss" if value is None else "hit").inc()
+        return value
+
+    def put(self, product_id, value, generation):
+        """Store a value read while the cache was at ``generation``
+
+        The put is dropped if an invalidation arrived in the meantime, so a
+        read racing a write can never re-insert the pre-write row.
+        """
+        with self._lock:
+            if not self.active or generation != self.generation:
+                return
+            self._entries[product_id] = value
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                PRODUCT_CACHE_EVICTIONS.labels(reason="capacity").inc()
+            PRODUCT_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate(self, product_id):
+        with self._lock:
+            self.generation += 1
+            if self._entries.pop(product_id, None) is not None:
+                PRODUCT_CACHE_EVICTIONS.labels(reason="invalidation").inc()
+                PRODUCT_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            PRODUCT_CACHE_ENTRIES.set(0)
+
+    def ensure_listener(self):
+        """Start this worker's invalidation listener on first use
+
+        Checked per process so a cache inherited across ``fork`` starts its
+        own listener in the child.
+        """
+        if self.max_size <= 0 or self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self.active = False
+            self._entries.clear()
+            PRODUCT_CACHE_ENTRIES.set(0)
+            LOCAL_CATALOG_VERSION.reset()
+        if db.engine.dialect.name == "postgresql":
+            threading.Thread(
+                target=self._listen,
+                args=(db.engine,),
+                name="product-cache-listener",
+                daemon=True,
+            ).start()
+        else:
+            # No cross-process notifications available (e.g. SQLite in
+            # tests); local invalidation after each write is sufficient.
+            self.active = True
+
+    def _listen(self, engine):
+        backoff = 1
+        while True:
+            try:
+                connection = engine.raw_connection()
+                connection.detach()
+                listener = connection.driver_connection
+                listener.autocommit = True
+                cursor = listener.cursor()
+                cursor.execute(f"LISTEN {PRODUCT_CHANGES_CHANNEL}")
+                cursor.execute(f"LISTEN {CATALOG_VERSION_CHANNEL}")
+                # Without the trigger (a schema built by create_all rather
+                # than the migrations) bumps are never announced, so keep
+                # reading the version from the table
+                cursor.execute(
+                    "SELECT 1 FROM pg_trigger WHERE tgname = 'catalog_version_notify'"
+                )
+                if cursor.fetchone():
+                    # Read after LISTEN so no bump can fall between the two
+                    cursor.execute("SELECT version FROM catalog_version WHERE id = 1")
+                    row = cursor.fetchone()
+                    LOCAL_CATALOG_VERSION.advance(row[0] if row else 0)
+                self.clear()
+                self.active = True
+                backoff = 1
+                logger.info("Product cache listener connected")
+                while True:
+                    if select.select([listener], [], [], 30) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        notify = listener.notifies.pop(0)
+                        if notify.channel == CATALOG_VERSION_CHANNEL:
+                            LOCAL_CATALOG_VERSION.advance(int(notify.payload))
+                        elif notify.payload == PRODUCT_CHANGES_ALL:
+                            self.clear()
+                        else:
+                            self.invalidate(int(notify.payload))
+            except Exception as e:
+                self.active = False
+                self.clear()
+                LOCAL_CATALOG_VERSION.reset()
+                logger.warning("Product cache listener disconnected: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+def publish_product_change(product_id):
+    """Queue a cache invalidation that is delivered when the transaction commits"""
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": PRODUCT_CHANGES_CHANNEL, "payload": str(product_id)},
+        )
+
+
+def publish_product_changes(product_ids):
+    """Queue cache invalidations for many products in one statement"""
+    if product_ids and db.engine.dialect.name == "postgresql":
+        db.session.execute(
+            text(
+                "SELECT pg_notify(:channel, id::text) "
+                "FROM unnest(CAST(:ids AS integer[])) AS id"
+            ),
+            {"channel": PRODUCT_CHANGES_CHANNEL, "ids": list(product_ids)},
+        )
+
+
+# Single-round-trip writes. On PostgreSQL each mutation is one statement:
+# the row change, its restock log, the catalog version bump and the cache
+# NOTIFY ride together as data-modifying CTEs, and stock is incremented in
+# SQL so concurrent restocks cannot lose updates. Other dialects (SQLite in
+# tests) run the same steps as consecutive statements in one transaction.
+def is_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+
+def catalog_bump_cte(trigger):
+    """CTE bumping the catalog version once if ``trigger`` returned any row"""
+    return (
+        pg_insert(catalog_version_table)
+        .from_select(
+            ["id", "version"],
+            db.select(literal(1), literal(1)).select_from(trigger).limit(1),
+        )
+        .on_conflict_do_update(
+            index_elements=[catalog_version_table.c.id],
+            set_={"version": catalog_version_table.c.version + 1},
+        )
+        .returning(catalog_version_table.c.version)
+        .cte("catalog_bump")
+    )
+
+
+def product_notify_column(product_id_column):
+    """Select column queueing a product cache NOTIFY for each returned row"""
+    return func.pg_notify(
+        PRODUCT_CHANGES_CHANNEL, cast(product_id_column, db.String)
+    ).label("notified")
+
+
+def insert_product_row(values):
+    """Insert a product unless its SKU exists; return the new row or None"""
+    insert = (pg_insert if is_postgres() else sqlite_insert)(products_table)
+    stmt = (
+        insert.values(**values)
+        .on_conflict_do_nothing(index_elements=[products_table.c.sku])
+        .returning(*products_table.c)
+    )
+    if is_postgres():
+        inserted = stmt.cte("inserted")
+        return db.session.execute(
+            db.select(inserted).add_cte(catalog_bump_cte(inserted))
+        ).first()
+
+    row = db.session.execute(stmt).first()
+    if row is not None:
+        bump_catalog_version()
+    return row
+
+
+def restock_product_row(product_id, quantity, notes):
+    """Atomically add stock and log it; return ``(product_row, log_row)``
+
+    Returns ``(None, None)`` if the product does not exist.
+    """
+    now = datetime.utcnow()
+    update = (
+        products_table.update()
+        .where(products_table.c.id == product_id)
+        .values(stock_level=products_table.c.stock_level + quantity, updated_at=now)
+        .returning(*products_table.c)
+    )
+    if is_postgres():
+        updated = update.cte("updated")
+        logged = (
+            restock_logs_table.insert()
+            .from_select(
+                [
+                    "product_id",
+                    "quantity_added",
+                    "previous_stock",
+                    "new_stock",
+                    "restocked_at",
+                    "notes",
+                ],
+                db.select(
+                    updated.c.id,
+                    literal(quantity),
+                    updated.c.stock_level - quantity,
+                    updated.c.stock_level,
+                    literal(now),
+                    literal(notes),
+                ),
+            )
+            .returning(*restock_logs_table.c)
+            .cte("logged")
+        )
+        row = db.session.execute(
+            db.select(
+                updated,
+                logged.c.id.label("log_id"),
+                product_notify_column(updated.c.id),
+            )
+            .select_from(updated.join(logged, logged.c.product_id == updated.c.id))
+            .add_cte(catalog_bump_cte(updated))
+        ).first()
+        if row is None:
+            return None, None
+        log_row = {
+            "id": row.log_id,
+            "product_id": row.id,
+            "product_name": row.name,
+            "product_sku": row.sku,
+            "quantity_added": quantity,
+            "previous_stock": row.stock_level - quantity,
+            "new_stock": row.stock_level,
+            "restocked_at": now.isoformat(),
+            "notes": notes,
+        }
+        return row, log_row
+
+    row = db.session.execute(update).first()
+    if row is None:
+        return None, None
+    log_id = db.session.execute(
+        restock_logs_table.insert()
+        .values(
+            product_id=product_id,
+            quantity_added=quantity,
+            previous_stock=row.stock_level - quantity,
+            new_stock=row.stock_level,
+            restocked_at=now,
+            notes=notes,
+        )
+        .returning(restock_logs_table.c.id)
+    ).scalar()
+    bump_catalog_version()
+    log_row = {
+        "id": log_id,
+        "product_id": row.id,
+        "product_name": row.name,
+        "product_sku": row.sku,
+        "quantity_added": quantity,
+        "previous_stock": row.stock_level - quantity,
+        "new_stock": row.stock_level,
+        "restocked_at": now.isoformat(),
+        "notes": notes,
+    }
+    return row, log_row
+
+
+def delete_product_row(product_id):
+    """Delete a product and its restock logs; return the deleted row or None"""
+    delete_logs = restock_logs_table.delete().where(
+        restock_logs_table.c.product_id == product_id
+    )
+    delete = (
+        products_table.delete()
+        .where(products_table.c.id == product_id)
+        .returning(products_table.c.id, products_table.c.name, products_table.c.sku)
+    )
+    if is_postgres():
+        # Foreign keys are checked at the end of the statement, after both
+        # deletes have run
+        deleted = delete.cte("deleted")
+        return db.session.execute(
+            db.select(deleted, product_notify_column(deleted.c.id))
+            .add_cte(delete_logs.cte("deleted_logs"))
+            .add_cte(catalog_bump_cte(deleted))
+        ).first()
+
+    db.session.execute(delete_logs)
+    row = db.session.execute(delete).first()
+    if row is not None:
+        bump_catalog_version()
+    return row
+
+
+# Set-based bulk writes: rows are shipped as an inline VALUES relation and
+# applied with one UPDATE ... FROM per chunk instead of one statement per row.
+BULK_CHUNK_ROWS = 500
+
+
+def values_table(name, columns, rows):
+    """Inline ``rows`` as a named relation usable in FROM / UPDATE ... FROM
+
+    Renders ``(VALUES ...) AS name (cols)`` on PostgreSQL. SQLite cannot
+    alias VALUES columns, so it gets an equivalent UNION ALL of SELECTs.
+    """
+    if is_postgres():
+        return values(*columns, name=name).data(rows)
+    selects = [
+        db.select(
+            *[
+                literal(value, col.type).label(col.name)
+                for value, col in zip(row, columns)
+            ]
+        )
+        for row in rows
+    ]
+    return (union_all(*selects) if len(selects) > 1 else selects[0]).subquery(name)
+
+
+def chunked(items, size=BULK_CHUNK_ROWS):
+    """Split a list into consecutive chunks of at most ``size`` items"""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+PRODUCT_CACHE = ProductCache(max_size=int(os.getenv("PRODUCT_CACHE_SIZE", "10000")))
+
+
+# Per-product series. Counters are labelled with the product's current name;
+# a rename or delete removes the series under the old labels from this
+# worker's registry so they do not accumulate.
+PRODUCT_SERIES_NAMES = {}  # product_id -> name its counter series carry
+PRODUCT_SERIES_LOCK = threading.Lock()
+
+
+def remove_product_series(product_id, keep_name=None):
+    """Remove a product's per-product counter series (unless still current)"""
+    with PRODUCT_SERIES_LOCK:
+        name = PRODUCT_SERIES_NAMES.get(product_id)
+        if name is None or name == keep_name:
+            return
+        del PRODUCT_SERIES_NAMES[product_id]
+    for metric in PER_PRODUCT_COUNTERS:
+        try:
+            metric.remove(str(product_id), name)
+        except KeyError:
+            pass
+
+
+def product_series_labels(product_id, product_name):
+    """Label values for a per-product counter, retiring any older name"""
+    remove_product_series(product_id, keep_name=product_name)
+    with PRODUCT_SERIES_LOCK:
+        PRODUCT_SERIES_NAMES[product_id] = product_name
+    return str(product_id), product_name
+
+
+# Scrape-time business metrics
+PRODUCT_METRICS_MODES = ("all", "low-stock", "top")
+
+
+class ProductStockCollector:
+    """Export product_stock_level from a cached snapshot at /metrics scrape time
+
+    Request handlers never touch this metric; the snapshot is re-read from the
+    database at most once every ``max_age`` seconds, however often Prometheus
+    scrapes. ``mode`` bounds which products are exported: ``all``,
+    ``low-stock`` (only products at or below their threshold) or ``top``
+    (the ``top_n`` products with the largest shortfall).
+    """
+
+    def __init__(self, max_age, mode="all", top_n=100):
+        if mode not in PRODUCT_METRICS_MODES:
+            modes = ", ".join(PRODUCT_METRICS_MODES)
+            raise ValueError(f"Product metrics mode must be one of: {modes}")
+        self.max_age = max_age
+        self.mode = mode
+        self.top_n = top_n
+        self._rows = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _family(self):
+        return GaugeMetricFamily(
+            "product_stock_level",
+            "Current stock level for products",
+            labels=["product_id", "product_name", "sku"],
+        )
+
+    def describe(self):
+        """Describe the metric without querying the database on registration"""
+        return [self._family()]
+
+    def _query(self):
+        query = db.session.query(
+            Product.id, Product.name, Product.sku, Product.stock_level
+        )
+        if self.mode == "low-stock":
+            query = query.filter(Product.is_low_stock)
+        elif self.mode == "top":
+            query = query.order_by(LOW_STOCK_SEVERITY, Product.id).limit(self.top_n)
+        return query
+
+    def snapshot(self):
+        """Return cached ``(id, name, sku, stock_level)`` rows, refreshing if stale"""
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is None or now - self._loaded_at >= self.max_age:
+                try:
+                    with app.app_context():
+                        self._rows = [
+                            (str(row.id), row.name, row.sku, row.stock_level or 0)
+                            for row in self._query()
+                        ]
+                    self._loaded_at = now
+                except Exception as e:
+                    # Serve the previous snapshot rather than failing the scrape
+                    logger.warning("Stock level snapshot refresh failed: %s", e)
+            return self._rows
+
+    def exported_products(self):
+        """``(product_id, product_name)`` pairs in the export set, or None
+        if the snapshot has never been loaded"""
+        rows = self.snapshot()
+        if self._loaded_at is None:
+            return None
+        return {(product_id, name) for product_id, name, _, _ in rows}
+
+    def invalidate(self):
+        """Force the next scrape to re-read stock levels"""
+        with self._lock:
+            self._loaded_at = None
+
+    def collect(self):
+        family = self._family()
+        for product_id, name, sku, stock_level in self.snapshot():
+            family.add_metric([product_id, name, sku], stock_level)
+        yield family
+
+
+class ProductSeriesFilter:
+    """Pass through ``source``'s metrics, dropping per-product series outside
+    the stock collector's export set
+
+    This keeps scrape size bounded by the export mode, and hides series of
+    deleted or renamed products that another worker (or, in multiprocess
+    mode, an mmap file) still holds. Also reports how many per-product
+    series each metric exported.
+    """
+
+    def __init__(self, source, products):
+        self.source = source
+        self.products = products
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        exported = self.products.exported_products()
+        counts = {"product_stock_level": len(self.products.snapshot())}
+        for family in self.source.collect():
+            per_product = False
+            samples = []
+            for sample in family.samples:
+                if "product_id" not in sample.labels:
+                    samples.append(sample)
+                    continue
+                per_product = True
+                key = (sample.labels["product_id"], sample.labels.get("product_name"))
+                if exported is None or key in exported:
+                    samples.append(sample)
+            if per_product:
+                family.samples = samples
+                counts[family.name] = len(
+                    {
+                        (s.labels["product_id"], s.labels.get("product_name"))
+                        for s in samples
+                        if "product_id" in s.labels
+                    }
+                )
+            yield family
+
+        series = GaugeMetricFamily(
+            "product_metric_series",
+            "Per-product label sets exported by this scrape",
+            labels=["metric"],
+        )
+        for name, count in sorted(counts.items()):
+            series.add_metric([name], count)
+        yield series
+
+
+STOCK_LEVEL_COLLECTOR = ProductStockCollector(
+    max_age=float(os.getenv("STOCK_METRICS_MAX_AGE", "30")),
+    mode=os.getenv("PRODUCT_METRICS_MODE", "all"),
+    top_n=int(os.getenv("PRODUCT_METRICS_TOP_N", "100")),
+)
+REGISTRY.register(STOCK_LEVEL_COLLECTOR)
+
+
+# Inventory-wide business metrics. One background refresher per pod
+# recomputes them on an interval with a single aggregate query, so neither
+# requests nor scrapes run full-table aggregates. Workers elect the
+# refresher by holding a lock file; the others export the state it writes.
+RECENT_RESTOCK_WINDOW = timedelta(days=7)
+BUSINESS_METRICS_GAUGES = (
+    ("inventory_total_products", "Total number of products"),
+    ("inventory_total_value", "Total inventory value"),
+    ("inventory_low_stock_products", "Low stock products (still in stock)"),
+    ("inventory_out_of_stock_products", "Out of stock products"),
+    ("inventory_in_stock_products", "Products above their low stock threshold"),
+    ("inventory_recent_restocks", "Restocks in the last 7 days"),
+)
+
+
+def read_business_metrics(connection):
+    """Inventory-wide gauge values from one aggregate statement"""
+    recent_restocks = (
+        db.select(func.count())
+        .where(RestockLog.restocked_at >= datetime.utcnow() - RECENT_RESTOCK_WINDOW)
+        .scalar_subquery()
+    )
+    row = connection.execute(
+        db.select(
+            func.count().label("total"),
+            func.coalesce(func.sum(Product.stock_level * Product.price), 0).label(
+                "value"
+            ),
+            func.count()
+            .filter(Product.is_low_stock, Product.stock_level > 0)
+            .label("low_stock"),
+            func.count().filter(Product.stock_level == 0).label("out_of_stock"),
+            recent_restocks.label("recent_restocks"),
+        )
+    ).one()
+    return {
+        "inventory_total_products": row.total,
+        "inventory_total_value": float(row.value),
+        "inventory_low_stock_products": row.low_stock,
+        "inventory_out_of_stock_products": row.out_of_stock,
+        "inventory_in_stock_products": row.total - row.low_stock - row.out_of_stock,
+        "inventory_recent_restocks": row.recent_restocks,
+    }
+
+
+class BusinessMetricsRefresher:
+    """Recompute the inventory gauges in a background thread, once per pod
+
+    With ``state_dir`` (the Prometheus multiprocess directory) only the
+    worker holding ``business-metrics.lock`` refreshes; it writes its state
+    to ``business-metrics.json``, which every worker exports at scrape time.
+    If that worker exits, the lock is released and another takes over.
+    Without ``state_dir`` each process refreshes its own state.
+    """
+
+    LOCK_FILE = "business-metrics.lock"
+    STATE_FILE = "business-metrics.json"
+
+    def __init__(self, interval, state_dir=None):
+        self.interval = interval
+        self.state_dir = state_dir
+        self.leader = False
+        self._state = None
+        self._failures = 0
+        self._lock_file = None
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start this process's refresher thread (idempotent per process)"""
+        if self.interval <= 0 or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(
+            target=self._run, name="business-metrics-refresher", daemon=True
+        ).start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.acquire_leadership():
+                    self.refresh()
+            except Exception as e:
+                logger.warning("Business metrics refresher error: %s", e)
+            time.sleep(self.interval)
+
+    def acquire_leadership(self):
+        """Try to become the pod's refresher; True once this process is"""
+        if self.leader or self.state_dir is None:
+            self.leader = True
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(os.path.join(self.state_dir, self.LOCK_FILE), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        self.leader = True
+        logger.info("Business metrics refresher running in pid %d", os.getpid())
+        return True
+
+    def refresh(self):
+        """Recompute the gauges now and publish the new state"""
+        start = time.monotonic()
+        state = dict(self._state or {})
+        try:
+            with app.app_context():
+                state["values"] = read_business_metrics(db.session.connection())
+                db.session.rollback()
+            state["refreshed_at"] = time.time()
+        except Exception as e:
+            # Keep exporting the previous values; staleness shows the gap
+            self._failures += 1
+            logger.warning("Business metrics refresh failed: %s", e)
+        state["duration"] = time.monotonic() - start
+        state["failures"] = self._failures
+        self._state = state
+        if self.state_dir is not None:
+            path = os.path.join(self.state_dir, self.STATE_FILE)
+            with open(f"{path}.{os.getpid()}", "w") as handle:
+                json.dump(state, handle)
+            os.replace(f"{path}.{os.getpid()}", path)
+
+    def state(self):
+        """The latest published state, or None before the first refresh"""
+        if self.state_dir is None or self.leader:
+            return self._state
+        try:
+            with open(os.path.join(self.state_dir, self.STATE_FILE)) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        state = self.state()
+        if state is None:
+            return
+        for name, documentation in BUSINESS_METRICS_GAUGES:
+            if name in state.get("values", {}):
+                yield GaugeMetricFamily(name, documentation, state["values"][name])
+        if "refreshed_at" in state:
+            yield GaugeMetricFamily(
+                "inventory_metrics_staleness_seconds",
+                "Seconds since the business metrics were last refreshed",
+                max(0.0, time.time() - state["refreshed_at"]),
+            )
+        yield GaugeMetricFamily(
+            "inventory_metrics_refresh_duration_seconds",
+            "Duration of the last business metrics refresh",
+            state["duration"],
+        )
+        yield CounterMetricFamily(
+            "inventory_metrics_refresh_failures",
+            "Failed business metrics refreshes by the current refresher",
+            state["failures"],
+        )
+
+
+BUSINESS_METRICS = BusinessMetricsRefresher(
+    interval=float(os.getenv("BUSINESS_METRICS_INTERVAL", "60")),
+    state_dir=PROMETHEUS_MULTIPROC_DIR or None,
+)
+REGISTRY.register(BUSINESS_METRICS)
+
+if PROMETHEUS_MULTIPROC_DIR:
+    # Scrapes merge the workers' files; the merge only reads them, so it
+    # takes no lock a request needs. product_stock_level is read from the
+    # database, once per pod rather than once per worker.
+    SCRAPE_REGISTRY = CollectorRegistry()
+    SCRAPE_REGISTRY.register(
+        ProductSeriesFilter(
+            multiprocess.MultiProcessCollector(None), STOCK_LEVEL_COLLECTOR
+        )
+    )
+    SCRAPE_REGISTRY.register(STOCK_LEVEL_COLLECTOR)
+    SCRAPE_REGISTRY.register(BUSINESS_METRICS)
+else:
+    REGISTRY.register(
+        ProductSeriesFilter(PRODUCT_SERIES_REGISTRY, STOCK_LEVEL_COLLECTOR)
+    )
+    SCRAPE_REGISTRY = REGISTRY
+
+
+# Schema management: migrations/ is applied once per deploy with
+# ``flask migrate`` (see migrate.py) instead of on the request path
+
+
+@app.cli.command("migrate")
+@click.option("--status", is_flag=True, help="List migrations without applying")
+def migrate_command(status):
+    """Apply pending schema migrations"""
+    if status:
+        for migration, applied in migrate.migration_status(db.engine):
+            state = "applied" if applied else "pending"
+            click.echo(f"{migration.version:04d}_{migration.name}: {state}")
+        return
+
+    applied = migrate.upgrade(db.engine, log=click.echo)
+    click.echo(f"Applied {len(applied)} migration(s)" if applied else "Up to date")
 
 
 # Security headers middleware
@@ -205,11 +1580,119 @@ def add_security_headers(response):
     return response
 
 
+# Per-request SQL instrumentation. Every statement executed while a request
+# is active is counted and timed against that request. Statements run by a
+# streamed response body execute after after_request and are not included.
+REPEATED_STATEMENT_THRESHOLD = int(os.getenv("DB_REPEATED_STATEMENT_THRESHOLD", "10"))
+# Return each request's phase timings in a Server-Timing header
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+
+def query_budget(max_queries):
+    """Declare the most SQL statements one request to the endpoint may run
+
+    Exceeding the budget raises in TESTING mode, failing the test that made
+    the request; otherwise it is logged and counted.
+    """
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+# The start time lives on the statement's execution context, not on the
+# connection, so a statement that fails (no after_cursor_execute) leaves
+# nothing behind for the next statement on that pooled connection
+@sa_event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_start_time = time.perf_counter()
+
+
+@sa_event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "query_start_time", None)
+    elapsed = 0.0 if start is None else time.perf_counter() - start
+    if has_request_context() and hasattr(request, "db_statements"):
+        request.db_time += elapsed
+        request.db_statements[statement] = request.db_statements.get(statement, 0) + 1
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, charging response encoding to the request"""
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            if has_request_context() and hasattr(request, "serialize_time"):
+                request.serialize_time += time.perf_counter() - start
+
+
+app.json = TimedJSONProvider(app)
+
+
+def server_timing(total, app_time):
+    """``Server-Timing`` header value for the current request's phases"""
+    phases = [
+        ("pool", request.db_pool_wait, None),
+        ("db", request.db_time, f"{sum(request.db_statements.values())} queries"),
+        ("serialize", request.serialize_time, None),
+        ("app", app_time, None),
+        ("total", total, None),
+    ]
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" + (f';desc="{desc}"' if desc else "")
+        for name, seconds, desc in phases
+    )
+
+
+def check_query_usage(endpoint):
+    """Flag likely N+1 patterns and enforce the endpoint's query budget"""
+    statements = request.db_statements
+    if statements:
+        statement, repeats = max(statements.items(), key=lambda item: item[1])
+        if repeats >= REPEATED_STATEMENT_THRESHOLD:
+            DB_REPEATED_STATEMENTS.labels(endpoint=endpoint).inc()
+            logger.warning(
+                "Possible N+1 in %s: statement ran %d times: %s",
+                endpoint,
+                repeats,
+                " ".join(statement.split())[:200],
+            )
+
+    view = app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", None)
+    queries = sum(statements.values())
+    if budget is not None and queries > budget:
+        QUERY_BUDGET_EXCEEDED.labels(endpoint=endpoint).inc()
+        message = f"{endpoint} ran {queries} SQL statements (budget {budget})"
+        if app.config["TESTING"]:
+            raise AssertionError(
+                message
+                + ":\n"
+                + "\n".join(f"{n} x {stmt}" for stmt, n in statements.items())
+            )
+        logger.warning(message)
+
+
 # Monitoring middleware
-@app.before_request
 def before_request():
     """Start timer for request latency measurement"""
     request.start_time = time.time()
+    request.request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+    request.db_time = 0.0
+    request.db_statements = {}
+    request.db_pool_wait = 0.0
+    request.serialize_time = 0.0
+
+
+# Runs ahead of Flask-Limiter's hook, so rate-limited (429) responses are
+# timed, carry a request id and get an access-log record too
+app.before_request_funcs.setdefault(None, []).insert(0, before_request)
 
 
 @app.after_request
@@ -221,17 +1704,57 @@ def after_request(response):
             method=request.method, endpoint=request.endpoint
         ).observe(latency)
 
+        # What is left once SQL, pool checkout and JSON encoding are taken
+        # out: view logic, ORM hydration, hooks
+        app_time = max(
+            0.0,
+            latency - request.db_time - request.db_pool_wait - request.serialize_time,
+        )
+        DB_POOL_WAIT_PER_REQUEST.labels(
+            method=request.method, endpoint=request.endpoint
+        ).observe(request.db_pool_wait)
+        SERIALIZATION_TIME_PER_REQUEST.labels(
+            method=request.method, endpoint=request.endpoint
+        ).observe(request.serialize_time)
+        APP_TIME_PER_REQUEST.labels(
+            method=request.method, endpoint=request.endpoint
+        ).observe(app_time)
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(latency, app_time)
+
+    if hasattr(request, "db_statements"):
+        DB_QUERIES_PER_REQUEST.labels(
+            method=request.method, endpoint=request.endpoint
+        ).observe(sum(request.db_statements.values()))
+        DB_TIME_PER_REQUEST.labels(
+            method=request.method, endpoint=request.endpoint
+        ).observe(request.db_time)
+        check_query_usage(request.endpoint)
+
     REQUEST_COUNT.labels(
         method=request.method, endpoint=request.endpoint, status=response.status_code
     ).inc()
+
+    if hasattr(request, "request_id"):
+        response.headers[REQUEST_ID_HEADER] = request.request_id
+        log_access(
+            request.request_id,
+            request.method,
+            request.path,
+            request.endpoint,
+            response.status_code,
+            latency,
+            request.db_time,
+            sum(request.db_statements.values()),
+        )
     return response
 
 
 # Prometheus metrics endpoint
 @app.route("/metrics", methods=["GET"])
 def metrics():
-    """Prometheus metrics endpoint"""
-    return generate_latest(), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+    """Prometheus metrics endpoint (all workers in multiprocess mode)"""
+    return generate_latest(SCRAPE_REGISTRY), 200, {"Content-Type": CONTENT_TYPE_LATEST}
 
 
 # API Endpoints
@@ -247,40 +1770,272 @@ def health_check():
 # Product Management Endpoints
 
 
+# Read endpoints build their response bodies in ``read_*`` functions that
+# take a SQLAlchemy Connection, so the async serving mode (asgi.py) runs the
+# same statements and returns the same JSON through ``run_sync``.
+def read_product_page(connection, args):
+    """Response body for one page of ``GET /api/products``"""
+    query = apply_product_filters(db.select(products_table), args)
+    query = apply_keyset_page(query, args)
+    products = connection.execute(query.limit(args["limit"] + 1)).all()
+    total = count_rows(
+        connection,
+        apply_product_filters(db.select(products_table.c.id), args),
+        args["count"],
+    )
+
+    has_more = len(products) > args["limit"]
+    products = products[: args["limit"]]
+    next_cursor = None
+    if has_more:
+        last = products[-1]
+        next_cursor = encode_cursor(
+            args["sort"],
+            args["order"],
+            getattr(last, args["sort"]),
+            last.id,
+        )
+
+    response = {
+        "success": True,
+        "products": [product_row_to_dict(row) for row in products],
+        "next_cursor": next_cursor,
+        "has_more": has_more,
+    }
+    if total is not None:
+        response["total"] = total
+    return response
+
+
+def read_product(connection, product_id):
+    """Serialized product ``product_id``, or None if it does not exist"""
+    row = connection.execute(
+        db.select(products_table).where(products_table.c.id == product_id)
+    ).first()
+    return None if row is None else product_row_to_dict(row)
+
+
 @app.route("/api/products", methods=["GET"])
+@query_budget(3)
+@catalog_etag
 def get_all_products():
-    """Get all products with their stock levels"""
+    """Get a page of products using keyset (cursor) pagination
+
+    Query parameters:
+        limit: page size (default 100, max 1000)
+        cursor: opaque ``next_cursor`` value from a previous page
+        sort: name | price | stock_level | updated_at | id (default id)
+        order: asc | desc (default asc)
+        name_prefix, min_price, max_price, min_stock, max_stock,
+        low_stock (true/false), updated_since (ISO 8601): filters
+        count: exact | estimated | none (default). Adds ``total``, the
+               number of products matching the filters
+    """
     try:
-        products = Product.query.all()
-
-        # Update stock level gauges for all products
-        for product in products:
-            STOCK_LEVEL_GAUGE.labels(
-                product_id=str(product.id), product_name=product.name, sku=product.sku
-            ).set(product.stock_level)
+        args = parse_product_list_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
-        return jsonify(
-            {
-                "success": True,
-                "products": [product.to_dict() for product in products],
-                "total_count": len(products),
-            }
-        )
+    try:
+        return jsonify(read_product_page(db.session.connection(), args))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route("/api/products/<int:product_id>", methods=["GET"])
+@query_budget(1)
 def get_product(product_id):
-    """Get details of a specific product"""
+    """Get details of a specific product (served from the per-worker cache)"""
     try:
-        product = Product.query.get_or_404(product_id)
-        return jsonify({"success": True, "product": product.to_dict()})
+        PRODUCT_CACHE.ensure_listener()
+        product = PRODUCT_CACHE.get(product_id)
+        if product is None:
+            generation = PRODUCT_CACHE.generation
+            product = read_product(db.session.connection(), product_id)
+            if product is None:
+                return jsonify({"success": False, "error": "Resource not found"}), 404
+            PRODUCT_CACHE.put(product_id, product, generation)
+        return jsonify({"success": True, "product": product})
     except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 404
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+# Product search
+
+SEARCH_PAGE_DEFAULT = 20
+SEARCH_PAGE_MAX = 100
+# Deepest ranked result served; past this the client should refine the query
+SEARCH_MAX_RESULTS = 1000
+SEARCH_QUERY_MAX_LENGTH = 200
+# pg_trgm defaults for pg_trgm.similarity_threshold and
+# pg_trgm.word_similarity_threshold, which the % and <% operators use
+TRIGRAM_SIMILARITY_THRESHOLD = 0.3
+TRIGRAM_WORD_SIMILARITY_THRESHOLD = 0.6
+
+
+def parse_search_args(args):
+    """Validate query parameters for the product search endpoint"""
+    q = (args.get("q") or "").strip()
+    if not q:
+        raise ValueError("q is required")
+    if len(q) > SEARCH_QUERY_MAX_LENGTH:
+        raise ValueError(f"q must be at most {SEARCH_QUERY_MAX_LENGTH} characters")
+
+    page = args.get("page", 1, type=int)
+    per_page = args.get("per_page", SEARCH_PAGE_DEFAULT, type=int)
+    if page is None or page < 1:
+        raise ValueError("page must be a positive integer")
+    if per_page is None or not 1 <= per_page <= SEARCH_PAGE_MAX:
+        raise ValueError(f"per_page must be an integer between 1 and {SEARCH_PAGE_MAX}")
+    if page * per_page > SEARCH_MAX_RESULTS:
+        raise ValueError(f"Only the first {SEARCH_MAX_RESULTS} results can be paged")
+    return {"q": q, "page": page, "per_page": per_page}
+
+
+def search_products_postgres(connection, q, limit, offset):
+    """Rank matches with full-text rank plus trigram similarity
+
+    Every predicate is served by a GIN index (``ix_products_search_document``,
+    ``ix_products_name_trgm``, ``ix_products_sku_trgm``), so the planner
+    combines bitmap scans and only ranks the matching rows.
+    """
+    name, sku = products_table.c.name, products_table.c.sku
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    score = func.ts_rank_cd(SEARCH_DOCUMENT, tsquery) + func.greatest(
+        func.similarity(name, q),
+        func.word_similarity(q, name),
+        func.similarity(sku, q),
+    )
+    rows = connection.execute(
+        db.select(products_table, score.label("score"))
+        .where(
+            or_(
+                SEARCH_DOCUMENT.op("@@")(tsquery),
+                name.op("%")(q),
+                literal(q).op("<%")(name),
+                sku.op("%")(q),
+            )
+        )
+        .order_by(score.desc(), products_table.c.id)
+        .limit(limit)
+        .offset(offset)
+    ).all()
+    return [(row, row.score) for row in rows]
+
+
+def _search_words(value):
+    return re.findall(r"[^\W_]+", (value or "").lower())
+
+
+def _stem(word):
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def _trigrams(value):
+    """Trigram set of ``value`` the way pg_trgm builds it"""
+    grams = set()
+    for word in _search_words(value):
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def trigram_similarity(left, right):
+    """Python equivalent of pg_trgm ``similarity()``"""
+    left, right = _trigrams(left), _trigrams(right)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def search_products_fallback(connection, q, limit, offset):
+    """Same match rules and ranking as PostgreSQL, evaluated in Python
+
+    Used on SQLite (the test database), which has neither tsvector nor
+    pg_trgm. Full-text matching requires every query word (lightly stemmed)
+    in the name or description; ``word_similarity`` is approximated by the
+    best similarity against a single name word.
+    """
+    terms = [_stem(word) for word in _search_words(q)]
+    matches = []
+    for row in connection.execute(db.select(products_table)):
+        name_words = {_stem(word) for word in _search_words(row.name)}
+        description_words = {_stem(word) for word in _search_words(row.description)}
+
+        rank = 0.0
+        if terms and all(t in name_words or t in description_words for t in terms):
+            rank = sum(1.0 if t in name_words else 0.4 for t in terms) / len(terms)
+        name_similarity = trigram_similarity(row.name, q)
+        word_similarity = max(
+            (trigram_similarity(q, word) for word in _search_words(row.name)),
+            default=0.0,
+        )
+        sku_similarity = trigram_similarity(row.sku, q)
+
+        if (
+            rank
+            or name_similarity >= TRIGRAM_SIMILARITY_THRESHOLD
+            or word_similarity >= TRIGRAM_WORD_SIMILARITY_THRESHOLD
+            or sku_similarity >= TRIGRAM_SIMILARITY_THRESHOLD
+        ):
+            score = rank + max(name_similarity, word_similarity, sku_similarity)
+            matches.append((row, score))
+
+    matches.sort(key=lambda match: (-match[1], match[0].id))
+    return matches[offset : offset + limit]
+
+
+def read_search_page(connection, args):
+    """Response body for one page of ``GET /api/products/search``"""
+    if connection.dialect.name == "postgresql":
+        search = search_products_postgres
+    else:
+        search = search_products_fallback
+    offset = (args["page"] - 1) * args["per_page"]
+    matches = search(connection, args["q"], args["per_page"] + 1, offset)
+
+    has_more = len(matches) > args["per_page"]
+    products = []
+    for row, score in matches[: args["per_page"]]:
+        product = product_row_to_dict(row)
+        product["score"] = round(score, 4)
+        products.append(product)
+
+    return {
+        "success": True,
+        "query": args["q"],
+        "products": products,
+        "page": args["page"],
+        "per_page": args["per_page"],
+        "has_more": has_more,
+    }
+
+
+@app.route("/api/products/search", methods=["GET"])
+@query_budget(2)
+@catalog_etag
+def search_products():
+    """Ranked full-text and typo-tolerant product search
+
+    Query parameters:
+        q: search text (required); matches words in the name and
+           description, and names or SKUs similar to the whole query
+        page: page number (default 1)
+        per_page: page size (default 20, max 100)
+    """
+    try:
+        args = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    try:
+        return jsonify(read_search_page(db.session.connection(), args))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
 
 @app.route("/api/products", methods=["POST"])
+@query_budget(3)
 @limiter.limit("10 per minute")
 def create_product():
     """Add a new product to inventory"""
@@ -325,43 +2080,41 @@ def create_product():
                 400,
             )
 
-        # Check if SKU already exists
-        existing_product = Product.query.filter_by(sku=data["sku"]).first()
-        if existing_product:
+        # Insert unless the SKU exists (ON CONFLICT DO NOTHING), one round trip
+        product = insert_product_row(
+            {
+                "name": data["name"].strip()[:255],  # Limit name length
+                "sku": data["sku"],
+                # Limit description length
+                "description": data.get("description", "")[:1000],
+                "stock_level": int(data.get("stock_level", 0)),
+                "min_stock_threshold": int(data.get("min_stock_threshold", 10)),
+                "price": float(data.get("price", 0.0)),
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            }
+        )
+        if product is None:
+            db.session.rollback()
             return (
                 jsonify(
                     {"success": False, "error": "Product with this SKU already exists"}
                 ),
                 400,
             )
-
-        # Create new product
-        product = Product(
-            name=data["name"].strip()[:255],  # Limit name length
-            sku=data["sku"],
-            description=data.get("description", "")[:1000],  # Limit description length
-            stock_level=int(data.get("stock_level", 0)),
-            min_stock_threshold=int(data.get("min_stock_threshold", 10)),
-            price=float(data.get("price", 0.0)),
-        )
-
-        db.session.add(product)
         db.session.commit()
 
-        logger.info(f"Product created: {product.sku} - {product.name}")
+        logger.info("Product created: %s - %s", product.sku, product.name)
 
         # Update metrics
         PRODUCT_OPERATIONS.labels(operation_type="create").inc()
-        STOCK_LEVEL_GAUGE.labels(
-            product_id=str(product.id), product_name=product.name, sku=product.sku
-        ).set(product.stock_level)
 
         return (
             jsonify(
                 {
                     "success": True,
                     "message": "Product created successfully",
-                    "product": product.to_dict(),
+                    "product": product_row_to_dict(product),
                 }
             ),
             201,
@@ -369,11 +2122,12 @@ def create_product():
 
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating product: {str(e)}")
+        logger.error("Error creating product: %s", e)
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
 
 @app.route("/api/products/<int:product_id>", methods=["PUT"])
+@query_budget(5)
 def update_product(product_id):
     """Update product details or stock level"""
     try:
@@ -427,20 +2181,23 @@ def update_product(product_id):
             product.price = float(data["price"])
 
         product.updated_at = datetime.utcnow()
+        publish_product_change(product_id)
+        bump_catalog_version()
         db.session.commit()
+        PRODUCT_CACHE.invalidate(product_id)
 
-        logger.info(f"Product updated: {product.sku} - {product.name}")
+        logger.info("Product updated: %s - %s", product.sku, product.name)
 
         # Update metrics
         PRODUCT_OPERATIONS.labels(operation_type="update").inc()
-        STOCK_LEVEL_GAUGE.labels(
-            product_id=str(product.id), product_name=product.name, sku=product.sku
-        ).set(product.stock_level)
+
+        # A rename retires the series labelled with the old name
+        remove_product_series(product_id, keep_name=product.name)
 
         # Check for low stock alert
         if product.stock_level <= product.min_stock_threshold:
             LOW_STOCK_ALERTS.labels(
-                product_id=str(product.id), product_name=product.name
+                *product_series_labels(product.id, product.name)
             ).inc()
 
         return jsonify(
@@ -453,28 +2210,257 @@ def update_product(product_id):
 
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error updating product {product_id}: {str(e)}")
+        logger.error("Error updating product %s: %s", product_id, e)
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+
+BULK_UPDATE_MAX_ROWS = 10000
+BULK_UPDATE_FIELDS = (
+    "name",
+    "description",
+    "price",
+    "stock_level",
+    "min_stock_threshold",
+)
+
+
+def validate_bulk_update_row(row):
+    """Validate one bulk update row; return ``(key, values, error)``
+
+    ``key`` is ``("id", value)`` or ``("sku", value)``; ``values`` maps the
+    fields to change, using the same rules as ``update_product``.
+    """
+    if not isinstance(row, dict):
+        return None, None, "Invalid row"
+    # bool is an int subclass; JSON true must not address product 1
+    if isinstance(row.get("id"), int) and not isinstance(row["id"], bool):
+        key = ("id", row["id"])
+    elif validate_sku(row.get("sku")):
+        key = ("sku", row["sku"])
+    else:
+        return None, None, "id or a valid sku is required"
+
+    values = {}
+    if "name" in row:
+        if not isinstance(row["name"], str) or not row["name"].strip():
+            return key, None, "Name must be a non-empty string"
+        values["name"] = row["name"].strip()[:255]  # Limit name length
+    if "description" in row:
+        if not isinstance(row["description"], str):
+            return key, None, "Description must be a string"
+        values["description"] = row["description"][:1000]
+    if "price" in row:
+        if not validate_price(row["price"]):
+            return key, None, "Price must be a positive number"
+        values["price"] = float(row["price"])
+    for field in ("stock_level", "min_stock_threshold"):
+        if field in row:
+            if not validate_stock_level(row[field]):
+                label = field.replace("_", " ").capitalize()
+                return key, None, f"{label} must be a non-negative integer"
+            values[field] = int(row[field])
+    if not values:
+        return key, None, "No fields to update"
+    return key, values, None
+
+
+def bulk_validation_error(results):
+    """400 response listing the failed rows in ``results``, or None"""
+    errors = [r for r in results if r["status"] == "error"]
+    if not errors:
+        return None
+    return (
+        jsonify(
+            {
+                "success": False,
+                "error": "Validation failed; no products were updated",
+                "results": errors,
+            }
+        ),
+        400,
+    )
+
+
+@app.route("/api/products/bulk", methods=["PATCH"])
+@limiter.limit("10 per minute")
+def bulk_update_products():
+    """Update many products keyed by id or SKU
+
+    Body: ``{"products": [{"id" | "sku", <fields to change>}, ...]}``. Every
+    row is validated before anything is written; if any row is invalid the
+    request is rejected as a whole. SKUs are resolved to ids first, so an
+    id row and a SKU row naming the same product are rejected as duplicates.
+    Valid requests are applied with one ``UPDATE ... FROM (VALUES ...)`` per
+    chunk, in a single transaction. Omitted fields keep their current value.
+    """
+    data = request.get_json(silent=True)
+    rows = data.get("products") if isinstance(data, dict) else None
+    if not isinstance(rows, list) or not rows:
+        return (
+            jsonify({"success": False, "error": "products must be a non-empty list"}),
+            400,
+        )
+    if len(rows) > BULK_UPDATE_MAX_ROWS:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": f"At most {BULK_UPDATE_MAX_ROWS} products per request",
+                }
+            ),
+            400,
+        )
+
+    results = []
+    valid_rows = []
+    seen_keys = set()
+    for index, row in enumerate(rows):
+        key, values, error = validate_bulk_update_row(row)
+        if error is None and key in seen_keys:
+            error = "Duplicate product in request"
+        if error:
+            results.append({"row": index, "status": "error", "error": error})
+            continue
+        seen_keys.add(key)
+        valid_rows.append((index, key, values))
+        results.append({"row": index, "status": "not_found"})
+
+    failed = bulk_validation_error(results)
+    if failed:
+        return failed
+
+    try:
+        skus = [key[1] for _, key, _ in valid_rows if key[0] == "sku"]
+        id_by_sku = {}
+        for chunk in chunked(skus):
+            id_by_sku.update(
+                db.session.execute(
+                    db.select(products_table.c.sku, products_table.c.id).where(
+                        products_table.c.sku.in_(chunk)
+                    )
+                ).all()
+            )
+
+        updates = []
+        row_by_id = {}
+        for index, (key_name, key_value), values in valid_rows:
+            product_id = key_value if key_name == "id" else id_by_sku.get(key_value)
+            if product_id is None:
+                continue
+            if product_id in row_by_id:
+                results[index] = {
+                    "row": index,
+                    "status": "error",
+                    "error": "Duplicate product in request",
+                }
+                continue
+            row_by_id[product_id] = index
+            updates.append(
+                (product_id,) + tuple(values.get(f) for f in BULK_UPDATE_FIELDS)
+            )
+
+        failed = bulk_validation_error(results)
+        if failed:
+            db.session.rollback()
+            return failed
+
+        now = datetime.utcnow()
+        changed = []
+        field_types = {
+            "name": db.String,
+            "description": db.Text,
+            "price": db.Float,
+            "stock_level": db.Integer,
+            "min_stock_threshold": db.Integer,
+        }
+        for chunk in chunked(updates):
+            incoming = values_table(
+                "incoming",
+                [column("product_id", db.Integer)]
+                + [column(f, field_types[f]) for f in BULK_UPDATE_FIELDS],
+                chunk,
+            )
+            # NULL means "leave unchanged"; the casts type all-NULL columns
+            changed.extend(
+                db.session.execute(
+                    products_table.update()
+                    .where(products_table.c.id == incoming.c.product_id)
+                    .values(
+                        updated_at=now,
+                        **{
+                            f: func.coalesce(
+                                cast(incoming.c[f], field_types[f]),
+                                products_table.c[f],
+                            )
+                            for f in BULK_UPDATE_FIELDS
+                        },
+                    )
+                    .returning(
+                        products_table.c.id,
+                        products_table.c.name,
+                        products_table.c.sku,
+                        products_table.c.stock_level,
+                        products_table.c.min_stock_threshold,
+                    )
+                ).all()
+            )
+
+        if changed:
+            publish_product_changes(sorted(row.id for row in changed))
+            bump_catalog_version()
+        db.session.commit()
+
+        for row in changed:
+            index = row_by_id[row.id]
+            results[index] = {
+                "row": index,
+                "status": "updated",
+                "id": row.id,
+                "sku": row.sku,
+            }
+            PRODUCT_CACHE.invalidate(row.id)
+            remove_product_series(row.id, keep_name=row.name)
+            if row.stock_level <= row.min_stock_threshold:
+                LOW_STOCK_ALERTS.labels(*product_series_labels(row.id, row.name)).inc()
+        PRODUCT_OPERATIONS.labels(operation_type="update").inc(len(changed))
+
+        not_found = len(rows) - len(changed)
+        logger.info(
+            "Bulk update: %d products updated, %d not found", len(changed), not_found
+        )
+        return jsonify(
+            {
+                "success": not_found == 0,
+                "updated": len(changed),
+                "not_found": not_found,
+                "results": results,
+            }
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error applying bulk product update: %s", e)
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
 
 @app.route("/api/products/<int:product_id>", methods=["DELETE"])
+# One statement on PostgreSQL; the fallback deletes the logs, the product
+# and bumps the catalog version separately
+@query_budget(3)
 def delete_product(product_id):
     """Delete a product from inventory"""
     try:
-        product = Product.query.get_or_404(product_id)
-
-        # Delete associated restock logs first
-        RestockLog.query.filter_by(product_id=product_id).delete()
-
-        db.session.delete(product)
+        # Restock logs, product row, version bump and NOTIFY in one statement
+        product = delete_product_row(product_id)
+        if product is None:
+            db.session.rollback()
+            return jsonify({"success": False, "error": "Resource not found"}), 404
         db.session.commit()
+        PRODUCT_CACHE.invalidate(product_id)
 
         # Update metrics
         PRODUCT_OPERATIONS.labels(operation_type="delete").inc()
-        # Set stock level gauge to 0 for deleted product (Prometheus doesn't support removal)
-        STOCK_LEVEL_GAUGE.labels(
-            product_id=str(product.id), product_name=product.name, sku=product.sku
-        ).set(0)
+        remove_product_series(product_id)
 
         return jsonify({"success": True, "message": "Product deleted successfully"})
 
@@ -483,15 +2469,315 @@ def delete_product(product_id):
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# Bulk Product Import
+
+IMPORT_FORMATS = ("csv", "ndjson", "json")
+IMPORT_MAX_ERRORS = 1000
+IMPORT_COLUMNS = (
+    "name",
+    "sku",
+    "description",
+    "stock_level",
+    "min_stock_threshold",
+    "price",
+)
+
+
+def import_format_for(filename, default="csv"):
+    """Infer the import format from a file name's extension"""
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return extension if extension in IMPORT_FORMATS else default
+
+
+def read_import_records(stream, fmt):
+    """Yield ``(line_number, record)`` pairs from a text stream
+
+    CSV and NDJSON are read incrementally. A plain JSON document (a list, or
+    ``{"products": [...]}`` like sample_products.json) has to be parsed whole,
+    so prefer NDJSON or CSV for large catalogs.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+    else:
+        document = json.load(stream)
+        if isinstance(document, dict):
+            document = document.get("products", [])
+        for line_number, record in enumerate(document, 1):
+            yield line_number, record
+
+
+def validate_import_record(record):
+    """Validate one import record; return ``(row, None)`` or ``(None, error)``"""
+    if not isinstance(record, dict):
+        return None, "Malformed record"
+    name = str(record.get("name") or "").strip()
+    if not name:
+        return None, "Name is required"
+    if not validate_sku(record.get("sku")):
+        return None, "Invalid SKU format"
+
+    def field(key, default):
+        value = record.get(key)
+        return default if value in (None, "") else value
+
+    price = field("price", 0.0)
+    stock_level = field("stock_level", 0)
+    min_stock_threshold = field("min_stock_threshold", 10)
+    if not validate_price(price):
+        return None, "Price must be a positive number"
+    if not validate_stock_level(stock_level):
+        return None, "Stock level must be a non-negative integer"
+    if not validate_stock_level(min_stock_threshold):
+        return None, "Min stock threshold must be a non-negative integer"
+    return (
+        name[:255],
+        record["sku"],
+        str(record.get("description") or "")[:1000],
+        int(stock_level),
+        int(min_stock_threshold),
+        float(price),
+    ), None
+
+
+class ChunkStream:
+    """Minimal file-like ``read()`` over an iterator of text chunks, for COPY"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def csv_chunks(rows):
+    """Encode row tuples as CSV text, one chunk per BULK_CHUNK_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for chunk in iter(lambda: list(itertools.islice(rows, BULK_CHUNK_ROWS)), []):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+
+
+def copy_upsert_products(rows, now):
+    """COPY rows into a temp staging table, then upsert them on SKU
+
+    Returns ``(inserted, updated)``. When a SKU appears more than once, the
+    last line wins.
+    """
+    db.session.execute(
+        text(
+            "CREATE TEMP TABLE products_import ("
+            "line integer, name varchar(255), sku varchar(100), description text, "
+            "stock_level integer, min_stock_threshold integer, "
+            "price double precision) ON COMMIT DROP"
+        )
+    )
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(
+        "COPY products_import FROM STDIN WITH (FORMAT csv)",
+        ChunkStream(csv_chunks(rows)),
+    )
+    return db.session.execute(
+        text("""
+            WITH upserted AS (
+                INSERT INTO products (name, sku, description, stock_level,
+                                      min_stock_threshold, price,
+                                      created_at, updated_at)
+                SELECT DISTINCT ON (sku) name, sku, description, stock_level,
+                       min_stock_threshold, price, :now, :now
+                FROM products_import
+                ORDER BY sku, line DESC
+                ON CONFLICT (sku) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    description = EXCLUDED.description,
+                    stock_level = EXCLUDED.stock_level,
+                    min_stock_threshold = EXCLUDED.min_stock_threshold,
+                    price = EXCLUDED.price,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT count(*) FILTER (WHERE inserted),
+                   count(*) FILTER (WHERE NOT inserted)
+            FROM upserted
+            """),
+        {"now": now},
+    ).one()
+
+
+def chunked_upsert_products(rows, now):
+    """Upsert rows on SKU in chunks (fallback for databases without COPY)
+
+    Counts each distinct SKU once, like ``copy_upsert_products``: a SKU
+    repeated in a later chunk was already counted when it first appeared.
+    """
+    inserted = updated = 0
+    counted = set()
+    for chunk in iter(lambda: list(itertools.islice(rows, BULK_CHUNK_ROWS)), []):
+        latest = {row[2]: row for row in chunk}
+        new_skus = latest.keys() - counted
+        existing = set(
+            db.session.scalars(
+                db.select(products_table.c.sku).where(
+                    products_table.c.sku.in_(new_skus)
+                )
+            )
+        )
+        stmt = sqlite_insert(products_table)
+        db.session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[products_table.c.sku],
+                set_={
+                    key: stmt.excluded[key]
+                    for key in (
+                        "name",
+                        "description",
+                        "stock_level",
+                        "min_stock_threshold",
+                        "price",
+                        "updated_at",
+                    )
+                },
+            ),
+            [
+                dict(
+                    zip(IMPORT_COLUMNS, row[1:]),
+                    created_at=now,
+                    updated_at=now,
+                )
+                for row in latest.values()
+            ],
+        )
+        updated += len(existing)
+        inserted += len(new_skus) - len(existing)
+        counted |= new_skus
+    return inserted, updated
+
+
+def import_products(stream, fmt):
+    """Validate and upsert products from a text stream in bounded memory
+
+    Returns a report with inserted/updated/rejected counts and up to
+    IMPORT_MAX_ERRORS per-line validation errors. The caller commits.
+    """
+    report = {"inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+
+    def valid_rows():
+        for line, record in read_import_records(stream, fmt):
+            row, error = validate_import_record(record)
+            if error is None:
+                yield (line,) + row
+                continue
+            report["rejected"] += 1
+            if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                report["errors"].append({"line": line, "error": error})
+
+    upsert = copy_upsert_products if is_postgres() else chunked_upsert_products
+    report["inserted"], report["updated"] = upsert(valid_rows(), datetime.utcnow())
+    report["errors_truncated"] = report["rejected"] > len(report["errors"])
+
+    if report["inserted"] or report["updated"]:
+        publish_product_change(PRODUCT_CHANGES_ALL)
+        bump_catalog_version()
+    return report
+
+
+@app.route("/api/products/import", methods=["POST"])
+@limiter.limit("5 per minute")
+def import_products_upload():
+    """Bulk upsert products from an uploaded CSV, NDJSON or JSON file
+
+    Accepts a multipart ``file`` field or a raw request body. The format comes
+    from ``?format=`` or the uploaded file's extension (default csv).
+    """
+    upload = request.files.get("file")
+    fmt = request.args.get("format") or import_format_for(
+        upload.filename if upload else None
+    )
+    if fmt not in IMPORT_FORMATS:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": f"format must be one of: {', '.join(IMPORT_FORMATS)}",
+                }
+            ),
+            400,
+        )
+
+    try:
+        stream = io.TextIOWrapper(
+            upload.stream if upload else request.stream, encoding="utf-8", newline=""
+        )
+        report = import_products(stream, fmt)
+        db.session.commit()
+        PRODUCT_CACHE.clear()
+    except (ValueError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Unreadable file: {e}"}), 400
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error importing products: %s", e)
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+    PRODUCT_OPERATIONS.labels(operation_type="import").inc()
+    logger.info(
+        "Product import: %d inserted, %d updated, %d rejected",
+        report["inserted"],
+        report["updated"],
+        report["rejected"],
+    )
+    return jsonify({"success": True, **report})
+
+
+@app.cli.command("import-products")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS), default=None)
+def import_products_command(path, fmt):
+    """Bulk upsert products from a CSV, NDJSON or JSON file"""
+    with open(path, encoding="utf-8", newline="") as stream:
+        report = import_products(stream, fmt or import_format_for(path))
+    db.session.commit()
+    click.echo(
+        f"Inserted {report['inserted']}, updated {report['updated']}, "
+        f"rejected {report['rejected']}"
+    )
+    for error in report["errors"]:
+        click.echo(f"  line {error['line']}: {error['error']}", err=True)
+    if report["errors_truncated"]:
+        click.echo(f"  ... first {IMPORT_MAX_ERRORS} errors shown", err=True)
+
+
 # Restocking Operations
 
+BATCH_RESTOCK_MAX_LINES = 10000
+
 
 @app.route("/api/products/<int:product_id>/restock", methods=["POST"])
+@query_budget(4)
 @limiter.limit("20 per minute")
 def restock_product(product_id):
     """Restock a specific product"""
     try:
-        product = Product.query.get_or_404(product_id)
         data = request.get_json()
 
         if not data or "quantity" not in data:
@@ -508,172 +2794,639 @@ def restock_product(product_id):
 
         quantity = int(data["quantity"])
 
-        # Store previous stock level
-        previous_stock = product.stock_level
-
-        # Update stock level
-        product.stock_level += quantity
-        product.updated_at = datetime.utcnow()
-
-        # Create restock log
-        restock_log = RestockLog(
-            product_id=product_id,
-            quantity_added=quantity,
-            previous_stock=previous_stock,
-            new_stock=product.stock_level,
-            notes=data.get("notes", "")[:500],  # Limit notes length
+        # Increment in SQL and log in the same statement, so concurrent
+        # restocks of one product serialize on the row instead of losing updates
+        product, restock_log = restock_product_row(
+            product_id, quantity, data.get("notes", "")[:500]  # Limit notes length
         )
-
-        db.session.add(restock_log)
+        if product is None:
+            db.session.rollback()
+            return jsonify({"success": False, "error": "Resource not found"}), 404
         db.session.commit()
+        PRODUCT_CACHE.invalidate(product_id)
 
-        logger.info(f"Product restocked: {product.sku} - Added {quantity} units")
+        logger.info("Product restocked: %s - Added %s units", product.sku, quantity)
 
         # Update metrics
         RESTOCK_OPERATIONS.labels(
-            product_id=str(product.id), product_name=product.name
+            *product_series_labels(product.id, product.name)
         ).inc()
-        STOCK_LEVEL_GAUGE.labels(
-            product_id=str(product.id), product_name=product.name, sku=product.sku
-        ).set(product.stock_level)
 
         return jsonify(
             {
                 "success": True,
                 "message": f"Product restocked successfully. Added {quantity} units.",
-                "product": product.to_dict(),
-                "restock_log": restock_log.to_dict(),
+                "product": product_row_to_dict(product),
+                "restock_log": restock_log,
             }
         )
 
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error restocking product {product_id}: {str(e)}")
+        logger.error("Error restocking product %s: %s", product_id, e)
         return jsonify({"success": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/restocks", methods=["GET"])
-def get_restock_history():
-    """Get history of all restocking operations"""
-    try:
-        # Get query parameters for pagination
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 50, type=int)
-
-        # Query restock logs with pagination
-        restock_logs = RestockLog.query.order_by(
-            RestockLog.restocked_at.desc()
-        ).paginate(page=page, per_page=per_page, error_out=False)
+@app.route("/api/restocks/batch", methods=["POST"])
+@limiter.limit("20 per minute")
+def batch_restock():
+    """Restock many products in one transaction
+
+    Body: ``{"items": [{"product_id" | "sku", "quantity", "notes"}, ...]}``.
+    Valid lines are applied together; each line gets its own result entry.
+    Affected rows are locked in id order, incremented with one set-based
+    UPDATE per chunk, and logged with a single multi-row INSERT.
+    """
+    data = request.get_json(silent=True)
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return (
+            jsonify({"success": False, "error": "items must be a non-empty list"}),
+            400,
+        )
+    if len(items) > BATCH_RESTOCK_MAX_LINES:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "error": f"At most {BATCH_RESTOCK_MAX_LINES} items per batch",
+                }
+            ),
+            400,
+        )
 
-        return jsonify(
+    results = [None] * len(items)
+    lines = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"line": index, "status": "error", "error": "Invalid item"}
+            continue
+        quantity = item.get("quantity")
+        product_id = item.get("product_id")
+        # bool is an int subclass; JSON true must not address product 1
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            product_id = None
+        if not validate_stock_level(quantity) or int(quantity) <= 0:
+            error = "Quantity must be a positive integer"
+        elif product_id is not None:
+            error = None
+        elif validate_sku(item.get("sku")):
+            error = None
+        else:
+            error = "product_id or a valid sku is required"
+        if error:
+            results[index] = {"line": index, "status": "error", "error": error}
+            continue
+        lines.append(
             {
-                "success": True,
-                "restock_logs": [log.to_dict() for log in restock_logs.items],
-                "pagination": {
-                    "page": page,
-                    "per_page": per_page,
-                    "total": restock_logs.total,
-                    "pages": restock_logs.pages,
-                },
+                "line": index,
+                "product_id": product_id,
+                "sku": item.get("sku"),
+                "quantity": int(quantity),
+                "notes": str(item.get("notes") or "")[:500],  # Limit notes length
             }
         )
 
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
+    try:
+        # Resolve SKUs and lock every affected row in id order, so concurrent
+        # batches cannot deadlock and stock cannot change under us
+        ids = {line["product_id"] for line in lines if line["product_id"] is not None}
+        skus = {line["sku"] for line in lines if line["product_id"] is None}
+        found = db.session.execute(
+            db.select(products_table.c.id, products_table.c.sku)
+            .where(or_(products_table.c.id.in_(ids), products_table.c.sku.in_(skus)))
+            .order_by(products_table.c.id)
+            .with_for_update()
+        ).all()
+        known_ids = {row.id for row in found}
+        id_by_sku = {row.sku: row.id for row in found}
+
+        totals = {}
+        applied = []
+        for line in lines:
+            product_id = line["product_id"]
+            if product_id is None:
+                product_id = id_by_sku.get(line["sku"])
+            if product_id not in known_ids:
+                results[line["line"]] = {
+                    "line": line["line"],
+                    "status": "error",
+                    "error": "Product not found",
+                }
+                continue
+            line["product_id"] = product_id
+            totals[product_id] = totals.get(product_id, 0) + line["quantity"]
+            applied.append(line)
+
+        now = datetime.utcnow()
+        updated = {}
+        for chunk in chunked(list(totals.items())):
+            increments = values_table(
+                "increments",
+                [column("id", db.Integer), column("quantity", db.Integer)],
+                chunk,
+            )
+            for row in db.session.execute(
+                products_table.update()
+                .where(products_table.c.id == increments.c.id)
+                .values(
+                    stock_level=products_table.c.stock_level + increments.c.quantity,
+                    updated_at=now,
+                )
+                .returning(
+                    products_table.c.id,
+                    products_table.c.name,
+                    products_table.c.sku,
+                    products_table.c.stock_level,
+                )
+            ):
+                updated[row.id] = row
 
-# Analytics Endpoints
+        # Walk the lines in order to give each log its own previous/new stock
+        running = {
+            product_id: updated[product_id].stock_level - total
+            for product_id, total in totals.items()
+        }
+        logs = []
+        for line in applied:
+            previous_stock = running[line["product_id"]]
+            running[line["product_id"]] += line["quantity"]
+            logs.append(
+                {
+                    "product_id": line["product_id"],
+                    "quantity_added": line["quantity"],
+                    "previous_stock": previous_stock,
+                    "new_stock": running[line["product_id"]],
+                    "restocked_at": now,
+                    "notes": line["notes"],
+                }
+            )
 
+        if logs:
+            log_ids = db.session.scalars(
+                restock_logs_table.insert().returning(
+                    restock_logs_table.c.id, sort_by_parameter_order=True
+                ),
+                logs,
+            ).all()
+            publish_product_changes(sorted(totals))
+            bump_catalog_version()
+        else:
+            log_ids = []
+        db.session.commit()
 
-@app.route("/api/products/low-stock", methods=["GET"])
-def get_low_stock_products():
-    try:
-        low_stock_products = (
-            db.session.query(Product)
-            .filter(Product.stock_level <= Product.min_stock_threshold)
-            .all()
+        for line, log, log_id in zip(applied, logs, log_ids):
+            product = updated[line["product_id"]]
+            results[line["line"]] = {
+                "line": line["line"],
+                "status": "restocked",
+                "product_id": product.id,
+                "sku": product.sku,
+                "quantity_added": log["quantity_added"],
+                "previous_stock": log["previous_stock"],
+                "new_stock": log["new_stock"],
+                "restock_log_id": log_id,
+            }
+        for product_id in totals:
+            PRODUCT_CACHE.invalidate(product_id)
+            RESTOCK_OPERATIONS.labels(
+                *product_series_labels(product_id, updated[product_id].name)
+            ).inc(sum(1 for line in applied if line["product_id"] == product_id))
+
+        failed = len(items) - len(applied)
+        logger.info(
+            "Batch restock: %d lines applied to %d products, %d failed",
+            len(applied),
+            len(totals),
+            failed,
         )
 
-        products_data = []
-        for product in low_stock_products:
-            products_data.append(
+        return (
+            jsonify(
                 {
-                    "id": product.id,
-                    "name": product.name,
-                    "sku": product.sku,
-                    "quantity": product.stock_level,
-                    "min_stock_level": product.min_stock_threshold,
-                    "price": product.price,
+                    "success": failed == 0,
+                    "applied": len(applied),
+                    "failed": failed,
+                    "results": results,
                 }
+            ),
+            200 if applied or not failed else 400,
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error applying batch restock: %s", e)
+        return jsonify({"success": False, "error": "Internal server error"}), 500
+
+
+RESTOCK_PAGE_DEFAULT = 50
+RESTOCK_PAGE_MAX = 1000
+
+
+def parse_restock_history_args(args):
+    """Validate filters and pagination for the restock history endpoint"""
+    parsed = {}
+    for key, convert in (
+        ("product_id", int),
+        ("since", datetime.fromisoformat),
+        ("until", datetime.fromisoformat),
+    ):
+        value = args.get(key)
+        try:
+            parsed[key] = convert(value) if value not in (None, "") else None
+        except ValueError:
+            raise ValueError(f"Invalid value for {key}: {value}")
+
+    # Passing ``cursor`` or ``limit`` selects keyset pagination
+    parsed["keyset"] = "cursor" in args or "limit" in args
+    if parsed["keyset"]:
+        parsed["limit"] = args.get("limit", RESTOCK_PAGE_DEFAULT, type=int)
+        if parsed["limit"] is None or not 1 <= parsed["limit"] <= RESTOCK_PAGE_MAX:
+            raise ValueError(
+                f"limit must be an integer between 1 and {RESTOCK_PAGE_MAX}"
             )
+        cursor = args.get("cursor")
+        parsed["after"] = (
+            decode_cursor(cursor, "restocked_at", "desc") if cursor else None
+        )
+    else:
+        parsed["page"] = max(args.get("page", 1, type=int), 1)
+        per_page = args.get("per_page", RESTOCK_PAGE_DEFAULT, type=int)
+        parsed["per_page"] = min(per_page, RESTOCK_PAGE_MAX) if per_page >= 1 else 20
+    parsed["count"] = parse_count_mode(args, "none" if parsed["keyset"] else "exact")
+    return parsed
+
+
+def apply_restock_filters(query, args):
+    """Apply the product and ``[since, until)`` filters to a restock query"""
+    if args["product_id"] is not None:
+        query = query.where(restock_logs_table.c.product_id == args["product_id"])
+    if args["since"] is not None:
+        query = query.where(restock_logs_table.c.restocked_at >= args["since"])
+    if args["until"] is not None:
+        query = query.where(restock_logs_table.c.restocked_at < args["until"])
+    return query
+
+
+def read_restock_history(connection, args):
+    """Response body for ``GET /api/restocks`` in either pagination mode"""
+    restocked_at = restock_logs_table.c.restocked_at
+    log_id = restock_logs_table.c.id
+    query = apply_restock_filters(select_restock_rows(), args).order_by(
+        restocked_at.desc(), log_id.desc()
+    )
+    total = count_rows(
+        connection, apply_restock_filters(db.select(log_id), args), args["count"]
+    )
 
-        return jsonify({"success": True, "products": products_data})
+    if args["keyset"]:
+        if args["after"] is not None:
+            value, last_id = args["after"]
+            query = query.where(
+                and_(
+                    restocked_at <= value,
+                    or_(restocked_at < value, log_id < last_id),
+                )
+            )
+        rows = connection.execute(query.limit(args["limit"] + 1)).all()
+
+        has_more = len(rows) > args["limit"]
+        rows = rows[: args["limit"]]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                "restocked_at", "desc", last.restocked_at, last.id
+            )
+        response = {
+            "success": True,
+            "restock_logs": [restock_row_to_dict(row) for row in rows],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+        if total is not None:
+            response["total"] = total
+        return response
+
+    page, per_page = args["page"], args["per_page"]
+    rows = connection.execute(
+        query.limit(per_page + 1).offset((page - 1) * per_page)
+    ).all()
+    has_next = len(rows) > per_page
+
+    return {
+        "success": True,
+        "restock_logs": [restock_row_to_dict(row) for row in rows[:per_page]],
+        "pagination": {
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "pages": None if total is None else math.ceil(total / per_page),
+            "has_next": has_next,
+            "count": args["count"],
+        },
+    }
+
+
+@app.route("/api/restocks", methods=["GET"])
+@query_budget(2)
+def get_restock_history():
+    """Get restocking history, newest first
+
+    Query parameters:
+        product_id: only restocks of this product
+        since, until: ISO 8601 bounds on restocked_at (since inclusive,
+                      until exclusive)
+        page, per_page: offset pagination (default)
+        limit, cursor: keyset pagination; pass ``next_cursor`` from the
+                       previous page. Cost does not grow with depth.
+        count: exact | estimated | none. How ``total`` is computed; defaults
+               to exact for page/per_page and none for keyset pages.
+
+    Both modes read ``ix_restock_logs_product_restocked_at`` (or
+    ``ix_restock_logs_restocked_at`` without ``product_id``) in index order.
+    """
+    try:
+        args = parse_restock_history_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
+    try:
+        return jsonify(read_restock_history(db.session.connection(), args))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/products/analytics", methods=["GET"])
-def get_stock_analytics():
-    """Get stock analytics and trends"""
+# Export Endpoints
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+PRODUCT_EXPORT_FIELDS = [
+    "id",
+    "name",
+    "sku",
+    "description",
+    "stock_level",
+    "min_stock_threshold",
+    "price",
+    "created_at",
+    "updated_at",
+    "is_low_stock",
+]
+RESTOCK_EXPORT_FIELDS = [
+    "id",
+    "product_id",
+    "product_name",
+    "product_sku",
+    "quantity_added",
+    "previous_stock",
+    "new_stock",
+    "restocked_at",
+    "notes",
+]
+
+
+def parse_export_args(args):
+    """Validate the ``format``, ``since`` and ``product_id`` export parameters
+
+    Returns ``(format, since, product_id)``; ``product_id`` only filters the
+    restock export.
+    """
+    fmt = args.get("format", "ndjson").lower()
+    if fmt not in EXPORT_CONTENT_TYPES:
+        raise ValueError("format must be 'ndjson' or 'csv'")
+    parsed = {}
+    for key, convert in (("since", datetime.fromisoformat), ("product_id", int)):
+        value = args.get(key)
+        try:
+            parsed[key] = convert(value) if value not in (None, "") else None
+        except ValueError:
+            raise ValueError(f"Invalid value for {key}: {value}")
+    return fmt, parsed["since"], parsed["product_id"]
+
+
+def stream_export(stmt, row_to_dict, fieldnames, fmt, filename):
+    """Stream a select as NDJSON or CSV from a server-side cursor
+
+    ``yield_per`` makes the driver use a named (server-side) cursor, so only
+    one chunk of rows is held in worker memory at a time. The response has no
+    Content-Length and is sent with chunked transfer encoding.
+    """
+
+    def generate():
+        result = db.session.execute(stmt.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+            writer.writeheader()
+            yield buffer.getvalue()
+        for rows in result.partitions():
+            if fmt == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(row_to_dict(row) for row in rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(json.dumps(row_to_dict(row)) + "\n" for row in rows)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_CONTENT_TYPES[fmt],
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}.{fmt}",
+        },
+    )
+
+
+@app.route("/api/export/products", methods=["GET"])
+@limiter.limit("10 per minute")
+def export_products():
+    """Stream the product catalog as NDJSON or CSV
+
+    Query parameters:
+        format: ndjson | csv (default ndjson)
+        since: only products updated at or after this ISO 8601 timestamp
+    """
     try:
-        # Basic analytics
-        total_products = Product.query.count()
-        low_stock_count = Product.query.filter(
-            Product.stock_level <= Product.min_stock_threshold
-        ).count()
+        fmt, since, _ = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    stmt = db.select(products_table).order_by(products_table.c.id)
+    if since is not None:
+        stmt = stmt.where(products_table.c.updated_at >= since)
+    return stream_export(
+        stmt, product_row_to_dict, PRODUCT_EXPORT_FIELDS, fmt, "products"
+    )
 
-        # Total stock value
-        total_stock_value = (
-            db.session.query(func.sum(Product.stock_level * Product.price)).scalar()
-            or 0
-        )
 
-        # Recent restocking activity (last 30 days)
-        from datetime import timedelta
+@app.route("/api/export/restocks", methods=["GET"])
+@limiter.limit("10 per minute")
+def export_restocks():
+    """Stream restock logs as NDJSON or CSV
+
+    Query parameters:
+        format: ndjson | csv (default ndjson)
+        since: only restocks at or after this ISO 8601 timestamp
+        product_id: only restocks of this product
+    """
+    try:
+        fmt, since, product_id = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    stmt = select_restock_rows().order_by(restock_logs_table.c.id)
+    if since is not None:
+        stmt = stmt.where(restock_logs_table.c.restocked_at >= since)
+    if product_id is not None:
+        stmt = stmt.where(restock_logs_table.c.product_id == product_id)
+    return stream_export(
+        stmt, restock_row_to_dict, RESTOCK_EXPORT_FIELDS, fmt, "restocks"
+    )
 
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        recent_restocks = RestockLog.query.filter(
-            RestockLog.restocked_at >= thirty_days_ago
-        ).count()
 
-        # Top 5 products by stock level
-        top_stock_products = (
-            Product.query.order_by(Product.stock_level.desc()).limit(5).all()
-        )
+# Analytics Endpoints
 
-        # Products with zero stock
-        out_of_stock_count = Product.query.filter(Product.stock_level == 0).count()
 
-        return jsonify(
-            {
-                "success": True,
-                "analytics": {
-                    "total_products": total_products,
-                    "low_stock_count": low_stock_count,
-                    "out_of_stock_count": out_of_stock_count,
-                    "total_stock_value": round(total_stock_value, 2),
-                    "recent_restocks_30_days": recent_restocks,
-                    "low_stock_percentage": round(
-                        (
-                            (low_stock_count / total_products * 100)
-                            if total_products > 0
-                            else 0
-                        ),
-                        2,
-                    ),
-                    "top_stock_products": [
-                        {
-                            "name": product.name,
-                            "sku": product.sku,
-                            "stock_level": product.stock_level,
-                        }
-                        for product in top_stock_products
-                    ],
-                },
-            }
+def parse_low_stock_args(args):
+    """Validate the optional ``limit`` of the low-stock endpoint"""
+    limit = args.get("limit", type=int)
+    if "limit" in args and (limit is None or limit < 1):
+        raise ValueError("limit must be a positive integer")
+    return {"limit": limit}
+
+
+def read_low_stock(connection, args):
+    """Response body for ``GET /api/products/low-stock``"""
+    rows = connection.execute(
+        db.select(
+            products_table.c.id,
+            products_table.c.name,
+            products_table.c.sku,
+            products_table.c.stock_level,
+            products_table.c.min_stock_threshold,
+            products_table.c.price,
         )
+        .where(Product.is_low_stock)
+        .order_by(LOW_STOCK_SEVERITY, products_table.c.id)
+        .limit(args["limit"])
+    ).all()
+
+    products_data = [
+        {
+            "id": row.id,
+            "name": row.name,
+            "sku": row.sku,
+            "quantity": row.stock_level,
+            "min_stock_level": row.min_stock_threshold,
+            "price": row.price,
+            "is_low_stock": True,
+        }
+        for row in rows
+    ]
+    return {"success": True, "products": products_data}
+
+
+def read_stock_analytics(connection):
+    """Response body for ``GET /api/products/analytics``"""
+    # One statement: product aggregates via FILTER clauses and the
+    # restock count as a scalar subquery, LEFT JOINed to the top 5
+    # products so every returned row carries the aggregates. The restock
+    # window starts at midnight UTC so the body only changes with the
+    # catalog version or the date, both of which are in its ETag.
+    thirty_days_ago = datetime.combine(
+        datetime.utcnow().date() - timedelta(days=30), datetime.min.time()
+    )
+    stats = db.select(
+        func.count().label("total_products"),
+        func.count().filter(Product.is_low_stock).label("low_stock_count"),
+        func.count().filter(Product.stock_level == 0).label("out_of_stock_count"),
+        func.coalesce(func.sum(Product.stock_level * Product.price), 0).label(
+            "total_stock_value"
+        ),
+    ).subquery("stats")
+    recent_restocks_count = (
+        db.select(func.count())
+        .where(RestockLog.restocked_at >= thirty_days_ago)
+        .scalar_subquery()
+    )
+    top = (
+        db.select(Product.id, Product.name, Product.sku, Product.stock_level)
+        .order_by(Product.stock_level.desc(), Product.id)
+        .limit(5)
+        .subquery("top")
+    )
+    rows = connection.execute(
+        db.select(
+            stats,
+            recent_restocks_count.label("recent_restocks"),
+            top.c.name,
+            top.c.sku,
+            top.c.stock_level,
+        )
+        .select_from(stats.outerjoin(top, true()))
+        .order_by(top.c.stock_level.desc(), top.c.id)
+    ).all()
+
+    first = rows[0]
+    total_products = first.total_products
+    low_stock_count = first.low_stock_count
+    out_of_stock_count = first.out_of_stock_count
+    total_stock_value = first.total_stock_value
+    recent_restocks = first.recent_restocks
+    top_stock_products = [row for row in rows if row.sku is not None]
+
+    return {
+        "success": True,
+        "analytics": {
+            "total_products": total_products,
+            "low_stock_count": low_stock_count,
+            "out_of_stock_count": out_of_stock_count,
+            "total_stock_value": round(total_stock_value, 2),
+            "recent_restocks_30_days": recent_restocks,
+            "low_stock_percentage": round(
+                ((low_stock_count / total_products * 100) if total_products > 0 else 0),
+                2,
+            ),
+            "top_stock_products": [
+                {
+                    "name": product.name,
+                    "sku": product.sku,
+                    "stock_level": product.stock_level,
+                }
+                for product in top_stock_products
+            ],
+        },
+    }
+
+
+@app.route("/api/products/low-stock", methods=["GET"])
+@query_budget(2)
+@catalog_etag
+def get_low_stock_products():
+    """Get low-stock products, most severe shortfall first
+
+    Reads only the ``ix_products_low_stock_severity`` partial index. An
+    optional ``limit`` query parameter caps the number of rows returned.
+    """
+    try:
+        args = parse_low_stock_args(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
+    try:
+        return jsonify(read_low_stock(db.session.connection(), args))
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route("/api/products/analytics", methods=["GET"])
+@query_budget(2)
+@catalog_etag
+def get_stock_analytics():
+    """Get stock analytics and trends"""
+    try:
+        return jsonify(read_stock_analytics(db.session.connection()))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -691,8 +3444,9 @@ def internal_error(error):
 
 if __name__ == "__main__":
     # Run the Flask application
+    BUSINESS_METRICS.start()
     app.run(
         host="0.0.0.0",
         port=5000,
         debug=os.getenv("FLASK_DEBUG", "False").lower() == "true",
-    )
\ No newline at end of file
+    )
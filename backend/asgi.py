@@ -0,0 +1,344 @@
+"""
+ASGI serving mode for the inventory API
+
+The read endpoints run natively on asyncio with an async database driver
+(asyncpg on PostgreSQL, aiosqlite on SQLite) and a shared connection pool,
+so a worker keeps serving other requests while one waits on the database.
+They execute the same ``read_*`` functions, validators, ETags and rate
+limits as ``app.py`` through ``AsyncConnection.run_sync`` and return
+byte-identical JSON. Every other route (writes, imports, exports,
+``/metrics``) is served by the Flask app itself through a WSGI adapter, so
+both modes expose the same API:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 4
+
+Pool size per worker: ASYNC_DB_POOL_SIZE (default 10) and
+ASYNC_DB_MAX_OVERFLOW (default 20). WSGI_FALLBACK_THREADS (default 10) caps
+concurrent requests handed to Flask.
+"""
+
+import functools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from limits import parse
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.http import parse_etags, quote_etag
+
+import ratelimit_storage
+from app import (
+    BUSINESS_METRICS,
+    DEFAULT_RATE_LIMITS,
+    LOCAL_CATALOG_VERSION,
+    PRODUCT_CACHE,
+    REQUEST_COUNT,
+    REQUEST_ID_HEADER,
+    REQUEST_LATENCY,
+    add_security_headers,
+)
+from app import app as flask_app
+from app import (
+    catalog_etag_value,
+    db,
+    get_catalog_version,
+    limiter,
+    log_access,
+    new_request_id,
+    parse_low_stock_args,
+    parse_product_list_args,
+    parse_restock_history_args,
+    parse_search_args,
+    read_low_stock,
+    read_product,
+    read_product_page,
+    read_restock_history,
+    read_search_page,
+    read_stock_analytics,
+)
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+RATE_LIMIT_ITEMS = [parse(limit) for limit in DEFAULT_RATE_LIMITS]
+
+
+class JSONResponse(Response):
+    """JSON encoded exactly as Flask's ``jsonify`` encodes it"""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return flask_app.json.response(content).get_data()
+
+
+def async_database_url(url):
+    """Swap the sync driver in ``url`` for its asyncio counterpart"""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def create_engine_for(url):
+    """Async engine with the same pool policy as the Flask app's engine"""
+    options = {}
+    if url.get_backend_name() == "postgresql":
+        options = {
+            "pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "20")),
+            "pool_recycle": 3600,
+            "pool_pre_ping": True,
+        }
+    return create_async_engine(url, **options)
+
+
+# Rate limits: the Flask app's default limits, hit with the same
+# ``(remote address, endpoint)`` key in the same storage, so a client's
+# budget is shared between both modes and the WSGI routes.
+def exhausted_limit(key, endpoint):
+    """Hit every default limit; return the first one exceeded, if any"""
+    for item in RATE_LIMIT_ITEMS:
+        if not limiter.limiter.hit(item, key, endpoint):
+            return item
+    return None
+
+
+async def check_rate_limits(request, endpoint):
+    """Return a 429 response if the client is over a default limit"""
+    if not limiter.enabled:
+        return None
+    key = request.client.host if request.client else "127.0.0.1"
+    if isinstance(limiter.limiter.storage, ratelimit_storage.PostgresStorage):
+        # A database round trip: keep it off the event loop
+        item = await run_in_threadpool(exhausted_limit, key, endpoint)
+    else:
+        item = exhausted_limit(key, endpoint)
+    if item is None:
+        return None
+    error = TooManyRequests(description=str(item))
+    return Response(
+        error.get_body(), status_code=429, headers=dict(error.get_headers())
+    )
+
+
+def api_view(endpoint):
+    """Apply the Flask app's rate limits, security headers, request metrics
+    and access log to a native route, reported under the Flask endpoint name"""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            start_time = time.time()
+            request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+            response = await check_rate_limits(request, endpoint)
+            if response is None:
+                try:
+                    response = await handler(request)
+                except Exception:
+                    # Same body as the Flask app's 500 error handler
+                    logger.exception(
+                        "Exception on %s [%s]", request.url.path, request.method
+                    )
+                    response = error_response("Internal server error", 500)
+            add_security_headers(response)
+            response.headers[REQUEST_ID_HEADER] = request_id
+            latency = time.time() - start_time
+            REQUEST_LATENCY.labels(method=request.method, endpoint=endpoint).observe(
+                latency
+            )
+            REQUEST_COUNT.labels(
+                method=request.method, endpoint=endpoint, status=response.status_code
+            ).inc()
+            log_access(
+                request_id,
+                request.method,
+                request.url.path,
+                endpoint,
+                response.status_code,
+                latency,
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def error_response(error, status_code):
+    return JSONResponse({"success": False, "error": str(error)}, status_code)
+
+
+async def read_response(request, endpoint, reader, parse_args=None, etag=False):
+    """Run ``reader`` on a pooled connection and answer like the Flask view
+
+    With ``etag`` the catalog version is taken first (the worker's
+    in-process copy, or the database while that is unknown) and a matching
+    ``If-None-Match`` short-circuits with 304 before any connection is used.
+    """
+    engine = request.app.state.engine
+    if etag:
+        version = LOCAL_CATALOG_VERSION.value
+        if version is None:
+            async with engine.connect() as connection:
+                version = await connection.run_sync(get_catalog_version)
+        tag = catalog_etag_value(endpoint, version, request.scope["query_string"])
+        if tag in parse_etags(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers={"ETag": quote_etag(tag)})
+
+    reader_args = ()
+    if parse_args is not None:
+        try:
+            query = MultiDict(request.query_params.multi_items())
+            reader_args = (parse_args(query),)
+        except ValueError as e:
+            return error_response(e, 400)
+
+    async with engine.connect() as connection:
+        try:
+            body = await connection.run_sync(reader, *reader_args)
+        except Exception as e:
+            return error_response(e, 500)
+
+    response = JSONResponse(body)
+    if etag:
+        response.headers["ETag"] = quote_etag(tag)
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@api_view("health_check")
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse({"status": "healthy", "message": "Inventory API is running"})
+
+
+@api_view("get_all_products")
+async def get_all_products(request):
+    """Keyset-paginated product listing (see ``app.get_all_products``)"""
+    return await read_response(
+        request,
+        "get_all_products",
+        read_product_page,
+        parse_product_list_args,
+        etag=True,
+    )
+
+
+@api_view("search_products")
+async def search_products(request):
+    """Ranked product search (see ``app.search_products``)"""
+    return await read_response(
+        request, "search_products", read_search_page, parse_search_args, etag=True
+    )
+
+
+@api_view("get_low_stock_products")
+async def get_low_stock_products(request):
+    """Low-stock products, most severe first (see ``app.get_low_stock_products``)"""
+    return await read_response(
+        request,
+        "get_low_stock_products",
+        read_low_stock,
+        parse_low_stock_args,
+        etag=True,
+    )
+
+
+@api_view("get_stock_analytics")
+async def get_stock_analytics(request):
+    """Stock analytics (see ``app.get_stock_analytics``)"""
+    return await read_response(
+        request, "get_stock_analytics", read_stock_analytics, etag=True
+    )
+
+
+@api_view("get_restock_history")
+async def get_restock_history(request):
+    """Restock history, newest first (see ``app.get_restock_history``)"""
+    return await read_response(
+        request,
+        "get_restock_history",
+        read_restock_history,
+        parse_restock_history_args,
+    )
+
+
+@api_view("get_product")
+async def get_product(request):
+    """Product details, served from the per-worker product cache"""
+    product_id = request.path_params["product_id"]
+    try:
+        product = PRODUCT_CACHE.get(product_id)
+        if product is None:
+            generation = PRODUCT_CACHE.generation
+            async with request.app.state.engine.connect() as connection:
+                product = await connection.run_sync(read_product, product_id)
+            if product is None:
+                return error_response("Resource not found", 404)
+            PRODUCT_CACHE.put(product_id, product, generation)
+        return JSONResponse({"success": True, "product": product})
+    except Exception as e:
+        return error_response(e, 500)
+
+
+@asynccontextmanager
+async def lifespan(starlette_app):
+    # The cache invalidation listener is a thread on the Flask app's sync
+    # engine, shared with the write routes served through Flask
+    with flask_app.app_context():
+        PRODUCT_CACHE.ensure_listener()
+    BUSINESS_METRICS.start()
+    yield
+    await starlette_app.state.engine.dispose()
+
+
+def create_app(database_url=None):
+    """Build the ASGI app on ``database_url``, by default the database the
+    Flask app is configured for"""
+    routes = [
+        Route("/api/health", health_check, methods=["GET"]),
+        Route("/api/products", get_all_products, methods=["GET"]),
+        Route("/api/products/search", search_products, methods=["GET"]),
+        Route("/api/products/low-stock", get_low_stock_products, methods=["GET"]),
+        Route("/api/products/analytics", get_stock_analytics, methods=["GET"]),
+        Route("/api/products/{product_id:int}", get_product, methods=["GET"]),
+        Route("/api/restocks", get_restock_history, methods=["GET"]),
+        # Paths or methods not matched above fall through to Flask
+        Mount(
+            "/",
+            WSGIMiddleware(
+                flask_app, workers=int(os.getenv("WSGI_FALLBACK_THREADS", "10"))
+            ),
+        ),
+    ]
+    starlette_app = Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(
+                CORSMiddleware,
+                allow_origins=["*"],
+                allow_methods=["*"],
+                allow_headers=["*"],
+            )
+        ],
+        lifespan=lifespan,
+    )
+    if database_url is None:
+        with flask_app.app_context():
+            database_url = db.engine.url
+    starlette_app.state.engine = create_engine_for(async_database_url(database_url))
+    return starlette_app
+
+
+app = create_app()
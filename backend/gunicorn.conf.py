@@ -0,0 +1,197 @@
+"""
+Gunicorn configuration sized from the container's CPU quota
+
+    gunicorn -c gunicorn.conf.py
+
+Workers and threads are derived from the cgroup CPU limit (cgroup v2
+``cpu.max`` or v1 ``cpu.cfs_quota_us``), falling back to the CPUs this
+process may run on, so a 500m pod does not start one worker per host core.
+Each worker's SQLAlchemy pool is then sized so that every worker of every
+replica together stays within ``DB_CONNECTION_BUDGET`` connections, and the
+plan is logged when the master starts.
+
+Environment:
+    GUNICORN_WORKER_CLASS  gthread (default), sync or
+                           uvicorn.workers.UvicornWorker (serves asgi:app)
+    GUNICORN_WORKERS       override the derived worker count
+    GUNICORN_THREADS       threads per gthread worker (default 4)
+    GUNICORN_BIND          default 0.0.0.0:5000
+    GUNICORN_TIMEOUT       default 120 seconds
+    DB_CONNECTION_BUDGET   connections all replicas may hold (default 80)
+    DB_REPLICAS            replicas sharing the budget (default 1)
+    PROMETHEUS_MULTIPROC_DIR
+                           where workers write their metrics for /metrics
+                           to merge (default /tmp/prometheus-multiproc;
+                           set it empty for per-worker registries)
+    BUSINESS_METRICS_INTERVAL
+                           seconds between inventory gauge refreshes by
+                           the pod's one refresher (default 60; 0 disables)
+
+Explicit DB_POOL_SIZE / DB_MAX_OVERFLOW (and the ASYNC_DB_* equivalents)
+take precedence over the computed pool sizes.
+"""
+
+import glob
+import math
+import os
+
+from ratelimit_storage import PostgresStorage
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+UVICORN_WORKER = "uvicorn.workers.UvicornWorker"
+# Postgres connections a worker holds outside its SQLAlchemy pool
+LISTENER_CONNECTIONS = 1  # product cache LISTEN connection
+RATELIMIT_CONNECTIONS = PostgresStorage.DEFAULT_MAX_CONNECTIONS
+
+
+def cgroup_cpu_limit(root=CGROUP_ROOT):
+    """CPUs allowed by the cgroup quota, or None when unlimited"""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open(os.path.join(root, "cpu.max")) as handle:
+            quota, period = handle.read().split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1: quota is -1 when unlimited
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as handle:
+            quota = int(handle.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as handle:
+            period = int(handle.read())
+    except (OSError, ValueError):
+        return None
+    return quota / period if quota > 0 and period > 0 else None
+
+
+def available_cpus(root=CGROUP_ROOT):
+    """CPU budget of this container: the cgroup quota capped by affinity"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(root)
+    return min(limit, cpus) if limit else float(cpus)
+
+
+def worker_plan(cpus, worker_class, env):
+    """Return ``(workers, threads)`` for ``cpus`` CPUs"""
+    if worker_class == UVICORN_WORKER:
+        # One event loop per CPU; concurrency comes from asyncio
+        workers, threads = max(1, math.ceil(cpus)), 1
+    elif worker_class == "gthread":
+        workers, threads = math.ceil(2 * cpus) + 1, int(env.get("GUNICORN_THREADS", 4))
+    else:
+        workers, threads = math.ceil(2 * cpus) + 1, 1
+    return int(env.get("GUNICORN_WORKERS", workers)), threads
+
+
+def pool_plan(workers, threads, worker_class, env):
+    """Split the connection budget into per-worker pool settings
+
+    Returns the environment variables app.py (and asgi.py) read their pool
+    sizes from, and the connections a worker holds outside its pools.
+    """
+    budget = int(env.get("DB_CONNECTION_BUDGET", 80))
+    replicas = max(1, int(env.get("DB_REPLICAS", 1)))
+    reserved = LISTENER_CONNECTIONS if int(env.get("PRODUCT_CACHE_SIZE", 1)) else 0
+    if env.get("RATELIMIT_STORAGE_URI", "").startswith("postgresql"):
+        reserved += RATELIMIT_CONNECTIONS
+    available = max(1, budget // replicas // workers - reserved)
+
+    if worker_class == UVICORN_WORKER:
+        # The async engine serves the native routes; the sync engine only the
+        # routes delegated to Flask, so it gets a quarter of the share
+        fallback = max(1, available // 4)
+        async_pool = max(1, available - fallback)
+        plan = {
+            "DB_POOL_SIZE": fallback,
+            "DB_MAX_OVERFLOW": 0,
+            "ASYNC_DB_POOL_SIZE": async_pool,
+            "ASYNC_DB_MAX_OVERFLOW": 0,
+        }
+    else:
+        # A request holds one connection, so a pool as large as the thread
+        # count never waits; overflow absorbs streamed responses that
+        # finish after their thread moved on
+        pool_size = min(threads, available)
+        plan = {
+            "DB_POOL_SIZE": pool_size,
+            "DB_MAX_OVERFLOW": min(pool_size, available - pool_size),
+        }
+    return plan, reserved
+
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+cpu_budget = available_cpus()
+workers, threads = worker_plan(cpu_budget, worker_class, os.environ)
+wsgi_app = "asgi:app" if worker_class == UVICORN_WORKER else "app:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+_pool, _reserved = pool_plan(workers, threads, worker_class, os.environ)
+for _name, _value in _pool.items():
+    # Workers are forked from the master and inherit its environment
+    os.environ.setdefault(_name, str(_value))
+# Must be in the environment before a worker imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+_budget = int(os.getenv("DB_CONNECTION_BUDGET", "80"))
+_replicas = max(1, int(os.getenv("DB_REPLICAS", "1")))
+_per_worker = sum(int(os.environ[name]) for name in _pool) + _reserved
+
+
+def on_starting(server):
+    """Reset the metrics directory and log the plan once, from the master"""
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    if metrics_dir:
+        # Files left by a previous run would be merged into this one's totals
+        os.makedirs(metrics_dir, exist_ok=True)
+        stale = glob.glob(os.path.join(metrics_dir, "*.db"))
+        stale += glob.glob(os.path.join(metrics_dir, "business-metrics.json"))
+        for path in stale:
+            os.remove(path)
+        server.log.info("Prometheus multiprocess metrics in %s", metrics_dir)
+    pools = ", ".join(f"{name}={os.environ[name]}" for name in _pool)
+    server.log.info(
+        "Serving %s with %d %s worker(s) x %d thread(s) for %.2f CPU(s)",
+        wsgi_app,
+        workers,
+        worker_class,
+        threads,
+        cpu_budget,
+    )
+    server.log.info(
+        "DB pool per worker: %s; up to %d connection(s) per worker, %d per pod, "
+        "%d across %d replica(s) (budget %d)",
+        pools,
+        _per_worker,
+        _per_worker * workers,
+        _per_worker * workers * _replicas,
+        _replicas,
+        _budget,
+    )
+    if _per_worker * workers * _replicas > _budget:
+        server.log.warning(
+            "DB connection budget %d is too small for %d worker(s) x %d "
+            "replica(s); lower GUNICORN_WORKERS or raise DB_CONNECTION_BUDGET",
+            _budget,
+            workers,
+            _replicas,
+        )
+
+
+def post_worker_init(worker):
+    """Start the worker's business metrics refresher; one per pod leads"""
+    from app import BUSINESS_METRICS
+
+    BUSINESS_METRICS.start()
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges; its counters stay in the totals"""
+    if os.environ["PROMETHEUS_MULTIPROC_DIR"]:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
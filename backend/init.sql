@@ -1,4 +1,9 @@
 -- Database initialization script for Inventory Management System
+--
+-- The schema is owned by the versioned migrations in migrations/ and applied
+-- with `flask migrate`. This file mirrors their end state so the docker-compose
+-- database comes up with sample data; every migration is idempotent, so the
+-- runner simply records them as applied against a database created here.
 
 -- Create extension for UUID generation (optional, for future use)
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
@@ -13,9 +18,29 @@ CREATE TABLE IF NOT EXISTS products (
     min_stock_threshold INTEGER DEFAULT 10,
     price FLOAT DEFAULT 0.0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_low_stock BOOLEAN GENERATED ALWAYS AS (stock_level <= min_stock_threshold) STORED
 );
 
+-- Partial index over low-stock rows only, ordered by severity
+-- (must match ix_products_low_stock_severity in app.py)
+CREATE INDEX IF NOT EXISTS ix_products_low_stock_severity
+    ON products ((stock_level - min_stock_threshold), id)
+    WHERE is_low_stock;
+
+-- Full-text and trigram indexes for product search
+-- (must match SEARCH_DOCUMENT and the *_trgm indexes in app.py)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS ix_products_search_document
+    ON products USING gin ((
+        setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+    ));
+
+CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_products_sku_trgm ON products USING gin (sku gin_trgm_ops);
+
 -- Create restock_logs table
 CREATE TABLE IF NOT EXISTS restock_logs (
     id SERIAL PRIMARY KEY,
@@ -27,8 +52,45 @@ CREATE TABLE IF NOT EXISTS restock_logs (
     notes TEXT
 );
 
+-- Restock history, newest first, per product and across the catalog
+-- (must match the ix_restock_logs_* indexes in app.py)
+CREATE INDEX IF NOT EXISTS ix_restock_logs_product_restocked_at
+    ON restock_logs (product_id, restocked_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ix_restock_logs_restocked_at
+    ON restock_logs (restocked_at DESC, id DESC);
+
+-- Create catalog_version table (single-row counter bumped on every catalog
+-- write; read endpoints derive their ETags from it)
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING;
+
+-- Announce every new catalog version so workers can keep it in memory
+-- (migrations/0008)
+CREATE OR REPLACE FUNCTION notify_catalog_version() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalog_version', NEW.version::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS catalog_version_notify ON catalog_version;
+
+CREATE TRIGGER catalog_version_notify
+AFTER INSERT OR UPDATE ON catalog_version
+FOR EACH ROW EXECUTE FUNCTION notify_catalog_version();
+
+-- Rate-limit counters shared across pods (RATELIMIT_STORAGE_URI=postgresql://...)
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count BIGINT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
 -- Insert sample data for testing (optional)
--- This will be executed after tables are created by SQLAlchemy
 
 INSERT INTO products (name, sku, description, stock_level, min_stock_threshold, price) VALUES
 ('Laptop Computer', 'LAP001', 'High-performance laptop for business use', 25, 5, 899.99),
@@ -1,5 +1,15 @@
 """
 Performance testing with Locust for Smart Retail App
+
+Both serving modes expose the same API, so the same scenarios compare them
+at equal CPU (docker compose runs Flask on :5000 and the ASGI mode on :5001,
+both through gunicorn.conf.py under the same CPU limit):
+
+    locust -f locustfile.py --host http://localhost:5000   # Flask, gthread workers
+    locust -f locustfile.py --host http://localhost:5001   # asgi.py, uvicorn workers
+
+Requests are named by route, so the per-endpoint statistics of two runs line
+up row for row.
 """
 
 import random
@@ -53,7 +63,18 @@ class SmartRetailUser(HttpUser):
     def get_specific_product(self):
         """Get specific product - medium frequency"""
         if self.test_product_id:
-            self.client.get(f"/api/products/{self.test_product_id}")
+            self.client.get(
+                f"/api/products/{self.test_product_id}", name="/api/products/[id]"
+            )
+
+    @task(2)
+    def search_products(self):
+        """Search products - medium frequency"""
+        self.client.get(
+            "/api/products/search",
+            params={"q": random.choice(["load test", "product", "prodcut"])},
+            name="/api/products/search",
+        )
 
     @task(1)
     def create_product(self):
@@ -85,6 +106,7 @@ class SmartRetailUser(HttpUser):
             self.client.put(
                 f"/api/products/{self.test_product_id}",
                 json=update_data,
+                name="/api/products/[id]",
                 headers={"Content-Type": "application/json"},
             )
 
@@ -100,6 +122,7 @@ class SmartRetailUser(HttpUser):
             self.client.post(
                 f"/api/products/{self.test_product_id}/restock",
                 json=restock_data,
+                name="/api/products/[id]/restock",
                 headers={"Content-Type": "application/json"},
             )
 
@@ -127,7 +150,9 @@ class SmartRetailUser(HttpUser):
         """Called when a user stops"""
         # Clean up test product
         if self.test_product_id:
-            self.client.delete(f"/api/products/{self.test_product_id}")
+            self.client.delete(
+                f"/api/products/{self.test_product_id}", name="/api/products/[id]"
+            )
 
 
 class AdminUser(HttpUser):
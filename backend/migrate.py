@@ -0,0 +1,203 @@
+"""
+Versioned schema migrations for the inventory database
+
+Migrations are plain SQL files in ``migrations/`` named
+``<4-digit version>_<description>.sql`` and are applied in version order.
+Applied versions are recorded in the ``schema_migrations`` table so every
+file runs exactly once per database.
+
+A migration runs inside a single transaction together with its bookkeeping
+row, unless its first line is ``-- migrate: no-transaction``. Those run
+statement by statement in autocommit mode, which is what
+``CREATE INDEX CONCURRENTLY`` requires; write them idempotently
+(``IF NOT EXISTS``) because a failure part-way is not rolled back.
+
+On PostgreSQL the runner holds a session-level advisory lock for the whole
+run, so several pods starting at once apply each migration only once.
+"""
+
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    insert,
+    select,
+    text,
+)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 7301945
+
+_FILENAME = re.compile(r"^(\d{4})_(\w+)\.sql$")
+# Statements end at a ``;`` that closes a line. Comments, string literals
+# and dollar-quoted bodies (``$$ ... $$``, ``$fn$ ... $fn$``) are skipped, so
+# a function body may contain such semicolons.
+_TOKEN = re.compile(
+    r"--[^\n]*|'(?:[^']|'')*'|(\$(?:[A-Za-z_]\w*)?\$)|;[ \t]*$", re.MULTILINE
+)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class MigrationError(Exception):
+    """Raised when the migrations directory is inconsistent"""
+
+
+class Migration:
+    """A single SQL migration file"""
+
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as handle:
+            self.sql = handle.read()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """Split the file into statements on a trailing ``;``"""
+        statements = []
+        for chunk in _split_statements(self.sql):
+            code = [
+                line for line in chunk.splitlines() if not line.strip().startswith("--")
+            ]
+            if "".join(code).strip():
+                statements.append(chunk.strip())
+        return statements
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d}_{self.name}>"
+
+
+def _split_statements(sql):
+    """Split ``sql`` at statement-ending semicolons (see ``_TOKEN``)"""
+    chunks = []
+    start = position = 0
+    while True:
+        match = _TOKEN.search(sql, position)
+        if match is None:
+            break
+        tag = match.group(1)
+        if tag:
+            # Resume after the closing tag; unterminated quotes are left for
+            # the database to report
+            end = sql.find(tag, match.end())
+            position = len(sql) if end == -1 else end + len(tag)
+        elif match.group().startswith(";"):
+            chunks.append(sql[start : match.start()])
+            start = position = match.end()
+        else:
+            position = match.end()
+    chunks.append(sql[start:])
+    return chunks
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Return the migrations in ``directory`` sorted by version"""
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicate migration version {version:04d}")
+        migrations[version] = Migration(
+            version, match.group(2), os.path.join(directory, filename)
+        )
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def applied_versions(connection):
+    """Return the set of versions recorded in ``schema_migrations``"""
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def _record(connection, migration):
+    connection.execute(
+        insert(schema_migrations).values(
+            version=migration.version,
+            name=migration.name,
+            applied_at=datetime.utcnow(),
+        )
+    )
+
+
+def _apply(engine, migration):
+    if migration.transactional:
+        with engine.begin() as connection:
+            for statement in migration.statements():
+                connection.exec_driver_sql(statement)
+            _record(connection, migration)
+        return
+
+    with engine.connect() as connection:
+        autocommit = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for statement in migration.statements():
+            autocommit.exec_driver_sql(statement)
+    with engine.begin() as connection:
+        _record(connection, migration)
+
+
+def migration_status(engine, directory=MIGRATIONS_DIR):
+    """Return ``(migration, applied)`` pairs for every known migration"""
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+    return [
+        (migration, migration.version in applied)
+        for migration in discover_migrations(directory)
+    ]
+
+
+@contextmanager
+def migration_lock(engine):
+    """Serialise migration runs across processes (PostgreSQL only)"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as lock:
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        lock.commit()
+        try:
+            yield
+        finally:
+            lock.execute(
+                text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+            )
+            lock.commit()
+
+
+def upgrade(engine, directory=MIGRATIONS_DIR, log=None):
+    """Apply every pending migration in order and return the ones applied"""
+    migrations = discover_migrations(directory)
+    applied_now = []
+    with migration_lock(engine):
+        # Read the applied set only once the lock is held so a process that
+        # waited on another one sees its work
+        with engine.begin() as connection:
+            applied = applied_versions(connection)
+        for migration in migrations:
+            if migration.version in applied:
+                continue
+            if log:
+                log(f"Applying {migration.version:04d}_{migration.name}")
+            _apply(engine, migration)
+            applied_now.append(migration)
+    return applied_now
@@ -0,0 +1,28 @@
+-- Products and restock logs as originally created by init.sql / db.create_all()
+CREATE TABLE IF NOT EXISTS products (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    sku VARCHAR(100) UNIQUE NOT NULL,
+    description TEXT,
+    stock_level INTEGER DEFAULT 0,
+    min_stock_threshold INTEGER DEFAULT 10,
+    price FLOAT DEFAULT 0.0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_products_name ON products (name);
+CREATE INDEX IF NOT EXISTS ix_products_stock_level ON products (stock_level);
+CREATE INDEX IF NOT EXISTS ix_products_price ON products (price);
+CREATE INDEX IF NOT EXISTS ix_products_created_at ON products (created_at);
+CREATE INDEX IF NOT EXISTS ix_products_updated_at ON products (updated_at);
+
+CREATE TABLE IF NOT EXISTS restock_logs (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity_added INTEGER NOT NULL,
+    previous_stock INTEGER NOT NULL,
+    new_stock INTEGER NOT NULL,
+    restocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    notes TEXT
+);
@@ -0,0 +1,8 @@
+-- Single-row counter bumped on every catalog write; read endpoints derive
+-- their ETags from it
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT DO NOTHING;
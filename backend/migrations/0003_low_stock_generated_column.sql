@@ -0,0 +1,6 @@
+-- Stored generated low-stock flag. Adding a stored generated column rewrites
+-- the table under an ACCESS EXCLUSIVE lock, so run this in a quiet window on
+-- large catalogs.
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS is_low_stock BOOLEAN
+    GENERATED ALWAYS AS (stock_level <= min_stock_threshold) STORED;
@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Partial index over low-stock rows only, ordered by severity. Built
+-- CONCURRENTLY so writes continue during the build. A failed build leaves an
+-- INVALID index under this name; drop it (DROP INDEX CONCURRENTLY) before
+-- re-running, since IF NOT EXISTS would otherwise skip it.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_low_stock_severity
+    ON products ((stock_level - min_stock_threshold), id)
+    WHERE is_low_stock;
@@ -0,0 +1,18 @@
+-- migrate: no-transaction
+-- Full-text and trigram indexes for /api/products/search. The document
+-- expression must stay identical to SEARCH_DOCUMENT in app.py or the planner
+-- will not use the index. CREATE EXTENSION needs a role allowed to create
+-- extensions (pg_trgm is a trusted extension from PostgreSQL 13).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_search_document
+    ON products USING gin ((
+        setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B')
+    ));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_name_trgm
+    ON products USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_sku_trgm
+    ON products USING gin (sku gin_trgm_ops);
@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Restock history is read newest first, per product or across the catalog.
+-- The id tie-break makes the order total so keyset pagination can seek on it.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restock_logs_product_restocked_at
+    ON restock_logs (product_id, restocked_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_restock_logs_restocked_at
+    ON restock_logs (restocked_at DESC, id DESC);
@@ -0,0 +1,8 @@
+-- Rate-limit counters for RATELIMIT_STORAGE_URI=postgresql://... so limits
+-- hold across pods. UNLOGGED: counters are disposable, so skip the WAL and
+-- accept that a crash empties the table.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count BIGINT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,15 @@
+-- Announce every new catalog version on the catalog_version channel. Each
+-- worker's listener keeps the latest one in memory, so ETag checks do not
+-- read this table. NOTIFY is delivered when the bumping transaction commits.
+CREATE OR REPLACE FUNCTION notify_catalog_version() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalog_version', NEW.version::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS catalog_version_notify ON catalog_version;
+
+CREATE TRIGGER catalog_version_notify
+AFTER INSERT OR UPDATE ON catalog_version
+FOR EACH ROW EXECUTE FUNCTION notify_catalog_version();
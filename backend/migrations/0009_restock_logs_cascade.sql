@@ -0,0 +1,9 @@
+-- init.sql (and so 0001) always declared restock_logs.product_id ON DELETE
+-- CASCADE, but databases built by db.create_all() got a plain foreign key.
+-- The model now declares the cascade too; recreate the constraint so every
+-- database agrees with it. Rows are already valid, so the re-check passes.
+ALTER TABLE restock_logs DROP CONSTRAINT IF EXISTS restock_logs_product_id_fkey;
+
+ALTER TABLE restock_logs
+    ADD CONSTRAINT restock_logs_product_id_fkey
+    FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE;
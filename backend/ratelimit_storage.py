@@ -0,0 +1,331 @@
+"""
+Flask-Limiter storage backends shared between processes
+
+``mmap://`` keeps counters in a memory-mapped file, so every gunicorn worker
+in a pod enforces the same limits without a network hop, and counters
+survive worker restarts. ``postgresql://`` keeps them in an UNLOGGED table
+(migrations/0007_rate_limits.sql) so limits hold across pods.
+
+Both register with ``limits`` on import and support the fixed-window and
+sliding-window-counter strategies:
+
+    RATELIMIT_STORAGE_URI=mmap:///tmp/inventory-ratelimit.mmap?slots=65536
+    RATELIMIT_STORAGE_URI=postgresql://user:pass@db:5432/inventory_db
+    RATELIMIT_STRATEGY=sliding-window-counter
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from math import floor
+from urllib.parse import parse_qs, urlparse
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+
+class SlidingWindowCounterMixin(TimestampedSlidingWindow, SlidingWindowCounterSupport):
+    """Sliding window counter on top of ``incr``/``get`` (as limits' memory
+    storage does): the previous window's count is weighted by how much of it
+    still overlaps the sliding window."""
+
+    def _sliding_window_info(self, previous_key, current_key, expiry, now):
+        previous_count = self.get(previous_key)
+        current_count = self.get(current_key)
+        if previous_count == 0:
+            previous_ttl = 0.0
+        else:
+            previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count, previous_ttl, current_count, _ = self._sliding_window_info(
+            previous_key, current_key, expiry, now
+        )
+        if (
+            floor(previous_count * previous_ttl / expiry + current_count) + amount
+            > limit
+        ):
+            return False
+
+        current_count = self.incr(current_key, 2 * expiry, amount=amount)
+        if floor(previous_count * previous_ttl / expiry + current_count) > limit:
+            # Another worker took the last slot first: give this one back
+            self.incr(current_key, 2 * expiry, amount=-amount)
+            return False
+        return True
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._sliding_window_info(previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
+
+
+class MmapStorage(SlidingWindowCounterMixin, Storage):
+    """Counters in a fixed-size hash table in a shared memory-mapped file
+
+    Each slot holds a 64-bit key hash, the count and the absolute expiry.
+    Keys probe up to ``MAX_PROBES`` slots from their hash; expired slots are
+    reused, and a full neighbourhood evicts the entry closest to expiry.
+    Updates are serialised with ``flock`` across processes and a mutex
+    within one.
+    """
+
+    STORAGE_SCHEME = ["mmap"]
+    MAGIC = b"RLMMAP01"
+    HEADER = struct.Struct("<8sQ")
+    SLOT = struct.Struct("<Qqd")  # key hash, count, expires_at
+    DEFAULT_SLOTS = 65536
+    MAX_PROBES = 32
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        parsed = urlparse(uri)
+        self.path = parsed.path
+        query = parse_qs(parsed.query)
+        self.slots = int(query.get("slots", [self.DEFAULT_SLOTS])[0])
+        self.size = self.HEADER.size + self.slots * self.SLOT.size
+        self._thread_lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    @property
+    def base_exceptions(self):
+        return (OSError, ValueError)
+
+    def _open(self):
+        # flock is tied to the open file description, which a forked worker
+        # shares with its parent, so every process opens the file itself
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+            if header != self.HEADER.pack(self.MAGIC, self.slots):
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, self.HEADER.pack(self.MAGIC, self.slots), 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _hash(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _offset(self, index):
+        return self.HEADER.size + index * self.SLOT.size
+
+    def _find(self, table, key_hash, now):
+        """Return ``(offset, count, expires_at)`` of the live slot for the key,
+        or the offset of a slot to claim for it with ``count=None``"""
+        start = key_hash % self.slots
+        free = victim = None
+        victim_expiry = float("inf")
+        for probe in range(min(self.MAX_PROBES, self.slots)):
+            offset = self._offset((start + probe) % self.slots)
+            slot_hash, count, expires_at = self.SLOT.unpack_from(table, offset)
+            live = slot_hash != 0 and expires_at > now
+            if live and slot_hash == key_hash:
+                return offset, count, expires_at
+            if not live and free is None:
+                free = offset
+            if live and expires_at < victim_expiry:
+                victim, victim_expiry = offset, expires_at
+        return (free if free is not None else victim), None, None
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        key_hash = self._hash(key)
+        with self._locked() as table:
+            now = time.time()
+            offset, count, expires_at = self._find(table, key_hash, now)
+            if count is None:
+                count, expires_at = 0, now + expiry
+            if elastic_expiry:
+                expires_at = now + expiry
+            count = max(count + amount, 0)
+            self.SLOT.pack_into(table, offset, key_hash, count, expires_at)
+            return count
+
+    def get(self, key):
+        with self._locked() as table:
+            _, count, _ = self._find(table, self._hash(key), time.time())
+            return count or 0
+
+    def get_expiry(self, key):
+        with self._locked() as table:
+            now = time.time()
+            _, count, expires_at = self._find(table, self._hash(key), now)
+            return expires_at if count is not None else now
+
+    def check(self):
+        with self._locked():
+            return True
+
+    def reset(self):
+        with self._locked() as table:
+            now = time.time()
+            cleared = 0
+            for index in range(self.slots):
+                offset = self._offset(index)
+                slot_hash, _, expires_at = self.SLOT.unpack_from(table, offset)
+                cleared += slot_hash != 0 and expires_at > now
+            table[self.HEADER.size :] = bytes(self.size - self.HEADER.size)
+            return cleared
+
+    def clear(self, key):
+        with self._locked() as table:
+            offset, count, _ = self._find(table, self._hash(key), time.time())
+            if count is not None:
+                self.SLOT.pack_into(table, offset, 0, 0, 0.0)
+
+
+class PostgresStorage(SlidingWindowCounterMixin, Storage):
+    """Counters in the UNLOGGED ``rate_limits`` table, shared by all pods
+
+    Each increment is one upsert that restarts the window once it has
+    expired, timed by the database clock. Expired rows are purged every
+    ``PURGE_EVERY`` increments per process. Each process holds at most
+    ``max_connections`` connections; further concurrent callers wait for one
+    to be returned.
+    """
+
+    STORAGE_SCHEME = ["postgresql"]
+    PURGE_EVERY = 1000
+    DEFAULT_MAX_CONNECTIONS = 4  # gunicorn.conf.py reserves these per worker
+
+    INCR = """
+        INSERT INTO rate_limits AS r (key, count, expires_at)
+        VALUES (%(key)s, %(amount)s, now() + make_interval(secs => %(expiry)s))
+        ON CONFLICT (key) DO UPDATE SET
+            count = CASE WHEN r.expires_at <= now() THEN EXCLUDED.count
+                         ELSE GREATEST(r.count + EXCLUDED.count, 0) END,
+            expires_at = CASE WHEN r.expires_at <= now() OR %(elastic)s
+                              THEN EXCLUDED.expires_at ELSE r.expires_at END
+        RETURNING count
+    """
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.uri = uri
+        self.max_connections = int(
+            options.get("max_connections", self.DEFAULT_MAX_CONNECTIONS)
+        )
+        self._pool = None
+        self._slots = None
+        self._pid = None
+        self._pool_lock = threading.Lock()
+        self._increments = 0
+
+    @property
+    def base_exceptions(self):
+        import psycopg2
+
+        return psycopg2.Error
+
+    @contextmanager
+    def _cursor(self):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        with self._pool_lock:
+            if self._pid != os.getpid():
+                # Connections must not be shared with a forked parent
+                self._pool = ThreadedConnectionPool(1, self.max_connections, self.uri)
+                self._slots = threading.BoundedSemaphore(self.max_connections)
+                self._pid = os.getpid()
+            pool, slots = self._pool, self._slots
+        # ThreadedConnectionPool raises instead of waiting when exhausted
+        with slots:
+            conn = pool.getconn()
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    yield cursor
+            except Exception:
+                pool.putconn(conn, close=True)
+                raise
+            else:
+                pool.putconn(conn)
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        with self._cursor() as cursor:
+            cursor.execute(
+                self.INCR,
+                {
+                    "key": key,
+                    "amount": amount,
+                    "expiry": expiry,
+                    "elastic": elastic_expiry,
+                },
+            )
+            count = cursor.fetchone()[0]
+            self._increments += 1
+            if self._increments % self.PURGE_EVERY == 0:
+                cursor.execute("DELETE FROM rate_limits WHERE expires_at <= now()")
+            return count
+
+    def get(self, key):
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT count FROM rate_limits WHERE key = %s AND expires_at > now()",
+                (key,),
+            )
+            row = cursor.fetchone()
+            return row[0] if row else 0
+
+    def get_expiry(self, key):
+        with self._cursor() as cursor:
+            cursor.execute(
+                "SELECT extract(epoch FROM expires_at) FROM rate_limits"
+                " WHERE key = %s AND expires_at > now()",
+                (key,),
+            )
+            row = cursor.fetchone()
+            return float(row[0]) if row else time.time()
+
+    def check(self):
+        try:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1")
+                return True
+        except Exception:
+            return False
+
+    def reset(self):
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM rate_limits")
+            return cursor.rowcount
+
+    def clear(self, key):
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM rate_limits WHERE key = %s", (key,))
@@ -3,14 +3,17 @@ Unit tests for Smart Retail App Flask backend
 """
 
 import json
+import logging
 import os
+import subprocess
 import sys
+import textwrap
 
 import pytest
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import Product, app, db
+from app import PRODUCT_CACHE, Product, app, db, limiter
 
 
 @pytest.fixture
@@ -22,6 +25,9 @@ def client():
     with app.test_client() as client:
         with app.app_context():
             db.create_all()
+            PRODUCT_CACHE.clear()
+            # Limits are counted in process memory across tests
+            limiter.reset()
             yield client
             db.drop_all()
 
@@ -172,6 +178,608 @@ class TestProducts:
         response = client.delete("/api/products/999")
         assert response.status_code == 404
 
+    def test_restock_log_foreign_key_cascades(self):
+        """Test the model declares the ON DELETE CASCADE the migrations create"""
+        from app import RestockLog
+
+        (foreign_key,) = RestockLog.__table__.c.product_id.foreign_keys
+        assert foreign_key.ondelete == "CASCADE"
+
+
+class TestProductPagination:
+    """Test keyset pagination, filtering and sorting of the product list"""
+
+    @pytest.fixture
+    def many_products(self, client):
+        """Create a small catalog with duplicate prices to exercise tie-breaks"""
+        with app.app_context():
+            for i in range(7):
+                db.session.add(
+                    Product(
+                        name=f"Item {i}",
+                        sku=f"PAGE-{i:03d}",
+                        stock_level=i * 5,
+                        min_stock_threshold=10,
+                        price=float(i // 2),
+                    )
+                )
+            db.session.commit()
+
+    def _collect(self, client, query):
+        """Follow next_cursor until the last page and return all rows"""
+        rows, cursor = [], None
+        while True:
+            url = f"/api/products?{query}" + (f"&cursor={cursor}" if cursor else "")
+            data = json.loads(client.get(url).data)
+            rows.extend(data["products"])
+            cursor = data["next_cursor"]
+            if not data["has_more"]:
+                assert cursor is None
+                return rows
+
+    def test_pages_cover_catalog_once(self, client, many_products):
+        """Test that paging by id returns every product exactly once"""
+        rows = self._collect(client, "limit=3")
+        assert [r["sku"] for r in rows] == [f"PAGE-{i:03d}" for i in range(7)]
+
+    def test_sort_desc_with_ties(self, client, many_products):
+        """Test that sorting on a non-unique key pages without gaps"""
+        rows = self._collect(client, "limit=2&sort=price&order=desc")
+        assert len({r["id"] for r in rows}) == 7
+        keys = [(r["price"], r["id"]) for r in rows]
+        assert keys == sorted(keys, reverse=True)
+
+    @pytest.mark.parametrize("order", ["asc", "desc"])
+    def test_sort_on_nullable_key(self, client, many_products, order):
+        """Test that rows with a NULL sort key are paged, after all values"""
+        with app.app_context():
+            for i in (7, 8, 9):
+                db.session.add(Product(name=f"Item {i}", sku=f"PAGE-{i:03d}"))
+            db.session.flush()
+            db.session.execute(
+                Product.__table__.update()
+                .where(Product.sku.in_(["PAGE-007", "PAGE-008", "PAGE-009"]))
+                .values(price=None)
+            )
+            db.session.commit()
+
+        rows = self._collect(client, f"limit=2&sort=price&order={order}")
+        assert len({r["id"] for r in rows}) == 10
+        prices = [r["price"] for r in rows]
+        if order == "asc":
+            assert prices[-3:] == [None] * 3
+        else:
+            assert prices[:3] == [None] * 3
+
+    def test_filters(self, client, many_products):
+        """Test price, stock and low-stock filters"""
+        data = json.loads(
+            client.get("/api/products?min_price=1&max_price=2&min_stock=15").data
+        )
+        assert [r["sku"] for r in data["products"]] == [
+            "PAGE-003",
+            "PAGE-004",
+            "PAGE-005",
+        ]
+
+        data = json.loads(client.get("/api/products?low_stock=true").data)
+        assert all(r["is_low_stock"] for r in data["products"])
+        assert len(data["products"]) == 3
+
+    def test_name_prefix_is_literal(self, client, many_products):
+        """Test that LIKE wildcards in the prefix are escaped"""
+        data = json.loads(client.get("/api/products?name_prefix=Item%201").data)
+        assert [r["sku"] for r in data["products"]] == ["PAGE-001"]
+        data = json.loads(client.get("/api/products?name_prefix=%25").data)
+        assert data["products"] == []
+
+    def test_invalid_arguments(self, client):
+        """Test that bad parameters and mismatched cursors are rejected"""
+        assert client.get("/api/products?limit=0").status_code == 400
+        assert client.get("/api/products?sort=sku").status_code == 400
+        assert client.get("/api/products?min_price=abc").status_code == 400
+        assert client.get("/api/products?cursor=garbage").status_code == 400
+
+    def test_count_modes(self, client, many_products):
+        """Test that count=exact|estimated adds the filtered total"""
+        data = json.loads(client.get("/api/products?limit=2").data)
+        assert "total" not in data
+        # A page's length is not the catalog size; only ``total`` carries that
+        assert "total_count" not in data
+        data = json.loads(client.get("/api/products?limit=2&count=exact").data)
+        assert data["total"] == 7
+        # SQLite has no planner statistics, so estimates are exact there
+        data = json.loads(
+            client.get("/api/products?limit=2&low_stock=true&count=estimated").data
+        )
+        assert data["total"] == 3
+        assert client.get("/api/products?count=approx").status_code == 400
+
+    def test_cursor_bound_to_sort(self, client, many_products):
+        """Test that a cursor cannot be replayed with a different sort"""
+        data = json.loads(client.get("/api/products?limit=2&sort=price").data)
+        response = client.get(f"/api/products?sort=name&cursor={data['next_cursor']}")
+        assert response.status_code == 400
+
+    def test_cursor_with_wrong_value_type(self, client):
+        """Test that a well-formed cursor with a non-string timestamp is a 400"""
+        import base64
+
+        cursor = base64.urlsafe_b64encode(b'["updated_at","asc",5,1]').decode()
+        response = client.get(f"/api/products?sort=updated_at&cursor={cursor}")
+        assert response.status_code == 400
+        assert json.loads(response.data)["error"] == "Invalid cursor"
+
+
+class TestProjectedReadPath:
+    """Test that column-projected list endpoints keep the ORM JSON shape"""
+
+    def test_product_rows_match_to_dict(self, client, sample_product_data):
+        """Test that /api/products rows equal Product.to_dict()"""
+        with app.app_context():
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.commit()
+            expected = product.to_dict()
+
+        data = json.loads(client.get("/api/products").data)
+        assert data["products"] == [expected]
+
+    def test_restock_rows_match_to_dict(self, client, sample_product_data):
+        """Test that /api/restocks rows equal RestockLog.to_dict()"""
+        from app import RestockLog
+
+        with app.app_context():
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.flush()
+            log = RestockLog(
+                product_id=product.id,
+                quantity_added=5,
+                previous_stock=50,
+                new_stock=55,
+                notes="projected",
+            )
+            db.session.add(log)
+            db.session.commit()
+            expected = log.to_dict()
+
+        data = json.loads(client.get("/api/restocks").data)
+        assert data["restock_logs"] == [expected]
+        assert data["pagination"]["total"] == 1
+        assert data["pagination"]["pages"] == 1
+
+
+class TestProductSearch:
+    """Test the ranked /api/products/search endpoint (SQLite fallback path)"""
+
+    @pytest.fixture
+    def catalog(self, client):
+        """Create a small searchable catalog"""
+        with app.app_context():
+            for name, sku, description in (
+                (
+                    "Wireless Mouse",
+                    "MSE001",
+                    "Ergonomic wireless mouse with USB receiver",
+                ),
+                ("Mechanical Keyboard", "KBD001", "RGB backlit keyboard"),
+                ("USB-C Cable", "CBL001", "Braided charging cable"),
+                ("Laptop Stand", "STD001", "Aluminium stand for laptops"),
+            ):
+                db.session.add(Product(name=name, sku=sku, description=description))
+            db.session.commit()
+
+    def search(self, client, query):
+        response = client.get(f"/api/products/search?{query}")
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    def test_name_match_ranks_above_description(self, client, catalog):
+        """Test that a name hit outranks a description-only hit"""
+        data = self.search(client, "q=usb")
+        assert [p["sku"] for p in data["products"]] == ["CBL001", "MSE001"]
+        assert data["products"][0]["score"] > data["products"][1]["score"]
+
+    def test_all_words_must_match(self, client, catalog):
+        """Test multi-word queries and light plural stemming"""
+        data = self.search(client, "q=braided+cables")
+        assert [p["sku"] for p in data["products"]] == ["CBL001"]
+        data = self.search(client, "q=aluminium+laptop")
+        assert [p["sku"] for p in data["products"]] == ["STD001"]
+
+    def test_typo_tolerant_name_and_sku(self, client, catalog):
+        """Test trigram similarity finds misspelt names and SKUs"""
+        data = self.search(client, "q=wireles+mouse")
+        assert data["products"][0]["sku"] == "MSE001"
+        data = self.search(client, "q=KBD01")
+        assert [p["sku"] for p in data["products"]] == ["KBD001"]
+
+    def test_no_matches(self, client, catalog):
+        """Test an unrelated query returns an empty page"""
+        data = self.search(client, "q=refrigerator")
+        assert data["products"] == []
+        assert data["has_more"] is False
+
+    def test_pagination(self, client, catalog):
+        """Test page/per_page slicing of the ranked results"""
+        first = self.search(client, "q=usb&per_page=1")
+        second = self.search(client, "q=usb&per_page=1&page=2")
+        assert first["has_more"] is True
+        assert second["has_more"] is False
+        assert [first["products"][0]["sku"], second["products"][0]["sku"]] == [
+            "CBL001",
+            "MSE001",
+        ]
+
+    def test_invalid_arguments(self, client):
+        """Test that missing or out-of-range parameters are rejected"""
+        assert client.get("/api/products/search").status_code == 400
+        assert client.get("/api/products/search?q=+").status_code == 400
+        assert client.get("/api/products/search?q=a&per_page=0").status_code == 400
+        assert client.get("/api/products/search?q=a&page=500").status_code == 400
+
+    def test_trigram_similarity_matches_pg_trgm(self):
+        """Test the Python fallback reproduces pg_trgm similarity()"""
+        from app import trigram_similarity
+
+        assert trigram_similarity("word", "two words") == pytest.approx(4 / 11)
+        assert trigram_similarity("", "anything") == 0.0
+
+
+class TestExport:
+    """Test streaming NDJSON/CSV export endpoints"""
+
+    @pytest.fixture
+    def restocked_products(self, client):
+        """Create two products with one restock log each"""
+        from app import RestockLog
+
+        with app.app_context():
+            for sku in ("EXP-001", "EXP-002"):
+                product = Product(name=f"Export {sku}", sku=sku, stock_level=1)
+                db.session.add(product)
+                db.session.flush()
+                db.session.add(
+                    RestockLog(
+                        product_id=product.id,
+                        quantity_added=4,
+                        previous_stock=1,
+                        new_stock=5,
+                    )
+                )
+            db.session.commit()
+
+    def test_export_products_ndjson(self, client, restocked_products):
+        """Test that products stream as one JSON object per line"""
+        response = client.get("/api/export/products")
+        assert response.status_code == 200
+        assert response.mimetype == "application/x-ndjson"
+        assert response.is_streamed
+        lines = response.data.decode().splitlines()
+        assert [json.loads(line)["sku"] for line in lines] == ["EXP-001", "EXP-002"]
+
+    def test_export_products_csv(self, client, restocked_products):
+        """Test that CSV export has a header row and one row per product"""
+        response = client.get("/api/export/products?format=csv")
+        assert response.mimetype == "text/csv"
+        lines = response.data.decode().splitlines()
+        assert lines[0].startswith("id,name,sku,")
+        assert len(lines) == 3
+
+    def test_export_restocks_by_product(self, client, restocked_products):
+        """Test restock export filtered by product_id"""
+        response = client.get("/api/export/restocks?product_id=2")
+        rows = [json.loads(line) for line in response.data.decode().splitlines()]
+        assert [(r["product_sku"], r["new_stock"]) for r in rows] == [("EXP-002", 5)]
+
+    def test_export_invalid_format(self, client):
+        """Test that unknown formats are rejected"""
+        assert client.get("/api/export/products?format=xml").status_code == 400
+        assert client.get("/api/export/restocks?since=yesterday").status_code == 400
+        response = client.get("/api/export/restocks?product_id=abc")
+        assert response.status_code == 400
+        assert json.loads(response.data)["error"] == "Invalid value for product_id: abc"
+
+
+class TestConditionalGet:
+    """Test ETag / If-None-Match handling driven by the catalog version"""
+
+    def test_not_modified_until_write(self, client, sample_product_data):
+        """Test that a matching ETag yields 304 until the catalog changes"""
+        first = client.get("/api/products")
+        etag = first.headers["ETag"]
+        assert first.status_code == 200
+
+        cached = client.get("/api/products", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.data == b""
+
+        client.post(
+            "/api/products",
+            data=json.dumps(sample_product_data),
+            content_type="application/json",
+        )
+        fresh = client.get("/api/products", headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.headers["ETag"] != etag
+
+    def test_etag_varies_by_query_and_endpoint(self, client):
+        """Test that different listings never share an ETag"""
+        tags = {
+            client.get("/api/products").headers["ETag"],
+            client.get("/api/products?sort=price").headers["ETag"],
+            client.get("/api/products/low-stock").headers["ETag"],
+            client.get("/api/products/analytics").headers["ETag"],
+        }
+        assert len(tags) == 4
+
+    def test_analytics_etag_changes_with_the_date(self, client, monkeypatch):
+        """Test the analytics tag expires with its midnight-aligned window"""
+        from datetime import datetime, timedelta
+
+        import app as app_module
+
+        class Tomorrow(datetime):
+            @classmethod
+            def utcnow(cls):
+                return datetime.utcnow() + timedelta(days=1)
+
+        analytics = client.get("/api/products/analytics").headers["ETag"]
+        products = client.get("/api/products").headers["ETag"]
+
+        monkeypatch.setattr(app_module, "datetime", Tomorrow)
+        response = client.get(
+            "/api/products/analytics", headers={"If-None-Match": analytics}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != analytics
+        response = client.get("/api/products", headers={"If-None-Match": products})
+        assert response.status_code == 304
+
+    def test_known_version_skips_database(self, client, monkeypatch):
+        """Test that a listener-fed catalog version answers 304 without SQL"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "SERVER_TIMING", True)
+        monkeypatch.setattr(app_module.LOCAL_CATALOG_VERSION, "value", 7)
+
+        first = client.get("/api/products")
+        assert 'desc="1 queries"' in first.headers["Server-Timing"]
+
+        cached = client.get(
+            "/api/products", headers={"If-None-Match": first.headers["ETag"]}
+        )
+        assert cached.status_code == 304
+        assert 'desc="0 queries"' in cached.headers["Server-Timing"]
+
+        app_module.LOCAL_CATALOG_VERSION.advance(8)
+        fresh = client.get(
+            "/api/products", headers={"If-None-Match": first.headers["ETag"]}
+        )
+        assert fresh.status_code == 200
+
+
+class TestProductCache:
+    """Test the per-worker product cache"""
+
+    def test_second_read_is_a_hit(self, client, sample_product_data):
+        """Test that repeated reads are served from the cache"""
+        with app.app_context():
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        client.get(f"/api/products/{product_id}")
+        assert PRODUCT_CACHE.get(product_id)["sku"] == sample_product_data["sku"]
+
+    def test_update_evicts_cached_product(self, client, sample_product_data):
+        """Test that a write invalidates the cached entry"""
+        with app.app_context():
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        client.get(f"/api/products/{product_id}")
+        client.put(
+            f"/api/products/{product_id}",
+            data=json.dumps({"name": "Renamed"}),
+            content_type="application/json",
+        )
+        data = json.loads(client.get(f"/api/products/{product_id}").data)
+        assert data["product"]["name"] == "Renamed"
+
+    def test_lru_bound_and_stale_put(self):
+        """Test capacity eviction and that puts racing an invalidation drop"""
+        from app import ProductCache
+
+        cache = ProductCache(max_size=2)
+        cache.active = True
+        for product_id in (1, 2, 3):
+            cache.put(product_id, {"id": product_id}, cache.generation)
+        assert cache.get(1) is None
+        assert len(cache) == 2
+
+        generation = cache.generation
+        cache.invalidate(4)
+        cache.put(4, {"id": 4}, generation)
+        assert cache.get(4) is None
+
+
+class TestBulkUpdate:
+    """Test PATCH /api/products/bulk"""
+
+    @pytest.fixture
+    def catalog(self, client):
+        """Create three products"""
+        with app.app_context():
+            for i in range(3):
+                db.session.add(
+                    Product(
+                        name=f"Bulk {i}", sku=f"BULK-{i}", price=10.0, stock_level=50
+                    )
+                )
+            db.session.commit()
+
+    def patch(self, client, rows):
+        response = client.patch(
+            "/api/products/bulk",
+            data=json.dumps({"products": rows}),
+            content_type="application/json",
+        )
+        return response.status_code, json.loads(response.data)
+
+    def test_bulk_update_by_id_and_sku(self, client, catalog):
+        """Test mixed keys, partial fields and unknown products"""
+        status, data = self.patch(
+            client,
+            [
+                {"id": 1, "price": 12.5},
+                {"sku": "BULK-2", "stock_level": 3, "name": "Bulk two"},
+                {"sku": "GONE-1", "price": 1},
+            ],
+        )
+        assert status == 200
+        assert (data["updated"], data["not_found"]) == (2, 1)
+        assert [r["status"] for r in data["results"]] == [
+            "updated",
+            "updated",
+            "not_found",
+        ]
+
+        products = {
+            p["sku"]: p
+            for p in json.loads(client.get("/api/products").data)["products"]
+        }
+        assert products["BULK-0"]["price"] == 12.5
+        assert products["BULK-0"]["stock_level"] == 50
+        assert products["BULK-2"]["name"] == "Bulk two"
+        assert products["BULK-2"]["is_low_stock"] is True
+        assert products["BULK-1"]["price"] == 10.0
+
+    def test_bulk_update_validates_everything_first(self, client, catalog):
+        """Test that one invalid row rejects the whole request"""
+        status, data = self.patch(
+            client,
+            [
+                {"id": 1, "price": 99},
+                {"id": 2, "stock_level": -1},
+                {"sku": "BULK-2"},
+                {"id": 1, "price": 5},
+            ],
+        )
+        assert status == 400
+        assert [(r["row"], r["error"]) for r in data["results"]] == [
+            (1, "Stock level must be a non-negative integer"),
+            (2, "No fields to update"),
+            (3, "Duplicate product in request"),
+        ]
+        product = json.loads(client.get("/api/products/1").data)["product"]
+        assert product["price"] == 10.0
+
+    def test_bulk_update_id_and_sku_of_same_product(self, client, catalog):
+        """Test that an id row and a SKU row for one product are duplicates"""
+        status, data = self.patch(
+            client,
+            [{"id": 1, "price": 20}, {"sku": "BULK-0", "price": 30}],
+        )
+        assert status == 400
+        assert [(r["row"], r["error"]) for r in data["results"]] == [
+            (1, "Duplicate product in request"),
+        ]
+        product = json.loads(client.get("/api/products/1").data)["product"]
+        assert product["price"] == 10.0
+
+    def test_bulk_update_rejects_boolean_id(self, client, catalog):
+        """Test that JSON true is not taken as product id 1"""
+        status, data = self.patch(client, [{"id": True, "price": 20}])
+        assert status == 400
+        assert data["results"][0]["error"] == "id or a valid sku is required"
+
+
+class TestProductImport:
+    """Test bulk product import over HTTP and the CLI"""
+
+    def test_import_csv_body(self, client, sample_product):
+        """Test inserted/updated/rejected counts for a raw CSV upload"""
+        body = (
+            "name,sku,description,stock_level,min_stock_threshold,price\n"
+            "Imported,IMP-001,New one,5,2,9.5\n"
+            "Renamed,TEST-001,Existing SKU,7,,\n"
+            "Broken,bad sku,,1,1,1\n"
+            "Imported again,IMP-001,Later line wins,6,2,9.5\n"
+        )
+        response = client.post(
+            "/api/products/import?format=csv", data=body, content_type="text/csv"
+        )
+        data = json.loads(response.data)
+        assert response.status_code == 200
+        assert (data["inserted"], data["updated"], data["rejected"]) == (1, 1, 1)
+        assert data["errors"] == [{"line": 4, "error": "Invalid SKU format"}]
+
+        products = {
+            p["sku"]: p
+            for p in json.loads(client.get("/api/products").data)["products"]
+        }
+        assert products["IMP-001"]["name"] == "Imported again"
+        assert products["TEST-001"]["name"] == "Renamed"
+        assert products["TEST-001"]["min_stock_threshold"] == 10
+
+    def test_import_counts_sku_once_across_chunks(
+        self, client, sample_product, monkeypatch
+    ):
+        """Test a SKU repeated in a later chunk is counted only once"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "BULK_CHUNK_ROWS", 2)
+        body = (
+            "name,sku,price\n"
+            "First,IMP-001,1\n"
+            "Existing,TEST-001,1\n"
+            "Second,IMP-001,2\n"
+            "Existing again,TEST-001,2\n"
+            "Third,IMP-001,3\n"
+        )
+        response = client.post(
+            "/api/products/import?format=csv", data=body, content_type="text/csv"
+        )
+        data = json.loads(response.data)
+        assert (data["inserted"], data["updated"]) == (1, 1)
+        products = {
+            p["sku"]: p
+            for p in json.loads(client.get("/api/products").data)["products"]
+        }
+        assert products["IMP-001"]["name"] == "Third"
+
+    def test_import_json_file_upload(self, client):
+        """Test a multipart upload in the sample_products.json layout"""
+        import io
+
+        document = {"products": [{"name": "Json", "sku": "JSON-001", "price": 1}]}
+        response = client.post(
+            "/api/products/import",
+            data={"file": (io.BytesIO(json.dumps(document).encode()), "p.json")},
+            content_type="multipart/form-data",
+        )
+        assert json.loads(response.data)["inserted"] == 1
+
+    def test_import_rejects_bad_input(self, client):
+        """Test unknown formats and unparseable files"""
+        assert client.post("/api/products/import?format=xml").status_code == 400
+        response = client.post("/api/products/import?format=json", data="{nope")
+        assert response.status_code == 400
+
+    def test_import_cli(self, client, tmp_path):
+        """Test the flask import-products command with NDJSON"""
+        path = tmp_path / "products.ndjson"
+        path.write_text(
+            json.dumps({"name": "Cli", "sku": "CLI-001"}) + "\n" + "not json\n"
+        )
+        result = app.test_cli_runner().invoke(args=["import-products", str(path)])
+        assert "Inserted 1, updated 0, rejected 1" in result.output
+
 
 class TestRestocking:
     """Test restocking-related endpoints"""
@@ -211,6 +819,65 @@ class TestRestocking:
         )
         assert response.status_code == 400
 
+    def test_restock_chains_stock_levels(self, client, sample_product_data):
+        """Test that consecutive restocks build on each other's new_stock"""
+        with app.app_context():
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        logs = []
+        for quantity in (5, 7):
+            response = client.post(
+                f"/api/products/{product_id}/restock",
+                data=json.dumps({"quantity": quantity}),
+                content_type="application/json",
+            )
+            logs.append(json.loads(response.data)["restock_log"])
+
+        assert [(log["previous_stock"], log["new_stock"]) for log in logs] == [
+            (50, 55),
+            (55, 62),
+        ]
+
+    @pytest.mark.integration
+    def test_concurrent_restocks_lose_no_updates(self, client, sample_product_data):
+        """Test that parallel restocks of one product all land (PostgreSQL)"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with app.app_context():
+            if db.engine.dialect.name != "postgresql":
+                pytest.skip("needs a PostgreSQL server for concurrent transactions")
+            product = Product(**sample_product_data)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        def restock(_):
+            with app.test_client() as worker:
+                return worker.post(
+                    f"/api/products/{product_id}/restock",
+                    data=json.dumps({"quantity": 1}),
+                    content_type="application/json",
+                ).status_code
+
+        limiter.enabled = False
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                statuses = list(pool.map(restock, range(100)))
+        finally:
+            limiter.enabled = True
+
+        assert statuses == [200] * 100
+        data = json.loads(client.get(f"/api/products/{product_id}").data)
+        assert (
+            data["product"]["stock_level"] == sample_product_data["stock_level"] + 100
+        )
+        history = json.loads(client.get("/api/restocks?per_page=200").data)
+        new_stocks = sorted(log["new_stock"] for log in history["restock_logs"])
+        assert new_stocks == list(range(51, 151))
+
     def test_get_restock_history(self, client, sample_product):
         """Test getting restock history"""
         # First, create a restock operation
@@ -228,6 +895,185 @@ class TestRestocking:
         assert len(data["restocks"]) >= 1
 
 
+class TestRestockHistory:
+    """Test filtering and keyset pagination of /api/restocks"""
+
+    @pytest.fixture
+    def history(self, client):
+        """Two products with restocks on consecutive days (A: 3, B: 2)"""
+        from datetime import datetime, timedelta
+
+        from app import RestockLog
+
+        start = datetime(2024, 1, 1, 12, 0)
+        with app.app_context():
+            a = Product(name="History A", sku="HIST-A")
+            b = Product(name="History B", sku="HIST-B")
+            db.session.add_all([a, b])
+            db.session.flush()
+            for day, product in enumerate([a, b, a, b, a]):
+                db.session.add(
+                    RestockLog(
+                        product_id=product.id,
+                        quantity_added=day + 1,
+                        previous_stock=0,
+                        new_stock=day + 1,
+                        restocked_at=start + timedelta(days=day),
+                    )
+                )
+            db.session.commit()
+            return {"a": a.id, "b": b.id}
+
+    def get(self, client, query):
+        response = client.get(f"/api/restocks?{query}")
+        assert response.status_code == 200
+        return json.loads(response.data)
+
+    def test_filter_by_product(self, client, history):
+        """Test product_id filtering, newest first, with a filtered total"""
+        data = self.get(client, f"product_id={history['a']}")
+        assert [log["quantity_added"] for log in data["restock_logs"]] == [5, 3, 1]
+        assert data["pagination"]["total"] == 3
+
+    def test_filter_by_date_range(self, client, history):
+        """Test since is inclusive and until is exclusive"""
+        data = self.get(client, "since=2024-01-02T12:00:00&until=2024-01-04T12:00:00")
+        assert [log["quantity_added"] for log in data["restock_logs"]] == [3, 2]
+
+    def test_keyset_pagination(self, client, history):
+        """Test walking every page with limit/cursor"""
+        seen, cursor = [], None
+        while True:
+            query = "limit=2" + (f"&cursor={cursor}" if cursor else "")
+            data = self.get(client, query)
+            seen += [log["quantity_added"] for log in data["restock_logs"]]
+            assert "pagination" not in data
+            if not data["has_more"]:
+                assert data["next_cursor"] is None
+                break
+            cursor = data["next_cursor"]
+        assert seen == [5, 4, 3, 2, 1]
+
+    def test_keyset_with_product_filter(self, client, history):
+        """Test keyset pages respect the product filter"""
+        first = self.get(client, f"product_id={history['b']}&limit=1")
+        second = self.get(
+            client, f"product_id={history['b']}&limit=1&cursor={first['next_cursor']}"
+        )
+        assert [log["quantity_added"] for log in first["restock_logs"]] == [4]
+        assert [log["quantity_added"] for log in second["restock_logs"]] == [2]
+        assert second["has_more"] is False
+
+    def test_count_none_reports_has_next(self, client, history):
+        """Test count=none skips the total but still reports has_next"""
+        data = self.get(client, "per_page=2&count=none")
+        assert len(data["restock_logs"]) == 2
+        assert data["pagination"]["total"] is None
+        assert data["pagination"]["pages"] is None
+        assert data["pagination"]["has_next"] is True
+        last = self.get(client, "per_page=2&page=3&count=none")
+        assert last["pagination"]["has_next"] is False
+
+    def test_count_exact_and_estimated(self, client, history):
+        """Test exact is the default and estimated falls back on SQLite"""
+        data = self.get(client, f"per_page=2&product_id={history['a']}")
+        assert data["pagination"]["count"] == "exact"
+        assert data["pagination"]["total"] == 3
+        assert data["pagination"]["pages"] == 2
+        data = self.get(client, "per_page=2&count=estimated")
+        assert data["pagination"]["total"] == 5
+
+    def test_keyset_total_on_request(self, client, history):
+        """Test keyset pages only count when asked to"""
+        assert "total" not in self.get(client, "limit=2")
+        assert self.get(client, "limit=2&count=exact")["total"] == 5
+
+    def test_invalid_arguments(self, client):
+        """Test that malformed filters and cursors are rejected"""
+        assert client.get("/api/restocks?count=approx").status_code == 400
+        assert client.get("/api/restocks?product_id=abc").status_code == 400
+        assert client.get("/api/restocks?since=yesterday").status_code == 400
+        assert client.get("/api/restocks?limit=0").status_code == 400
+        assert client.get("/api/restocks?cursor=garbage").status_code == 400
+
+
+class TestBatchRestock:
+    """Test the batch restock endpoint"""
+
+    @pytest.fixture
+    def stocked_products(self, client):
+        """Create two products with known stock levels"""
+        with app.app_context():
+            db.session.add(Product(name="Batch A", sku="BATCH-A", stock_level=10))
+            db.session.add(Product(name="Batch B", sku="BATCH-B", stock_level=0))
+            db.session.commit()
+
+    def post_batch(self, client, items):
+        response = client.post(
+            "/api/restocks/batch",
+            data=json.dumps({"items": items}),
+            content_type="application/json",
+        )
+        return response.status_code, json.loads(response.data)
+
+    def test_batch_applies_lines_in_order(self, client, stocked_products):
+        """Test ids, SKUs and repeated products in one batch"""
+        status, data = self.post_batch(
+            client,
+            [
+                {"product_id": 1, "quantity": 5},
+                {"sku": "BATCH-B", "quantity": 3, "notes": "pallet 1"},
+                {"sku": "BATCH-A", "quantity": 2},
+            ],
+        )
+        assert status == 200
+        assert data["applied"] == 3 and data["failed"] == 0
+        assert [
+            (r["sku"], r["previous_stock"], r["new_stock"]) for r in data["results"]
+        ] == [("BATCH-A", 10, 15), ("BATCH-B", 0, 3), ("BATCH-A", 15, 17)]
+
+        product = json.loads(client.get("/api/products/1").data)["product"]
+        assert product["stock_level"] == 17
+        history = json.loads(client.get("/api/restocks").data)
+        assert history["pagination"]["total"] == 3
+
+    def test_batch_reports_bad_lines(self, client, stocked_products):
+        """Test that invalid lines are reported while valid lines apply"""
+        status, data = self.post_batch(
+            client,
+            [
+                {"sku": "BATCH-A", "quantity": 1},
+                {"sku": "NOPE-001", "quantity": 1},
+                {"product_id": 2, "quantity": 0},
+                "not an object",
+            ],
+        )
+        assert status == 200
+        assert data["success"] is False
+        assert [r["status"] for r in data["results"]] == [
+            "restocked",
+            "error",
+            "error",
+            "error",
+        ]
+        assert data["results"][1]["error"] == "Product not found"
+
+    def test_batch_rejects_boolean_product_id(self, client, stocked_products):
+        """Test that JSON true is not taken as product id 1"""
+        status, data = self.post_batch(client, [{"product_id": True, "quantity": 5}])
+        assert status == 400
+        assert data["results"][0]["error"] == "product_id or a valid sku is required"
+        product = json.loads(client.get("/api/products/1").data)["product"]
+        assert product["stock_level"] == 10
+
+    def test_batch_rejects_empty_or_all_invalid(self, client, stocked_products):
+        """Test request-level validation"""
+        assert self.post_batch(client, [])[0] == 400
+        status, data = self.post_batch(client, [{"sku": "NOPE-001", "quantity": 1}])
+        assert status == 400
+        assert data["applied"] == 0
+
+
 class TestAnalytics:
     """Test analytics endpoints"""
 
@@ -244,6 +1090,41 @@ class TestAnalytics:
         assert len(data["products"]) >= 1
         assert data["products"][0]["is_low_stock"] == True
 
+    def test_low_stock_ordered_by_severity(self, client):
+        """Test severity ordering, the limit parameter and the generated column"""
+        with app.app_context():
+            for sku, stock, threshold in [
+                ("SEV-A", 9, 10),
+                ("SEV-B", 0, 20),
+                ("SEV-C", 50, 10),
+                ("SEV-D", 2, 10),
+            ]:
+                db.session.add(
+                    Product(
+                        name=sku,
+                        sku=sku,
+                        stock_level=stock,
+                        min_stock_threshold=threshold,
+                    )
+                )
+            db.session.commit()
+            assert db.session.get(Product, 3).is_low_stock is False
+
+        data = json.loads(client.get("/api/products/low-stock").data)
+        assert [p["sku"] for p in data["products"]] == ["SEV-B", "SEV-D", "SEV-A"]
+
+        data = json.loads(client.get("/api/products/low-stock?limit=1").data)
+        assert [p["sku"] for p in data["products"]] == ["SEV-B"]
+        assert client.get("/api/products/low-stock?limit=0").status_code == 400
+
+        client.put(
+            "/api/products/3",
+            data=json.dumps({"stock_level": 1}),
+            content_type="application/json",
+        )
+        data = json.loads(client.get("/api/products/low-stock").data)
+        assert "SEV-C" in [p["sku"] for p in data["products"]]
+
     def test_get_stock_analytics(self, client, sample_product):
         """Test getting stock analytics"""
         response = client.get("/api/products/analytics")
@@ -253,6 +1134,78 @@ class TestAnalytics:
         assert "total_stock_value" in data
         assert "low_stock_count" in data
 
+    def test_stock_analytics_single_statement(self, client):
+        """Test analytics figures and that they come from one statement"""
+        from datetime import datetime, timedelta
+
+        from sqlalchemy import event
+
+        from app import RestockLog
+
+        with app.app_context():
+            for i, stock in enumerate([0, 5, 40, 40, 100, 7, 60]):
+                db.session.add(
+                    Product(
+                        name=f"Stat {i}",
+                        sku=f"STAT-{i}",
+                        stock_level=stock,
+                        min_stock_threshold=10,
+                        price=2.5,
+                    )
+                )
+            db.session.flush()
+            db.session.add_all(
+                [
+                    RestockLog(
+                        product_id=1, quantity_added=1, previous_stock=0, new_stock=1
+                    ),
+                    RestockLog(
+                        product_id=1,
+                        quantity_added=1,
+                        previous_stock=0,
+                        new_stock=1,
+                        restocked_at=datetime.utcnow() - timedelta(days=45),
+                    ),
+                ]
+            )
+            db.session.commit()
+            engine = db.engine
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if "catalog_version" not in statement:
+                statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            response = client.get("/api/products/analytics")
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+        analytics = json.loads(response.data)["analytics"]
+        assert len(statements) == 1
+        assert analytics["total_products"] == 7
+        assert analytics["low_stock_count"] == 3
+        assert analytics["out_of_stock_count"] == 1
+        assert analytics["total_stock_value"] == 630.0
+        assert analytics["recent_restocks_30_days"] == 1
+        assert analytics["low_stock_percentage"] == 42.86
+        assert [p["sku"] for p in analytics["top_stock_products"]] == [
+            "STAT-4",
+            "STAT-6",
+            "STAT-2",
+            "STAT-3",
+            "STAT-5",
+        ]
+
+    def test_stock_analytics_empty_catalog(self, client):
+        """Test analytics on an empty database"""
+        analytics = json.loads(client.get("/api/products/analytics").data)["analytics"]
+        assert analytics["total_products"] == 0
+        assert analytics["total_stock_value"] == 0
+        assert analytics["top_stock_products"] == []
+
 
 class TestMetrics:
     """Test Prometheus metrics endpoint"""
@@ -263,6 +1216,425 @@ class TestMetrics:
         assert response.status_code == 200
         assert "http_requests_total" in response.data.decode()
 
+    def test_stock_level_exported_at_scrape_time(self, client, sample_product):
+        """Test that product_stock_level comes from the scrape-time collector"""
+        from app import STOCK_LEVEL_COLLECTOR
+
+        STOCK_LEVEL_COLLECTOR.invalidate()
+        body = client.get("/metrics").data.decode()
+        assert 'product_stock_level{product_id="1",product_name="Test Product"' in body
+
+    def test_stock_level_snapshot_is_cached(self, client, sample_product):
+        """Test that scrapes within max_age reuse the cached snapshot"""
+        from app import STOCK_LEVEL_COLLECTOR
+
+        STOCK_LEVEL_COLLECTOR.invalidate()
+        first = STOCK_LEVEL_COLLECTOR.snapshot()
+        with app.app_context():
+            db.session.add(Product(name="Later", sku="LATER-001"))
+            db.session.commit()
+        assert STOCK_LEVEL_COLLECTOR.snapshot() is first
+
+    def test_product_series_removed_on_rename_and_delete(self, client, sample_product):
+        """Test per-product counters do not keep series for old names or ids"""
+        from prometheus_client import REGISTRY
+
+        from app import PRODUCT_SERIES_REGISTRY, STOCK_LEVEL_COLLECTOR
+
+        def restocks(name):
+            return PRODUCT_SERIES_REGISTRY.get_sample_value(
+                "restock_operations_total",
+                {"product_id": "1", "product_name": name},
+            )
+
+        client.post("/api/products/1/restock", json={"quantity": 5})
+        assert restocks("Test Product") == 1.0
+
+        client.put("/api/products/1", json={"name": "Renamed Product"})
+        client.post("/api/products/1/restock", json={"quantity": 5})
+        assert restocks("Test Product") is None
+        assert restocks("Renamed Product") == 1.0
+        STOCK_LEVEL_COLLECTOR.invalidate()
+        assert REGISTRY.get_sample_value(
+            "restock_operations_total",
+            {"product_id": "1", "product_name": "Renamed Product"},
+        )
+
+        assert client.delete("/api/products/1").status_code == 200
+        assert restocks("Renamed Product") is None
+
+    def test_product_metrics_modes(self, client):
+        """Test low-stock and top-N modes bound the exported products"""
+        from app import ProductStockCollector
+
+        with app.app_context():
+            for i, stock in enumerate([50, 8, 2, 0]):
+                db.session.add(
+                    Product(
+                        name=f"Mode {i}",
+                        sku=f"MODE-{i}",
+                        stock_level=stock,
+                        min_stock_threshold=10,
+                    )
+                )
+            db.session.commit()
+
+        def exported(**kwargs):
+            rows = ProductStockCollector(max_age=0, **kwargs).snapshot()
+            return [name for _, name, _, _ in rows]
+
+        assert exported() == ["Mode 0", "Mode 1", "Mode 2", "Mode 3"]
+        assert exported(mode="low-stock") == ["Mode 1", "Mode 2", "Mode 3"]
+        assert exported(mode="top", top_n=2) == ["Mode 3", "Mode 2"]
+        with pytest.raises(ValueError):
+            ProductStockCollector(max_age=0, mode="some")
+
+    def test_product_series_filtered_and_counted(self, client, sample_product):
+        """Test series outside the export set are dropped and label sets counted"""
+        from prometheus_client import REGISTRY
+
+        from app import (
+            PRODUCT_SERIES_REGISTRY,
+            RESTOCK_OPERATIONS,
+            STOCK_LEVEL_COLLECTOR,
+        )
+
+        # A series another code path left behind for a product that is gone
+        RESTOCK_OPERATIONS.labels("999", "Gone Product").inc()
+        STOCK_LEVEL_COLLECTOR.invalidate()
+
+        assert PRODUCT_SERIES_REGISTRY.get_sample_value(
+            "restock_operations_total",
+            {"product_id": "999", "product_name": "Gone Product"},
+        )
+        assert (
+            REGISTRY.get_sample_value(
+                "restock_operations_total",
+                {"product_id": "999", "product_name": "Gone Product"},
+            )
+            is None
+        )
+        assert (
+            REGISTRY.get_sample_value(
+                "product_metric_series", {"metric": "product_stock_level"}
+            )
+            == 1.0
+        )
+        RESTOCK_OPERATIONS.remove("999", "Gone Product")
+
+    def test_business_metrics_refresh(self, client):
+        """Test the refresher computes the inventory gauges and their staleness"""
+        from prometheus_client import CollectorRegistry
+
+        from app import BusinessMetricsRefresher, RestockLog
+
+        with app.app_context():
+            for i, stock in enumerate([50, 5, 0]):
+                db.session.add(
+                    Product(
+                        name=f"Biz {i}",
+                        sku=f"BIZ-{i}",
+                        stock_level=stock,
+                        min_stock_threshold=10,
+                        price=2.0,
+                    )
+                )
+            db.session.flush()
+            db.session.add(
+                RestockLog(
+                    product_id=1, quantity_added=5, previous_stock=0, new_stock=5
+                )
+            )
+            db.session.commit()
+        refresher = BusinessMetricsRefresher(interval=0)
+        registry = CollectorRegistry()
+        registry.register(refresher)
+
+        assert registry.get_sample_value("inventory_total_products") is None
+        refresher.refresh()
+
+        assert registry.get_sample_value("inventory_total_products") == 3.0
+        assert registry.get_sample_value("inventory_total_value") == 110.0
+        assert registry.get_sample_value("inventory_low_stock_products") == 1.0
+        assert registry.get_sample_value("inventory_out_of_stock_products") == 1.0
+        assert registry.get_sample_value("inventory_in_stock_products") == 1.0
+        assert registry.get_sample_value("inventory_recent_restocks") == 1.0
+        assert registry.get_sample_value("inventory_metrics_staleness_seconds") < 5
+        assert registry.get_sample_value("inventory_metrics_refresh_duration_seconds")
+        assert (
+            registry.get_sample_value("inventory_metrics_refresh_failures_total") == 0
+        )
+
+    def test_business_metrics_one_refresher_per_pod(self, client, tmp_path):
+        """Test only the lock holder refreshes and the others export its state"""
+        from app import BusinessMetricsRefresher
+
+        leader = BusinessMetricsRefresher(interval=0, state_dir=str(tmp_path))
+        follower = BusinessMetricsRefresher(interval=0, state_dir=str(tmp_path))
+
+        assert leader.acquire_leadership()
+        assert not follower.acquire_leadership()
+        assert follower.state() is None
+
+        leader.refresh()
+
+        assert follower.state()["values"]["inventory_total_products"] == 0
+
+    def test_multiprocess_scrape_merges_workers(self, tmp_path):
+        """Test /metrics sums the requests served by every worker process"""
+        script = textwrap.dedent("""
+            import multiprocessing
+
+            from app import PRODUCT_CACHE, app
+
+            def serve(requests):
+                PRODUCT_CACHE.clear()
+                with app.test_client() as client:
+                    for _ in range(requests):
+                        client.get("/api/health")
+
+            workers = [
+                multiprocessing.get_context("fork").Process(target=serve, args=(n,))
+                for n in (2, 3)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            with app.test_client() as client:
+                print(client.get("/metrics").data.decode())
+            """)
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+        body = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+        assert (
+            'http_requests_total{endpoint="health_check",method="GET",status="200"} 5.0'
+            in body
+        )
+        assert "product_cache_entries 0.0" in body
+
+
+class TestQueryInstrumentation:
+    """Test per-request SQL counting, N+1 detection and query budgets"""
+
+    def sample(self, name, labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_queries_recorded_per_endpoint(self, client, sample_product):
+        """Test that statements per request land in the histogram"""
+        labels = {"method": "GET", "endpoint": "get_all_products"}
+        count = self.sample("http_request_db_queries_count", labels)
+        total = self.sample("http_request_db_queries_sum", labels)
+
+        client.get("/api/products")
+
+        assert self.sample("http_request_db_queries_count", labels) == count + 1
+        # catalog version lookup + the page itself
+        assert self.sample("http_request_db_queries_sum", labels) == total + 2
+        assert self.sample(
+            "http_request_db_duration_seconds_count", labels
+        ) == self.sample("http_request_db_queries_count", labels)
+
+    def test_phases_recorded_per_endpoint(self, client, sample_product):
+        """Test pool, serialization and app time land in their histograms"""
+        labels = {"method": "GET", "endpoint": "get_stock_analytics"}
+        names = [
+            "http_request_db_pool_wait_seconds",
+            "http_request_serialization_seconds",
+            "http_request_app_duration_seconds",
+        ]
+        counts = [self.sample(f"{name}_count", labels) for name in names]
+        encoded = self.sample("http_request_serialization_seconds_sum", labels)
+
+        client.get("/api/products/analytics")
+
+        assert [self.sample(f"{name}_count", labels) for name in names] == [
+            count + 1 for count in counts
+        ]
+        assert self.sample("http_request_serialization_seconds_sum", labels) > encoded
+
+    def test_server_timing_header(self, client, monkeypatch):
+        """Test the Server-Timing header is sent only when enabled"""
+        import app as app_module
+
+        assert "Server-Timing" not in client.get("/api/products").headers
+
+        monkeypatch.setattr(app_module, "SERVER_TIMING", True)
+        header = client.get("/api/products").headers["Server-Timing"]
+
+        phases = [phase.split(";")[0] for phase in header.split(", ")]
+        assert phases == ["pool", "db", "serialize", "app", "total"]
+        assert 'desc="2 queries"' in header
+
+    def test_pool_checkout_charged_to_request(self, tmp_path):
+        """Test connection checkout time is added to the request's pool wait"""
+        from flask import request
+        from sqlalchemy import create_engine
+
+        from app import TimedQueuePool
+
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool
+        )
+        with app.test_request_context():
+            request.db_pool_wait = 0.0
+            with engine.connect():
+                pass
+            assert request.db_pool_wait > 0
+        engine.dispose()
+
+    def test_budget_exceeded_fails_in_testing(self, client, monkeypatch):
+        """Test that an endpoint over its declared budget raises under TESTING"""
+        monkeypatch.setattr(app.view_functions["get_all_products"], "query_budget", 1)
+
+        with pytest.raises(AssertionError, match=r"ran 2 SQL statements \(budget 1\)"):
+            client.get("/api/products")
+
+    def test_failed_statement_leaves_no_timer(self, client):
+        """Test a statement that errors does not leave state on the connection"""
+        from flask import request
+        from sqlalchemy.exc import OperationalError
+
+        with app.test_request_context():
+            request.db_time = 0.0
+            request.db_statements = {}
+            with db.engine.connect() as connection:
+                with pytest.raises(OperationalError):
+                    connection.exec_driver_sql("SELECT * FROM missing_table")
+                connection.exec_driver_sql("SELECT 1")
+
+                assert "query_start_time" not in connection.info
+            assert request.db_statements == {"SELECT 1": 1}
+            assert 0 <= request.db_time < 1
+
+    def test_repeated_statement_flagged(self, client, monkeypatch):
+        """Test that a statement repeated past the threshold is counted"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "REPEATED_STATEMENT_THRESHOLD", 1)
+        labels = {"endpoint": "get_all_products"}
+        before = self.sample("http_request_db_repeated_statements_total", labels)
+
+        client.get("/api/products")
+
+        after = self.sample("http_request_db_repeated_statements_total", labels)
+        assert after == before + 1
+
+    def test_restock_log_to_dict_loads_product_eagerly(self, client):
+        """Test RestockLog.to_dict() does not lazy-load the product per row"""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        from app import RestockLog
+
+        with app.app_context():
+            for i in range(3):
+                product = Product(name=f"Eager {i}", sku=f"EAGER-{i}")
+                db.session.add(product)
+                db.session.flush()
+                db.session.add(
+                    RestockLog(
+                        product_id=product.id,
+                        quantity_added=1,
+                        previous_stock=0,
+                        new_stock=1,
+                    )
+                )
+            db.session.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():  # fresh session, empty identity map
+            event.listen(Engine, "after_cursor_execute", record)
+            try:
+                logs = [log.to_dict() for log in RestockLog.query.all()]
+            finally:
+                event.remove(Engine, "after_cursor_execute", record)
+
+        assert len(logs) == 3
+        assert len(statements) == 1
+
+
+class TestLogging:
+    """Test access logging, sampling and the JSON log format"""
+
+    def access_records(self, caplog):
+        return [r for r in caplog.records if r.name == "app.access"]
+
+    def test_access_log_record(self, client, caplog):
+        """Test one access record per request, carrying the caller's request id"""
+        caplog.set_level(logging.INFO, logger="app.access")
+
+        response = client.get("/api/products", headers={"X-Request-ID": "abc-123"})
+
+        assert response.headers["X-Request-ID"] == "abc-123"
+        (record,) = self.access_records(caplog)
+        assert record.request_id == "abc-123"
+        assert record.endpoint == "get_all_products"
+        assert record.status == 200
+        assert record.db_queries == 2
+        assert record.latency_ms >= record.db_ms >= 0
+
+    def test_rate_limited_request_logged(self, client, caplog):
+        """Test a 429 from the limiter still gets a request id and access record"""
+
+        limiter.reset()
+        caplog.set_level(logging.INFO, logger="app.access")
+        # The default limits are checked in Flask-Limiter's before_request
+        for _ in range(50):
+            client.get("/api/health")
+
+        response = client.get("/api/health", headers={"X-Request-ID": "limited-1"})
+
+        assert response.status_code == 429
+        assert response.headers["X-Request-ID"] == "limited-1"
+        record = self.access_records(caplog)[-1]
+        assert (record.request_id, record.status) == ("limited-1", 429)
+        limiter.reset()
+
+    def test_successful_requests_sampled(self, client, caplog, monkeypatch):
+        """Test sampling drops successful lines but never errors"""
+        import app as app_module
+
+        monkeypatch.setattr(app_module, "ACCESS_LOG_SAMPLE_RATE", 0.0)
+        caplog.set_level(logging.INFO, logger="app.access")
+
+        client.get("/api/health")
+        client.get("/api/products/999")
+
+        assert [r.status for r in self.access_records(caplog)] == [404]
+
+    def test_json_formatter(self):
+        """Test records become one JSON object with their extra fields"""
+        from app import JsonFormatter
+
+        record = logging.makeLogRecord(
+            {"name": "app", "levelname": "INFO", "msg": "Restocked %s", "args": ("X",)}
+        )
+        record.status = 200
+        with app.test_request_context():
+            from flask import request
+
+            request.request_id = "req-1"
+            payload = json.loads(JsonFormatter().format(record))
+
+        assert payload["message"] == "Restocked X"
+        assert payload["status"] == 200
+        assert payload["request_id"] == "req-1"
+        assert payload["level"] == "INFO"
+
 
 class TestErrorHandling:
     """Test error handling"""
@@ -0,0 +1,201 @@
+"""
+Contract tests for the ASGI serving mode against the Flask app
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import create_engine, insert
+from starlette.testclient import TestClient
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asgi
+from app import (
+    BUSINESS_METRICS,
+    PRODUCT_CACHE,
+    app,
+    db,
+    limiter,
+    products_table,
+    restock_logs_table,
+)
+
+NOW = datetime.utcnow().replace(microsecond=0)
+PRODUCTS = [
+    {
+        "name": f"Widget {i}",
+        "sku": f"WID-{i:03d}",
+        "description": "Blue widget" if i % 2 else "Red gadget",
+        "stock_level": i * 3,
+        "min_stock_threshold": 5,
+        "price": 10.5 + i,
+        "created_at": NOW - timedelta(days=i),
+        "updated_at": NOW - timedelta(hours=i),
+    }
+    for i in range(1, 6)
+]
+RESTOCKS = [
+    {
+        "product_id": i,
+        "quantity_added": 10,
+        "previous_stock": i * 3 - 10,
+        "new_stock": i * 3,
+        "restocked_at": NOW - timedelta(days=i * 10),
+        "notes": f"Restock {i}",
+    }
+    for i in range(1, 6)
+]
+
+
+def seed(connection):
+    connection.execute(insert(products_table), PRODUCTS)
+    connection.execute(insert(restock_logs_table), RESTOCKS)
+
+
+@pytest.fixture
+def flask_client():
+    """Flask test client on its own database, seeded with the fixture data"""
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        with app.app_context():
+            db.create_all()
+            seed(db.session.connection())
+            db.session.commit()
+            PRODUCT_CACHE.clear()
+            limiter.reset()
+            yield client
+            db.drop_all()
+
+
+@pytest.fixture
+def asgi_client(flask_client, tmp_path, monkeypatch):
+    """ASGI test client whose native routes read a second, identical database"""
+    # No background refresher thread competing for the test database
+    monkeypatch.setattr(BUSINESS_METRICS, "interval", 0)
+    url = f"sqlite:///{tmp_path / 'asgi.db'}"
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        seed(connection)
+    engine.dispose()
+
+    with TestClient(asgi.create_app(url)) as client:
+        yield client
+    PRODUCT_CACHE.clear()
+
+
+class TestAsgiContract:
+    """Test the native async routes answer exactly like the Flask views"""
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            "/api/health",
+            "/api/products",
+            "/api/products?sort=price&order=desc&limit=2",
+            "/api/products?low_stock=true&count=exact",
+            "/api/products?limit=0",
+            "/api/products/3",
+            "/api/products/999",
+            "/api/products/search?q=widgets",
+            "/api/products/search?q=",
+            "/api/products/low-stock",
+            "/api/products/low-stock?limit=abc",
+            "/api/products/analytics",
+            "/api/restocks",
+            "/api/restocks?limit=2&product_id=1&count=exact",
+            "/api/restocks?since=not-a-date",
+        ],
+    )
+    def test_same_response(self, flask_client, asgi_client, path):
+        """Test status, body and ETag are identical in both modes"""
+        expected = flask_client.get(path)
+        actual = asgi_client.get(path)
+
+        assert actual.status_code == expected.status_code
+        assert actual.content == expected.data
+        assert actual.headers.get("ETag") == expected.headers.get("ETag")
+        assert actual.headers["X-Content-Type-Options"] == "nosniff"
+
+    def test_keyset_cursor_round_trip(self, asgi_client):
+        """Test a cursor issued by the async mode pages through every product"""
+        first = asgi_client.get("/api/products?limit=3").json()
+        second = asgi_client.get(
+            f"/api/products?limit=3&cursor={first['next_cursor']}"
+        ).json()
+
+        ids = [p["id"] for p in first["products"] + second["products"]]
+        assert ids == [1, 2, 3, 4, 5]
+        assert second["has_more"] is False
+
+    def test_conditional_get(self, asgi_client):
+        """Test a current ETag is answered with 304 and no body"""
+        etag = asgi_client.get("/api/products/analytics").headers["ETag"]
+
+        response = asgi_client.get(
+            "/api/products/analytics", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 304
+        assert response.content == b""
+
+    def test_other_routes_served_by_flask(self, flask_client, asgi_client):
+        """Test writes and unknown paths fall through to the Flask app"""
+        response = asgi_client.post(
+            "/api/products",
+            json={"name": "Async Product", "sku": "ASYNC-001", "price": 5.0},
+        )
+        assert response.status_code == 201
+        assert flask_client.get("/api/products/6").json["product"]["sku"] == (
+            "ASYNC-001"
+        )
+
+        missing = asgi_client.get("/api/unknown")
+        assert missing.status_code == 404
+        assert missing.json() == {"success": False, "error": "Resource not found"}
+
+    def test_rate_limits_shared_with_flask(self, asgi_client):
+        """Test native routes count against the Flask limiter's storage"""
+        asgi_client.get("/api/products")
+        asgi_client.get("/api/products")
+
+        hourly = asgi.RATE_LIMIT_ITEMS[1]
+        stats = limiter.limiter.get_window_stats(
+            hourly, "testclient", "get_all_products"
+        )
+        assert stats.remaining == hourly.amount - 2
+
+    def test_request_id_echoed(self, asgi_client):
+        """Test native routes return the caller's request id like Flask does"""
+        response = asgi_client.get("/api/health", headers={"X-Request-ID": "req-7"})
+
+        assert response.headers["X-Request-ID"] == "req-7"
+
+    def test_async_database_url(self):
+        """Test the sync driver is swapped and credentials are kept"""
+        url = asgi.async_database_url("postgresql://user:secret@db:5432/inventory")
+
+        assert url.drivername == "postgresql+asyncpg"
+        assert url.password == "secret"
+        assert asgi.async_database_url("sqlite://").drivername == "sqlite+aiosqlite"
+
+    def test_unhandled_error_is_json(self, asgi_client, monkeypatch):
+        """Test an error outside the view's own handling gets the Flask 500 body"""
+
+        def broken(connection):
+            raise RuntimeError("database unavailable")
+
+        monkeypatch.setattr(asgi, "get_catalog_version", broken)
+
+        response = asgi_client.get("/api/products")
+
+        assert response.status_code == 500
+        assert response.json() == {"success": False, "error": "Internal server error"}
+        assert response.headers["X-Frame-Options"] == "DENY"
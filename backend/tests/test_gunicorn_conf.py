@@ -0,0 +1,102 @@
+"""
+Unit tests for the cgroup-aware gunicorn configuration
+"""
+
+import importlib.util
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py"
+)
+
+
+@pytest.fixture
+def config():
+    """gunicorn.conf.py loaded as a module without leaking its environment"""
+    with mock.patch.dict(os.environ):
+        spec = importlib.util.spec_from_file_location("gunicorn_conf", CONFIG_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+class TestCgroupCpuLimit:
+    """Test reading the CPU quota from cgroup v2 and v1 files"""
+
+    def test_cgroup_v2_quota(self, config, tmp_path):
+        """Test cpu.max quota/period is converted to CPUs"""
+        (tmp_path / "cpu.max").write_text("50000 100000\n")
+
+        assert config.cgroup_cpu_limit(str(tmp_path)) == 0.5
+
+    def test_cgroup_v2_unlimited(self, config, tmp_path):
+        """Test "max" means no quota"""
+        (tmp_path / "cpu.max").write_text("max 100000\n")
+
+        assert config.cgroup_cpu_limit(str(tmp_path)) is None
+
+    def test_cgroup_v1_quota(self, config, tmp_path):
+        """Test the v1 cfs quota and period files"""
+        (tmp_path / "cpu").mkdir()
+        (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("150000\n")
+        (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+
+        assert config.cgroup_cpu_limit(str(tmp_path)) == 1.5
+
+    def test_no_cgroup(self, config, tmp_path):
+        """Test a missing cgroup filesystem means no quota"""
+        assert config.cgroup_cpu_limit(str(tmp_path)) is None
+
+
+class TestPlan:
+    """Test worker and pool sizing"""
+
+    def test_half_cpu_pod(self, config):
+        """Test the 500m deployment gets two gthread workers"""
+        assert config.worker_plan(0.5, "gthread", {}) == (2, 4)
+        assert config.worker_plan(0.5, "sync", {}) == (2, 1)
+        assert config.worker_plan(0.5, config.UVICORN_WORKER, {}) == (1, 1)
+        assert config.worker_plan(0.5, "gthread", {"GUNICORN_WORKERS": "3"}) == (3, 4)
+
+    @pytest.mark.parametrize(
+        "worker_class,workers,threads",
+        [
+            ("gthread", 2, 4),
+            ("sync", 9, 1),
+            ("uvicorn.workers.UvicornWorker", 1, 1),
+        ],
+    )
+    def test_pools_fit_budget(self, config, worker_class, workers, threads):
+        """Test every worker of every replica together stays within budget"""
+        env = {"DB_CONNECTION_BUDGET": "40", "DB_REPLICAS": "2"}
+
+        plan, reserved = config.pool_plan(workers, threads, worker_class, env)
+
+        per_worker = sum(plan.values()) + reserved
+        assert per_worker * workers * 2 <= 40
+        assert plan["DB_POOL_SIZE"] >= 1
+
+    def test_pool_matches_threads(self, config):
+        """Test a gthread worker's pool holds one connection per thread"""
+        plan, reserved = config.pool_plan(2, 4, "gthread", {})
+
+        assert plan == {"DB_POOL_SIZE": 4, "DB_MAX_OVERFLOW": 4}
+        assert reserved == 1
+
+    def test_postgres_rate_limit_storage_reserved(self, config):
+        """Test the rate-limit storage's own pool is taken out of the budget"""
+        env = {
+            "DB_CONNECTION_BUDGET": "20",
+            "RATELIMIT_STORAGE_URI": "postgresql://db/inventory",
+        }
+
+        plan, reserved = config.pool_plan(2, 8, "gthread", env)
+
+        assert reserved == 1 + config.RATELIMIT_CONNECTIONS
+        assert plan == {"DB_POOL_SIZE": 5, "DB_MAX_OVERFLOW": 0}
@@ -0,0 +1,134 @@
+"""
+Unit tests for the versioned schema migration runner
+"""
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrate
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    """A migrations directory with two SQLite-compatible migrations"""
+    directory = tmp_path / "migrations"
+    directory.mkdir()
+    (directory / "0001_widgets.sql").write_text(
+        "-- Widgets table\n"
+        "CREATE TABLE widgets (id INTEGER PRIMARY KEY, name TEXT);\n"
+        "INSERT INTO widgets (name) VALUES ('first; with a semicolon');\n"
+    )
+    (directory / "0002_widgets_name_index.sql").write_text(
+        "-- migrate: no-transaction\n"
+        "CREATE INDEX IF NOT EXISTS ix_widgets_name ON widgets (name);\n"
+    )
+    (directory / "README.md").write_text("not a migration")
+    return str(directory)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """A file-backed SQLite engine so separate connections share state"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    yield engine
+    engine.dispose()
+
+
+class TestMigrationRunner:
+    """Test cases for migrate.upgrade() and friends"""
+
+    def test_discover_orders_by_version(self, migrations_dir):
+        """Test only versioned .sql files are picked up, in order"""
+        migrations = migrate.discover_migrations(migrations_dir)
+
+        assert [m.version for m in migrations] == [1, 2]
+        assert migrations[0].transactional is True
+        assert migrations[1].transactional is False
+        assert len(migrations[0].statements()) == 2
+
+    def test_statements_skip_quoted_semicolons(self, tmp_path):
+        """Test semicolons inside dollar quotes, strings and comments"""
+        path = tmp_path / "0001_function.sql"
+        path.write_text(
+            "-- a comment ending in a semicolon;\n"
+            "CREATE FUNCTION f() RETURNS trigger AS $$\n"
+            "BEGIN\n"
+            "    RETURN NEW;\n"
+            "END;\n"
+            "$$ LANGUAGE plpgsql;\n"
+            "CREATE FUNCTION g() RETURNS text AS $body$ SELECT 'a;\n"
+            "b;'; $body$ LANGUAGE sql;\n"
+            "INSERT INTO t VALUES ('it''s;\n"
+            "two lines');\n"
+        )
+        statements = migrate.Migration(1, "function", str(path)).statements()
+
+        assert len(statements) == 3
+        assert statements[0].endswith("END;\n$$ LANGUAGE plpgsql")
+        assert statements[1].endswith("$body$ LANGUAGE sql")
+        assert statements[2].endswith("two lines')")
+
+    def test_duplicate_versions_rejected(self, migrations_dir):
+        """Test two files claiming the same version are an error"""
+        with open(os.path.join(migrations_dir, "0002_other.sql"), "w") as handle:
+            handle.write("SELECT 1;\n")
+
+        with pytest.raises(migrate.MigrationError):
+            migrate.discover_migrations(migrations_dir)
+
+    def test_upgrade_applies_pending_once(self, engine, migrations_dir):
+        """Test migrations are applied in order and recorded"""
+        applied = migrate.upgrade(engine, migrations_dir)
+
+        assert [m.version for m in applied] == [1, 2]
+        indexes = inspect(engine).get_indexes("widgets")
+        assert [index["name"] for index in indexes] == ["ix_widgets_name"]
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT name FROM widgets")).scalar() == (
+                "first; with a semicolon"
+            )
+
+        assert migrate.upgrade(engine, migrations_dir) == []
+        status = migrate.migration_status(engine, migrations_dir)
+        assert [applied for _, applied in status] == [True, True]
+
+    def test_upgrade_picks_up_new_migrations(self, engine, migrations_dir):
+        """Test a later migration runs without re-running earlier ones"""
+        migrate.upgrade(engine, migrations_dir)
+        with open(os.path.join(migrations_dir, "0003_more.sql"), "w") as handle:
+            handle.write("INSERT INTO widgets (name) VALUES ('second');\n")
+
+        applied = migrate.upgrade(engine, migrations_dir)
+
+        assert [m.version for m in applied] == [3]
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM widgets")).scalar() == 2
+
+    def test_failed_migration_rolls_back(self, engine, migrations_dir):
+        """Test a failing transactional migration leaves no partial state"""
+        migrate.upgrade(engine, migrations_dir)
+        with open(os.path.join(migrations_dir, "0003_broken.sql"), "w") as handle:
+            handle.write(
+                "INSERT INTO widgets (name) VALUES ('partial');\n"
+                "INSERT INTO no_such_table VALUES (1);\n"
+            )
+
+        with pytest.raises(Exception):
+            migrate.upgrade(engine, migrations_dir)
+
+        status = migrate.migration_status(engine, migrations_dir)
+        assert [applied for _, applied in status] == [True, True, False]
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT COUNT(*) FROM widgets")).scalar() == 1
+
+    def test_shipped_migrations_are_contiguous(self):
+        """Test the repository's migrations are numbered 1..N without gaps"""
+        migrations = migrate.discover_migrations()
+
+        assert [m.version for m in migrations] == list(range(1, len(migrations) + 1))
+        assert all(m.statements() for m in migrations)
@@ -0,0 +1,158 @@
+"""
+Unit tests for the shared rate-limit storage backends
+"""
+
+import multiprocessing
+import os
+import sys
+
+import pytest
+from limits import parse, storage, strategies
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ratelimit_storage
+
+
+def _hammer(uri, hits):
+    """Increment one key ``hits`` times from a separate process"""
+    shared = storage.storage_from_string(uri)
+    for _ in range(hits):
+        shared.incr("shared-key", 60)
+
+
+@pytest.fixture
+def uri(tmp_path):
+    """URI of a fresh, small memory-mapped counter file"""
+    return f"mmap://{tmp_path / 'ratelimit.mmap'}?slots=256"
+
+
+class TestMmapStorage:
+    """Test cases for the mmap:// Flask-Limiter storage"""
+
+    def test_scheme_registered(self, uri):
+        """Test the mmap:// scheme resolves to MmapStorage"""
+        assert isinstance(
+            storage.storage_from_string(uri), ratelimit_storage.MmapStorage
+        )
+
+    def test_incr_get_and_expiry(self, uri, monkeypatch):
+        """Test counting within a window and resetting once it expires"""
+        shared = storage.storage_from_string(uri)
+        now = [1000.0]
+        monkeypatch.setattr(ratelimit_storage.time, "time", lambda: now[0])
+
+        assert shared.incr("key", 10) == 1
+        assert shared.incr("key", 10, amount=2) == 3
+        assert shared.get("key") == 3
+        assert shared.get_expiry("key") == 1010.0
+
+        now[0] = 1010.0
+        assert shared.get("key") == 0
+        assert shared.incr("key", 10) == 1
+        assert shared.get_expiry("key") == 1020.0
+
+    def test_instances_share_counters(self, uri):
+        """Test two opens of the same file (two workers) see one counter"""
+        first = storage.storage_from_string(uri)
+        second = storage.storage_from_string(uri)
+
+        first.incr("key", 60)
+        second.incr("key", 60)
+
+        assert first.get("key") == second.get("key") == 2
+
+    def test_concurrent_processes(self, uri):
+        """Test increments from forked processes are not lost"""
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_hammer, args=(uri, 200)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert storage.storage_from_string(uri).get("shared-key") == 800
+
+    def test_clear_and_reset(self, uri):
+        """Test clearing one key and resetting the whole table"""
+        shared = storage.storage_from_string(uri)
+        shared.incr("a", 60)
+        shared.incr("b", 60)
+
+        shared.clear("a")
+        assert shared.get("a") == 0
+        assert shared.get("b") == 1
+        assert shared.reset() == 1
+        assert shared.get("b") == 0
+
+    def test_full_neighbourhood_evicts_oldest(self, tmp_path):
+        """Test a full table reuses the slot closest to expiry"""
+        shared = storage.storage_from_string(f"mmap://{tmp_path / 'tiny'}?slots=2")
+        shared.incr("a", 10)
+        shared.incr("b", 60)
+        shared.incr("c", 60)
+
+        assert shared.get("a") == 0
+        assert shared.get("b") == 1
+        assert shared.get("c") == 1
+
+    @pytest.mark.parametrize("strategy", ["fixed-window", "sliding-window-counter"])
+    def test_strategies(self, uri, strategy):
+        """Test the limiter strategies enforce a limit on this storage"""
+        limiter = strategies.STRATEGIES[strategy](storage.storage_from_string(uri))
+        item = parse("3/minute")
+
+        assert [limiter.hit(item, "client") for _ in range(4)] == [
+            True,
+            True,
+            True,
+            False,
+        ]
+        assert limiter.get_window_stats(item, "client").remaining == 0
+
+
+class TestPostgresStorage:
+    """Test cases for the postgresql:// storage that need no server"""
+
+    def test_callers_wait_for_a_free_connection(self, monkeypatch):
+        """Test more concurrent callers than connections wait instead of failing"""
+        import threading
+        import time
+        from contextlib import nullcontext
+        from unittest import mock
+
+        from psycopg2 import pool
+
+        class FakeConnectionPool(pool.ThreadedConnectionPool):
+            """psycopg2's pool with connections that hold the slot briefly"""
+
+            def _connect(self, key=None):
+                conn = mock.MagicMock()
+                conn.cursor.side_effect = lambda: (time.sleep(0.01), nullcontext())[1]
+                if key is not None:
+                    self._used[key] = conn
+                    self._rused[id(conn)] = key
+                else:
+                    self._pool.append(conn)
+                return conn
+
+        monkeypatch.setattr(pool, "ThreadedConnectionPool", FakeConnectionPool)
+        shared = ratelimit_storage.PostgresStorage(
+            "postgresql://db/inventory", max_connections=2
+        )
+        errors = []
+
+        def check():
+            try:
+                with shared._cursor():
+                    pass
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=check) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
@@ -23,11 +23,8 @@ const Dashboard = () => {
     const fetchDashboardData = async () => {
       try {
         setLoading(true);
-        const [, analyticsResponse] = await Promise.all([
-          apiService.getProducts(),
-          apiService.getAnalytics()
-        ]);
-        
+        const analyticsResponse = await apiService.getAnalytics();
+
         // The analytics data is nested under analyticsResponse.data.analytics
         setAnalytics(analyticsResponse.data.analytics);
       } catch (error) {
@@ -4,8 +4,29 @@ const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000/api
 
 const apiService = {
   // Products
-  getProducts: async () => {
-    const response = await axios.get(`${API_BASE_URL}/products`);
+  // The listing is cursor-paginated; follow next_cursor so callers get the
+  // whole catalog, with `total` set to the number of products fetched
+  getProducts: async (params = {}) => {
+    const products = [];
+    let cursor;
+    let response;
+    do {
+      response = await axios.get(`${API_BASE_URL}/products`, {
+        params: { limit: 1000, ...params, cursor },
+      });
+      products.push(...response.data.products);
+      cursor = response.data.next_cursor;
+    } while (response.data.has_more);
+    return {
+      ...response,
+      data: { ...response.data, products, total: products.length },
+    };
+  },
+
+  searchProducts: async (query, page = 1, perPage = 20) => {
+    const response = await axios.get(`${API_BASE_URL}/products/search`, {
+      params: { q: query, page, per_page: perPage },
+    });
     return response;
   },
 
@@ -59,8 +59,8 @@ def load_sample_products():
         
         # Insert products
         insert_query = """
-        INSERT INTO products (name, sku, description, price, stock_level, min_stock_threshold, category, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        INSERT INTO products (name, sku, description, price, stock_level, min_stock_threshold, created_at, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         ON CONFLICT (sku) DO NOTHING
         """
         
@@ -76,7 +76,6 @@ def load_sample_products():
                     product['price'],
                     product['stock_level'],
                     product['min_stock_threshold'],
-                    product['category'],
                     datetime.now(),
                     datetime.now()
                 ))